@@ -0,0 +1,121 @@
+"""
+Generator of synthetic DeGiro 'Account.csv' files for benchmarking. The generated stocks/ETFs use synthetic ISINs known
+by the offline fake of 'investpy' in 'tests/fake_investpy.py'.
+"""
+import argparse
+import csv
+import datetime
+import random
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from src import degiro
+from tests.fake_investpy import synthetic_isin
+
+
+def format_amount(amount: float) -> str:
+    """Formats an amount with a decimal comma, as in the DeGiro export."""
+    return f"{amount:.2f}".replace(".", ",")
+
+
+def generate_rows(first_date: datetime.date, years: float, num_isins: int, currencies: Sequence[str],
+                  trades_per_day: float, dividend_interval_days: int, seed: int = 0,
+                  max_rows: Optional[int] = None) -> List[List[str]]:
+    """Generates the rows of a synthetic account in chronological order: monthly deposits, buying and selling of
+    random stocks/ETFs with transaction costs and currency conversions, and dividends with dividend tax. If given, only
+    the first 'max_rows' rows are returned."""
+    # pylint: disable=too-many-arguments,too-many-locals
+    generator = random.Random(seed)
+    isins = [synthetic_isin(currencies[index % len(currencies)], index) for index in range(num_isins)]
+    names = {isin: f"{'ISHARES' if index % 2 == 0 else 'COMPANY'} {isin}" for index, isin in enumerate(isins)}
+    holdings = {isin: 0 for isin in isins}
+
+    rows: List[List[str]] = []
+    date = ""
+
+    def add_row(name: str, isin: str, description: str, currency: str, amount: float) -> None:
+        rows.append([date, "10:00", date, name, isin, description, "", currency, format_amount(amount), currency,
+                     "0,00", f"{len(rows):08x}-synthetic"])
+
+    for day in range(int(years * 365)):
+        date = (first_date + datetime.timedelta(days=day)).strftime("%d-%m-%Y")
+
+        if day % 30 == 0:
+            add_row("", "", "iDEAL storting", "EUR", generator.choice([250, 500, 1000]))
+
+        num_trades = int(trades_per_day) + (1 if generator.random() < trades_per_day % 1 else 0)
+        for _ in range(num_trades):
+            isin = generator.choice(isins)
+            currency = isin[2:5]
+            num_shares = generator.randint(1, 20)
+            price = generator.uniform(10, 100)
+            if holdings[isin] >= num_shares and generator.random() < 0.3:
+                holdings[isin] -= num_shares
+                add_row(names[isin], isin, f"Verkoop {num_shares} @ {format_amount(price)} {currency}", currency,
+                        num_shares * price)
+            else:
+                holdings[isin] += num_shares
+                add_row(names[isin], isin, f"Koop {num_shares} @ {format_amount(price)} {currency}", currency,
+                        -num_shares * price)
+            add_row(names[isin], isin, "DEGIRO transactiekosten", "EUR", -0.5)
+            if currency != "EUR":
+                add_row("", "", "Valuta Creditering", currency, num_shares * price)
+                add_row("", "", "Valuta Debitering", "EUR", -num_shares * price)
+
+        if dividend_interval_days > 0 and day % dividend_interval_days == dividend_interval_days - 1:
+            for isin in [isin for isin in isins if holdings[isin] > 0]:
+                dividend = 0.1 * holdings[isin]
+                add_row(names[isin], isin, "Dividend", isin[2:5], dividend)
+                add_row(names[isin], isin, "Dividendbelasting", isin[2:5], -0.15 * dividend)
+    return rows[:max_rows]
+
+
+def write_account(output_file: Path, rows: List[List[str]]) -> None:
+    """Writes the rows as a DeGiro 'Account.csv' file, ordered from new to old as in the DeGiro export."""
+    with output_file.open("w", newline="") as file:
+        file.write(degiro.CSV_HEADER + "\n")
+        csv.writer(file, lineterminator="\n").writerows(rows[::-1])
+
+
+def trades_per_day_for(num_rows: int, years: float, num_isins: int, currencies: Sequence[str],
+                       dividend_interval_days: int) -> float:
+    """Estimates the number of trades per day to get roughly 'num_rows' rows in total, besides the monthly deposits
+    and the dividends (assuming all stocks/ETFs are held). If that leaves no room for trades, the dividends are not
+    taken into account, and the rows should be trimmed to 'num_rows' instead (see 'max_rows' of 'generate_rows')."""
+    num_days = years * 365
+    non_eur_fraction = sum(1 for currency in currencies if currency != "EUR") / len(currencies)
+    rows_per_trade = 2 + 2 * non_eur_fraction
+    deposit_rows = num_days / 30
+    dividend_rows = 2 * num_isins * num_days / dividend_interval_days if dividend_interval_days > 0 else 0
+    trade_rows = num_rows - deposit_rows - dividend_rows
+    if trade_rows <= 0:
+        trade_rows = num_rows - deposit_rows
+    return max(0.0, trade_rows / num_days / rows_per_trade)
+
+
+def parse_arguments() -> Dict[str, Any]:
+    """Sets the command-line arguments."""
+    parser = argparse.ArgumentParser(description="Generates a synthetic DeGiro 'Account.csv' file",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-o", "--output_file", default="Account.csv", type=Path, help="Path for the output CSV file")
+    parser.add_argument("--years", default=10.0, type=float, help="Number of years of account history")
+    parser.add_argument("--num_isins", default=20, type=int, help="Number of different stocks/ETFs")
+    parser.add_argument("--currencies", default=["EUR", "USD"], nargs="+", help="Currencies of the stocks/ETFs")
+    parser.add_argument("--trades_per_day", default=1.0, type=float, help="Average number of trades per day")
+    parser.add_argument("--dividend_interval_days", default=90, type=int,
+                        help="Number of days between dividends, 0 for no dividends")
+    parser.add_argument("--seed", default=0, type=int, help="Seed of the random generator")
+    return vars(parser.parse_args())
+
+
+def main() -> None:
+    """Generates a synthetic account from the command-line."""
+    args = parse_arguments()
+    output_file = args.pop("output_file")
+    rows = generate_rows(datetime.date(2010, 1, 4), **args)
+    write_account(output_file, rows)
+    print(f"[DGPC] Generated {len(rows)} rows in '{output_file}'")
+
+
+if __name__ == "__main__":
+    main()
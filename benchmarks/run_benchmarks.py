@@ -0,0 +1,194 @@
+"""
+Benchmarks of the main DGPC stages on synthetic accounts of increasing size, fully offline using the fake of 'investpy'.
+The timings are written as JSON, such that regressions can be tracked between commits. The cold-start latency of the
+command-line tool is measured as well, optionally failing if it exceeds a budget. Run from the repository root:
+
+    python3 -m benchmarks.run_benchmarks --sizes 1000 10000 100000 1000000 --startup_budget 1.0
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Sequence
+
+import numpy as np
+from pandas import DataFrame, bdate_range
+
+from src import degiro
+from src import market
+from src import output
+from src import parse_cache
+from src import plot
+from src import whatif
+from src.calendar import Calendar
+from src.providers import InvestpyProvider
+from tests.fake_investpy import FakeInvestpy
+from benchmarks.generate_account import generate_rows, trades_per_day_for, write_account
+
+
+# Number of days between dividends in the synthetic accounts
+DIVIDEND_INTERVAL_DAYS = 90
+
+
+def time_stage(timings: Dict[str, float], stage: str, function: Callable[[], Any], repeats: int) -> Any:
+    """Runs the function 'repeats' times, storing the fastest time in seconds. Output to stdout is suppressed."""
+    best_seconds = float("inf")
+    result = None
+    for _ in range(repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start_time = time.perf_counter()
+            result = function()
+            best_seconds = min(best_seconds, time.perf_counter() - start_time)
+    timings[stage] = best_seconds
+    return result
+
+
+def benchmark_size(num_rows: int, years: float, num_isins: int, currencies: Sequence[str], work_dir: Path,
+                   repeats: int) -> Dict[str, Any]:
+    """Benchmarks all stages for a synthetic account of 'num_rows' rows."""
+    # pylint: disable=too-many-arguments,too-many-locals
+    first_date = datetime.date(2010, 1, 4)
+    trades_per_day = trades_per_day_for(num_rows, years, num_isins, currencies, DIVIDEND_INTERVAL_DAYS)
+    rows = generate_rows(first_date, years, num_isins, currencies, trades_per_day, DIVIDEND_INTERVAL_DAYS,
+                         max_rows=num_rows)
+    input_file = work_dir / f"Account_{num_rows}.csv"
+    write_account(input_file, rows)
+    end_date = first_date + datetime.timedelta(days=int(years * 365))
+    calendar = Calendar(first_date, end_date)
+
+    # Fresh market caches for every size, without a persistent store
+    market.set_provider(InvestpyProvider(FakeInvestpy()))
+    market.set_store(None)
+
+    timings: Dict[str, float] = {}
+    account, _ = time_stage(timings, "read_account", lambda: degiro.read_account(input_file), repeats)
+    isins, currencies_used = degiro.get_market_queries(account)
+    time_stage(timings, "prefetch", lambda: market.prefetch(isins, currencies_used, calendar), 1)
+    absolute_data, relative_data, positions = time_stage(timings, "parse_account",
+                                                         lambda: degiro.parse_account(account, calendar), repeats)
+    business_calendar = Calendar(first_date, end_date, business_days=True)
+    time_stage(timings, "prefetch_business_days",
+               lambda: market.prefetch(isins, currencies_used, business_calendar), 1)
+    time_stage(timings, "parse_account_business_days",
+               lambda: degiro.parse_account(account, business_calendar), repeats)
+
+    # Re-running on the same account: hashing the file and loading the stored parsed results instead of parsing
+    time_stage(timings, "parse_cache_key", lambda: parse_cache.cache_key(input_file, end_date, False), repeats)
+    parse_cache.save(work_dir / "parsed", f"benchmark_{num_rows}", calendar, absolute_data, relative_data, positions)
+    time_stage(timings, "parse_cache_load", lambda: parse_cache.load(work_dir / "parsed", f"benchmark_{num_rows}"),
+               repeats)
+
+    history = DataFrame({"Date": bdate_range(first_date, end_date), "Close": 1.0})
+    history["Close"] = np.linspace(50, 150, history.shape[0])
+    time_stage(timings, "densify_history", lambda: market.densify_history(history, calendar), repeats)
+
+    reference = market.densify_history(history, calendar)
+    invested = absolute_data["nominal account (without profit/loss)"]
+    time_stage(timings, "compute_reference_invested",
+               lambda: whatif.compute_reference_invested(reference, invested), repeats)
+
+    # What-if simulations of all strategies for many references at once, here scaled versions of a single history
+    references = {f"reference {index}": reference * (1 + index / 100) for index in range(50)}
+    simulation = time_stage(timings, "whatif_simulate",
+                            lambda: whatif.simulate(calendar, invested, references, bond=reference), repeats)
+    time_stage(timings, "whatif_rank",
+               lambda: whatif.rank(calendar, absolute_data["total account value"], invested, simulation), repeats)
+
+    time_stage(timings, "store_csv",
+               lambda: output.store(calendar, absolute_data, relative_data, work_dir / "dgpc.csv"), repeats)
+    time_stage(timings, "store_csv_positions",
+               lambda: output.store(calendar, absolute_data, relative_data, work_dir / "dgpc.csv", positions=positions),
+               repeats)
+    time_stage(timings, "store_npz",
+               lambda: output.store(calendar, absolute_data, relative_data, work_dir / "dgpc.npz"), repeats)
+    time_stage(timings, "plot",
+               lambda: plot.plot(calendar, absolute_data, relative_data, work_dir / "dgpc.png"), repeats)
+    time_stage(timings, "plot_positions",
+               lambda: plot.plot(calendar, absolute_data, relative_data, work_dir / "dgpc.png", positions=positions),
+               repeats)
+
+    return {"num_rows": len(account), "num_days": len(calendar), "num_isins": len(isins), "timings": timings}
+
+
+def measure_startup(repeats: int, num_modules: int = 10) -> Dict[str, Any]:
+    """Measures the cold-start latency of the command-line tool in fresh interpreters: the wall time of 'dgpc.py --help'
+    and the cumulative import time of the slowest packages imported by 'src.main', based on '-X importtime'."""
+    help_seconds = float("inf")
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        subprocess.run([sys.executable, "dgpc.py", "--help"], capture_output=True, check=True)
+        help_seconds = min(help_seconds, time.perf_counter() - start_time)
+
+    report = subprocess.run([sys.executable, "-X", "importtime", "-c", "import src.main"], capture_output=True,
+                            text=True, check=True).stderr
+    import_seconds: Dict[str, float] = {}
+    for line in report.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            package = fields[2].strip().split(".")[0]
+            import_seconds[package] = max(import_seconds.get(package, 0.0), int(fields[1]) / 1e6)
+    slowest = sorted(import_seconds.items(), key=lambda item: item[1], reverse=True)[:num_modules]
+    return {"help_seconds": help_seconds, "import_seconds": dict(slowest)}
+
+
+def git_commit() -> str:
+    """Returns the current git commit hash, or an empty string if not available."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def parse_arguments() -> Dict[str, Any]:
+    """Sets the command-line arguments."""
+    parser = argparse.ArgumentParser(description="DGPC benchmarks on synthetic accounts",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--sizes", default=[1000, 10000, 100000, 1000000], type=int, nargs="+",
+                        help="Approximate numbers of rows of the synthetic accounts")
+    parser.add_argument("--years", default=10.0, type=float, help="Number of years of account history")
+    parser.add_argument("--num_isins", default=20, type=int, help="Number of different stocks/ETFs")
+    parser.add_argument("--currencies", default=["EUR", "USD"], nargs="+", help="Currencies of the stocks/ETFs")
+    parser.add_argument("--repeats", default=1, type=int, help="Number of repeats per stage, the fastest is kept")
+    parser.add_argument("--startup_budget", default=0.0, type=float,
+                        help="Maximum seconds for 'dgpc.py --help' in a new interpreter, fails if exceeded, 0 for none")
+    parser.add_argument("-o", "--output_json", default="benchmark_results.json", type=Path,
+                        help="Path for the output JSON file with all timings")
+    return vars(parser.parse_args())
+
+
+def main() -> None:
+    """Runs all benchmarks from the command-line."""
+    args = parse_arguments()
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in args["sizes"]:
+            result = benchmark_size(size, args["years"], args["num_isins"], args["currencies"], Path(work_dir),
+                                    args["repeats"])
+            timings = ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in result["timings"].items())
+            print(f"[DGPC] {result['num_rows']:8d} rows: {timings}")
+            results.append(result)
+
+    startup = measure_startup(args["repeats"])
+    imports = ", ".join(f"{module} {seconds:.3f}s" for module, seconds in startup["import_seconds"].items())
+    print(f"[DGPC] Startup: '--help' {startup['help_seconds']:.3f}s, imports: {imports}")
+
+    summary = {"commit": git_commit(), "python": platform.python_version(), "numpy": np.__version__,
+              "date": datetime.datetime.now().isoformat(timespec="seconds"), "years": args["years"],
+              "num_isins": args["num_isins"], "currencies": args["currencies"], "startup": startup,
+              "results": results}
+    args["output_json"].write_text(json.dumps(summary, indent=2))
+    print(f"[DGPC] Stored benchmark results in '{args['output_json']}'")
+    if 0 < args["startup_budget"] < startup["help_seconds"]:
+        sys.exit(f"[DGPC] Error, startup took {startup['help_seconds']:.3f}s, exceeding the budget of "
+                 f"{args['startup_budget']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
 #!/usr/bin/env sh
 
-pylint src tests --max-line-length=120
-mypy src tests
+pylint src tests benchmarks --max-line-length=120
+mypy src tests benchmarks
@@ -0,0 +1,194 @@
+"""
+Batch mode of DGPC: processes many DeGiro 'Account.csv' files in parallel worker processes, sharing a single persistent
+store of market data. Optionally also combines all accounts into a single portfolio.
+"""
+import argparse
+import datetime
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import cache
+from . import degiro
+from . import instrumentation
+from . import main as dgpc_main
+from . import market
+from . import output
+from .calendar import Calendar
+from .instrumentation import LOGGER
+from .providers import LocalProvider
+
+
+# The absolute account data that is summed when combining multiple accounts into a single portfolio
+COMBINED_ABSOLUTES = ["nominal account (without profit/loss)", "cash in DeGiro account", "total account value"]
+
+
+class AccountResult(NamedTuple):
+    """The results of processing a single account in a worker process."""
+    name: str
+    calendar: Calendar
+    absolute_data: Dict[str, np.ndarray]
+    seconds: float
+
+
+def parse_arguments(argv: Sequence[str]) -> Any:
+    """Sets the command-line arguments of the batch mode."""
+    parser = argparse.ArgumentParser(prog="dgpc.py batch", description="DGPC: batch mode for multiple accounts",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("input", type=Path,
+                        help="Directory to search for DeGiro account CSV files, or a text file with one path per line")
+    parser.add_argument("-o", "--output_dir", default="dgpc_output", type=Path,
+                        help="Directory for the output PNG and CSV files per account")
+    parser.add_argument("-j", "--num_processes", default=4, type=int, help="Number of parallel worker processes")
+    parser.add_argument("--combined", action="store_true",
+                        help="Also outputs a PNG and CSV file of all accounts combined as a single portfolio")
+    dgpc_main.add_common_arguments(parser)
+    return vars(parser.parse_args(argv))
+
+
+def is_account_file(file: Path) -> bool:
+    """Returns whether the file starts with the header of a DeGiro 'Account.csv' file."""
+    with file.open() as csv_file:
+        header = csv_file.readline().strip()
+    return header in (degiro.CSV_HEADER, degiro.CSV_HEADER_ENGLISH)
+
+
+def find_accounts(input_path: Path, output_dir: Optional[Path] = None) -> Dict[str, Path]:
+    """Finds the account CSV files, given a directory or a manifest file with one path per line. Each account gets a
+    unique name based on its path relative to the directory (or manifest), since the files are typically all named
+    'Account.csv'. In a directory, only the CSV files with a DeGiro header outside of the output directory (which
+    holds the CSV files of earlier runs) are taken."""
+    if input_path.is_dir():
+        base_dir = input_path
+        output_dir = output_dir.resolve() if output_dir is not None else None
+        files = sorted(file for file in input_path.glob("**/*.csv")
+                       if (output_dir is None or output_dir not in file.resolve().parents) and is_account_file(file))
+    else:
+        base_dir = input_path.parent
+        lines = [line.strip() for line in input_path.read_text().splitlines()]
+        files = [base_dir / line for line in lines if line != "" and not line.startswith("#")]
+
+    accounts = {}
+    for file in files:
+        try:
+            relative_path = file.resolve().relative_to(base_dir.resolve())
+        except ValueError:  # not within the base directory
+            relative_path = file.resolve().relative_to(file.resolve().anchor)
+        accounts["_".join(relative_path.with_suffix("").parts)] = file
+    return accounts
+
+
+def prefetch_all(accounts: Dict[str, Path], end_date: datetime.date, business_days: bool, num_threads: int) -> None:
+    """Queries the market data needed by all accounts at once into the persistent store, from the earliest date of any
+    of the accounts, such that the worker processes don't query the same data multiple times."""
+    isins = set()
+    currencies = set()
+    first_dates = []
+    for input_file in accounts.values():
+        account, first_date = degiro.read_account(input_file)
+        account_isins, account_currencies = degiro.get_market_queries(account)
+        isins |= account_isins
+        currencies |= account_currencies
+        first_dates.append(first_date)
+    if not first_dates:
+        return
+
+    calendar = Calendar(min(first_dates), end_date, business_days=business_days)
+    LOGGER.info("Retrieving market data for %d stocks/ETFs and %d currencies", len(isins), len(currencies))
+    market.prefetch(isins, currencies, calendar, num_threads=num_threads)
+
+
+def init_worker(cache_dir: Path, max_age_hours: float, offline: bool, log_level: str,
+                market_data_dir: Optional[Path]) -> None:
+    """Initializes a worker process with its own connection to the shared persistent store of market data, and with
+    the local market data provider if a directory is given."""
+    instrumentation.set_up_logging(log_level)
+    if market_data_dir is not None:
+        market.set_provider(LocalProvider(market_data_dir))
+    market.set_store(cache.MarketStore(cache_dir, max_age_hours=max_age_hours, offline=offline))
+
+
+def process_account(name: str, input_file: Path, output_dir: Path, options: Dict[str, Any]) -> AccountResult:
+    """Processes a single account in a worker process, storing its PNG, CSV and metrics output."""
+    start_time = time.perf_counter()
+    calendar, absolute_data, _ = dgpc_main.dgpc(input_file, output_dir / f"{name}.png", output_dir / f"{name}.csv",
+                                             output_metrics=output_dir / f"{name}_metrics.json", **options)
+    return AccountResult(name, calendar, absolute_data, time.perf_counter() - start_time)
+
+
+def combine_accounts(results: List[AccountResult]) -> Tuple[Calendar, Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """Combines the absolute data of multiple accounts into a single portfolio. All accounts end at the same date, but
+    can start at a different date: before its start an account contributes nothing."""
+    calendar = max((result.calendar for result in results), key=len)
+    absolute_data = {name: np.zeros(shape=len(calendar)) for name in COMBINED_ABSOLUTES}
+    for result in results:
+        offset = len(calendar) - len(result.calendar)
+        for name in COMBINED_ABSOLUTES:
+            absolute_data[name][offset:] += result.absolute_data[name]
+
+    invested = absolute_data["nominal account (without profit/loss)"]
+    performance = np.divide(absolute_data["total account value"], invested, out=np.zeros_like(invested),
+                            where=invested != 0)
+    return calendar, absolute_data, {"account performance": performance}
+
+
+def batch(input_path: Path, output_dir: Path, num_processes: int, combined: bool, store: cache.MarketStore,
+          options: Dict[str, Any], log_level: str = instrumentation.DEFAULT_LOG_LEVEL,
+          market_data_dir: Optional[Path] = None) -> None:
+    """Processes all accounts found in the input path in parallel, reporting the timing per account."""
+    # pylint: disable=too-many-arguments,too-many-locals
+    accounts = find_accounts(input_path, output_dir)
+    LOGGER.info("Processing %d accounts with %d worker processes", len(accounts), num_processes)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    start_time = time.perf_counter()
+
+    market.set_store(store)
+    prefetch_all(accounts, options["end_date"], options["business_days"], options["num_threads"])
+
+    results: List[AccountResult] = []
+    failures: Dict[str, str] = {}
+    with ProcessPoolExecutor(max_workers=num_processes, initializer=init_worker,
+                             initargs=(store.path.parent, store.max_age_hours, store.offline, log_level,
+                                       market_data_dir)) as executor:
+        futures = {name: executor.submit(process_account, name, input_file, output_dir, options)
+                   for name, input_file in accounts.items()}
+        for name, future in futures.items():
+            try:
+                results.append(future.result())
+            except Exception as error:  # pylint: disable=broad-except
+                failures[name] = str(error)
+
+    if combined and results:
+        calendar, absolute_data, relative_data = combine_accounts(results)
+        reference_names = dgpc_main.add_references(calendar, absolute_data, relative_data, options["reference_isins"])
+        rolling_data = dgpc_main.compute_metrics(calendar, absolute_data, reference_names,
+                                                 output_dir / "combined_metrics.json", options["rolling_window"])
+        LOGGER.info("Storing combined portfolio of %d accounts in '%s'", len(results), output_dir)
+        if not options["no_plot"]:
+            from . import plot  # pylint: disable=import-outside-toplevel
+            plot.plot(calendar, absolute_data, relative_data, output_dir / "combined.png",
+                      plot_size_y=options["png_height_pixels"], hide_eur_values=options["plot_hide_eur_values"])
+        output.store(calendar, absolute_data, relative_data, output_dir / "combined.csv", metric_data=rolling_data)
+
+    # Reports the timing per account
+    LOGGER.info("Timing per account:")
+    for result in sorted(results, key=lambda result: result.seconds, reverse=True):
+        LOGGER.info("  %-40s %8.2fs", result.name, result.seconds)
+    for name, message in failures.items():
+        LOGGER.error("  %-40s   failed: %s", name, message)
+    LOGGER.info("Processed %d accounts in %.2fs in total", len(results), time.perf_counter() - start_time)
+
+
+def main(argv: Sequence[str]) -> None:
+    """Main entry point of the batch mode from the command-line."""
+    args = parse_arguments(argv)
+    log_level = args.pop("log_level")
+    instrumentation.set_up_logging(log_level)
+    market_data_dir = dgpc_main.set_up_provider(args)
+    dgpc_main.set_up_parse_cache(args)
+    store = dgpc_main.set_up_store(args)
+    batch(args.pop("input"), args.pop("output_dir"), args.pop("num_processes"), args.pop("combined"), store, args,
+          log_level=log_level, market_data_dir=market_data_dir)
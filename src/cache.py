@@ -0,0 +1,122 @@
+"""
+Persistent on-disk storage of market data (daily closing prices and ISIN lookups) based on SQLite. This makes sure that
+historical data only has to be downloaded once: subsequent runs only query the date ranges that are still missing.
+"""
+import datetime
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+
+# Default location of the market data store
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "dgpc"
+
+# File name of the SQLite database within the cache directory
+DATABASE_NAME = "market.sqlite"
+
+# Lookup information of a stock/ETF: symbol, name, country, and currency
+IsinInfo = Tuple[str, str, str, str]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lookups (isin TEXT, is_etf INTEGER, symbol TEXT, name TEXT, country TEXT, currency TEXT,
+                                    PRIMARY KEY (isin, is_etf));
+CREATE TABLE IF NOT EXISTS closes (key TEXT, date TEXT, close REAL, PRIMARY KEY (key, date));
+CREATE TABLE IF NOT EXISTS coverage (key TEXT PRIMARY KEY, first_date TEXT, last_date TEXT, fetched_at REAL);
+"""
+
+
+class MarketStore:
+    """Stores ISIN lookups and daily closing prices per key (a stock/ETF symbol or a currency cross). For each key the
+    covered date range is kept, such that only the missing date ranges have to be queried. The not yet final data of
+    today is considered up-to-date for 'max_age_hours' after it was retrieved. In offline mode nothing should be
+    queried."""
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR, max_age_hours: float = 12.0,
+                 offline: bool = False) -> None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = cache_dir / DATABASE_NAME
+        self.max_age_hours = max_age_hours
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.path), timeout=60, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        """Closes the connection to the database."""
+        self._connection.close()
+
+    def purge(self) -> None:
+        """Removes all stored market data."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM lookups")
+            self._connection.execute("DELETE FROM closes")
+            self._connection.execute("DELETE FROM coverage")
+        self._connection.execute("VACUUM")
+
+    def get_lookup(self, isin: str, is_etf: bool) -> Optional[IsinInfo]:
+        """Returns the stored symbol, name, country and currency of an ISIN, or None if not stored."""
+        with self._lock:
+            row = self._connection.execute("SELECT symbol, name, country, currency FROM lookups "
+                                           "WHERE isin = ? AND is_etf = ?", (isin, int(is_etf))).fetchone()
+        return None if row is None else (row[0], row[1], row[2], row[3])
+
+    def put_lookup(self, isin: str, is_etf: bool, info: IsinInfo) -> None:
+        """Stores the symbol, name, country and currency of an ISIN."""
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO lookups VALUES (?, ?, ?, ?, ?, ?)",
+                                     (isin, int(is_etf), *info))
+
+    def missing_ranges(self, key: str, first_date: datetime.date,
+                       last_date: datetime.date) -> List[Tuple[datetime.date, datetime.date]]:
+        """Returns the date ranges (inclusive) that still have to be queried to cover 'first_date' till 'last_date'."""
+        with self._lock:
+            row = self._connection.execute("SELECT first_date, last_date, fetched_at FROM coverage WHERE key = ?",
+                                           (key,)).fetchone()
+        if row is None:
+            return [(first_date, last_date)]
+        covered_first = datetime.date.fromisoformat(row[0])
+        covered_last = datetime.date.fromisoformat(row[1])
+        is_recent = (time.time() - row[2]) < self.max_age_hours * 3600
+
+        # Only the not yet final data of today (and later) is considered up-to-date for a while: older days are final
+        is_final_missing = covered_last < datetime.date.today() - datetime.timedelta(days=1)
+
+        ranges = []
+        if first_date < covered_first:
+            ranges.append((first_date, covered_first - datetime.timedelta(days=1)))
+        if last_date > covered_last and (is_final_missing or not is_recent):
+            ranges.append((covered_last + datetime.timedelta(days=1), last_date))
+        return ranges
+
+    def put_closes(self, key: str, first_date: datetime.date, last_date: datetime.date,
+                   dates: Sequence[datetime.date], closes: Sequence[float]) -> None:
+        """Stores the daily closes retrieved for the date range 'first_date' till 'last_date' (inclusive). The range
+        must be adjacent to or overlap with the already covered range. Today's (and future) closes are not final yet
+        and are thus not considered covered."""
+        covered_last = min(last_date, datetime.date.today() - datetime.timedelta(days=1))
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO closes VALUES (?, ?, ?)",
+                                         [(key, date.isoformat(), float(close)) for date, close in zip(dates, closes)])
+            row = self._connection.execute("SELECT first_date, last_date, fetched_at FROM coverage WHERE key = ?",
+                                           (key,)).fetchone()
+            fetched_at = time.time()
+            if row is not None:
+                first_date = min(first_date, datetime.date.fromisoformat(row[0]))
+                previous_last = datetime.date.fromisoformat(row[1])
+                if last_date <= previous_last:  # only older data was added, the recent data is as old as before
+                    fetched_at = row[2]
+                covered_last = max(covered_last, previous_last)
+            self._connection.execute("INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?)",
+                                     (key, first_date.isoformat(), covered_last.isoformat(), fetched_at))
+
+    def get_closes(self, key: str, first_date: datetime.date,
+                   last_date: datetime.date) -> Tuple[List[datetime.date], List[float]]:
+        """Returns the stored dates and daily closes for the given key in the given date range (inclusive)."""
+        with self._lock:
+            rows = self._connection.execute("SELECT date, close FROM closes WHERE key = ? AND date >= ? AND date <= ? "
+                                            "ORDER BY date", (key, first_date.isoformat(),
+                                                              last_date.isoformat())).fetchall()
+        return [datetime.date.fromisoformat(row[0]) for row in rows], [row[1] for row in rows]
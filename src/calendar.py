@@ -0,0 +1,92 @@
+"""
+The range of days for which all the time series of DGPC are computed. Instead of a list of dates, a calendar is stored
+as a start and end date together with a single 'datetime64' array, such that it is cheap to hash (e.g. as a cache key)
+and to convert from and to array indices. Optionally it only holds the business days (Monday till Friday), on which
+markets trade.
+"""
+import datetime
+from typing import Iterator, Optional, Sequence, Tuple, Union, overload
+
+import numpy as np
+
+
+class Calendar:
+    """An immutable range of days from 'first_date' up to (but not including) 'end_date'. Either all calendar days or
+    only the business days. Two calendars are equal if they have the same range and the same kind of days."""
+    __slots__ = ("first_date", "end_date", "business_days", "days", "_hash")
+
+    def __init__(self, first_date: datetime.date, end_date: datetime.date, business_days: bool = False) -> None:
+        self.first_date = first_date
+        self.end_date = max(end_date, first_date)
+        self.business_days = business_days
+        days = np.arange(np.datetime64(first_date, "D"), np.datetime64(self.end_date, "D"))
+        self.days = days[np.is_busday(days)] if business_days else days
+        self.days.flags.writeable = False
+        self._hash = hash((self.first_date, self.end_date, self.business_days))
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    @overload
+    def __getitem__(self, index: int) -> datetime.date: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "Calendar": ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[datetime.date, "Calendar"]:
+        """Returns a single day as a date, or a sub-range of days (without steps) as a new calendar."""
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise RuntimeError("Calendars can only be sliced without a step")
+            if start >= stop:
+                return Calendar(self.end_date, self.end_date, self.business_days)
+            end_date = self[stop] if stop < len(self) else self.end_date
+            return Calendar(self[start], end_date, self.business_days)
+        return self.days[index].astype(datetime.date)
+
+    def __iter__(self) -> Iterator[datetime.date]:
+        return iter(self.days.astype(datetime.date).tolist())
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Calendar):
+            return NotImplemented
+        return (self.first_date, self.end_date, self.business_days) == \
+            (other.first_date, other.end_date, other.business_days)
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __repr__(self) -> str:
+        kind = "business days" if self.business_days else "days"
+        return f"Calendar({len(self)} {kind} from {self.first_date} till {self.end_date})"
+
+    @property
+    def last_date(self) -> datetime.date:
+        """The last day of the calendar (or the day before the end date for an empty calendar)."""
+        if len(self) == 0:
+            return self.end_date - datetime.timedelta(days=1)
+        return self[-1]
+
+    def locate(self, days: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds for each of the given 'datetime64' days the index of the calendar day it belongs to: the same day, or
+        for days not in the calendar (e.g. weekends) the next calendar day, i.e. the first day on which it can have any
+        effect. Also returns a boolean array telling whether each day is within the range of the calendar: days after
+        the last calendar day (e.g. a weekend at the end) are not, since their next calendar day is not in range."""
+        indices = np.searchsorted(self.days, days, side="left")
+        in_range = (days >= np.datetime64(self.first_date, "D")) & (indices < len(self))
+        return np.minimum(indices, max(len(self) - 1, 0)), in_range
+
+    def find(self, date: datetime.date) -> Optional[int]:
+        """Returns the index of the first calendar day on or after the given date, or None if not within the range."""
+        if not self.first_date <= date < self.end_date:
+            return None
+        index = int(np.searchsorted(self.days, np.datetime64(date, "D")))
+        return index if index < len(self) else None
+
+
+def to_days(dates: Union[Calendar, Sequence[datetime.date]]) -> np.ndarray:
+    """Converts a calendar or any sequence of dates into a 'datetime64' array of days."""
+    if isinstance(dates, Calendar):
+        return dates.days
+    return np.asarray(dates, dtype="datetime64[D]")
@@ -0,0 +1,90 @@
+"""
+Checkpoints of the parsed account data, such that a next run only has to parse the rows that were added to the
+'Account.csv' export since the previous run. A checkpoint holds the state of the ledger after the last parsed row and
+a fingerprint of all parsed rows to detect whether the older data changed. The series are not stored, since they are
+always built from the current market data.
+"""
+import datetime
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional
+
+import numpy as np
+
+from .calendar import Calendar
+from .degiro import AccountData, Ledger
+from .instrumentation import LOGGER
+
+
+# Version of the checkpoint format, older checkpoints are ignored
+CHECKPOINT_VERSION = 4
+
+
+class Checkpoint(NamedTuple):
+    """The restored state of a previous run."""
+    ledger: Ledger
+    num_rows: int  # the number of parsed rows, i.e. the index of the first row still to parse
+
+
+def rows_digest(account: AccountData, num_rows: int) -> str:
+    """Computes a fingerprint of the first 'num_rows' rows of the account data (in chronological order)."""
+    return hashlib.sha256(account.row_hashes[:num_rows].tobytes()).hexdigest()
+
+
+def save_checkpoint(checkpoint_file: Path, account: AccountData, num_rows: int, ledger: Ledger,
+                    calendar: Calendar) -> None:
+    """Stores the state after parsing 'num_rows' rows of the account data as a compressed NPZ file."""
+    isins = list(ledger.shares.keys())
+    metadata = {"version": CHECKPOINT_VERSION, "first_date": calendar.first_date.isoformat(),
+                "end_date": calendar.end_date.isoformat(), "business_days": calendar.business_days,
+                "num_rows": num_rows, "rows_digest": rows_digest(account, num_rows),
+                "last_row_hash": int(account.row_hashes[num_rows - 1]) if num_rows > 0 else None,
+                "bank_cash": ledger.bank_cash, "isins": isins, "etfs": [ledger.etfs[isin] for isin in isins]}
+    shares = np.array([ledger.shares[isin] for isin in isins]).reshape(len(isins), ledger.num_days)
+    cash_flows = np.array([ledger.cash_flows[isin] for isin in isins]).reshape(len(isins), ledger.num_days)
+    arrays: Dict[str, Any] = {"invested": ledger.invested, "cash": ledger.cash, "fixed_value": ledger.fixed_value,
+                              "shares": shares, "cash_flows": cash_flows}
+
+    # Writes to a temporary file first, such that an interrupted run doesn't leave a corrupt checkpoint behind
+    temporary_file = checkpoint_file.with_name(checkpoint_file.name + ".tmp")
+    with temporary_file.open("wb") as file:
+        np.savez_compressed(file, metadata=np.array(json.dumps(metadata)), **arrays)
+    temporary_file.replace(checkpoint_file)
+
+
+def load_checkpoint(checkpoint_file: Path, account: AccountData, calendar: Calendar) -> Optional[Checkpoint]:
+    """Restores the state of a previous run for the given account data and calendar, extending the ledger to the days
+    of the calendar. Returns None if there is no valid checkpoint: if it doesn't exist, if the previously parsed rows
+    changed, or if the calendar doesn't start at the same date, is shorter, or has another kind of days."""
+    if not checkpoint_file.exists():
+        return None
+    with np.load(checkpoint_file) as data:
+        metadata = json.loads(str(data["metadata"]))
+        if metadata["version"] != CHECKPOINT_VERSION:
+            LOGGER.info("Checkpoint '%s' has an outdated format, parsing everything", checkpoint_file)
+            return None
+        previous_calendar = Calendar(datetime.date.fromisoformat(metadata["first_date"]),
+                                     datetime.date.fromisoformat(metadata["end_date"]), metadata["business_days"])
+        if previous_calendar.business_days != calendar.business_days or \
+                not np.array_equal(previous_calendar.days, calendar.days[:len(previous_calendar)]):
+            LOGGER.info("Checkpoint '%s' is for a different date range, parsing everything", checkpoint_file)
+            return None
+        num_rows = metadata["num_rows"]
+        if num_rows > len(account) or metadata["rows_digest"] != rows_digest(account, num_rows):
+            LOGGER.info("Account data changed compared to checkpoint '%s', parsing everything", checkpoint_file)
+            return None
+
+        ledger = Ledger(len(previous_calendar))
+        ledger.invested = data["invested"]
+        ledger.cash = data["cash"]
+        ledger.fixed_value = data["fixed_value"]
+        ledger.bank_cash = metadata["bank_cash"]
+        for isin, etf, share_deltas, cash_flows in zip(metadata["isins"], metadata["etfs"], data["shares"],
+                                                       data["cash_flows"]):
+            ledger.shares[isin] = share_deltas
+            ledger.cash_flows[isin] = cash_flows
+            ledger.etfs[isin] = etf
+
+    ledger.extend(len(calendar))
+    return Checkpoint(ledger, num_rows)
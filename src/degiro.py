@@ -1,164 +1,483 @@
 """Parsing functionality of a DeGiro 'Account.csv' file."""
 import csv
 import datetime
+import enum
+import functools
+import hashlib
+import itertools
+import re
 from pathlib import Path
-from typing import Dict, Sequence, Tuple, List
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Pattern, Set, Tuple
 
 import numpy as np
 
+from . import instrumentation
 from . import market
+from .calendar import Calendar
+from .instrumentation import LOGGER
+from .positions import Positions, compute_positions
 
 
 # Header of the Account.csv file from DeGiro export
 CSV_HEADER = "Datum,Tijd,Valutadatum,Product,ISIN,Omschrijving,FX,Mutatie,,Saldo,,Order Id"
+CSV_HEADER_ENGLISH = "Date,Time,Value date,Product,ISIN,Description,FX,Change,,Balance,,Order Id"
+
+# Version of the parsing logic, to be increased whenever a change affects the parsed results (e.g. a new kind of row or
+# a fix), such that stored results of older versions are not used anymore
+PARSER_VERSION = 1
 
 # If any of these words (case agnostic) are found in a shares name, it is considered to be an ETF
 SUBSTRINGS_IN_ETF = ["Amundi", "X-TR", "ETFS", "ISHARES", "LYXOR", "Vanguard", "WISDOMTR"]
 # ... ano others, not complete of course
 
 
-def read_account(account_csv: Path) -> Tuple[List[List[str]], datetime.date]:
+class StringTable:
+    """Interns strings: each distinct string is stored only once and is referred to by an integer id."""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self) -> None:
+        self.strings: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+    def intern(self, string: str) -> int:
+        """Returns the id of the string, adding it to the table if it is new."""
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.ids[string] = string_id
+            self.strings.append(string)
+        return string_id
+
+
+class AccountData:
+    """Columnar representation of the rows of a DeGiro 'Account.csv' file, in chronological order (the file itself is
+    ordered from new to old). Numerical data is stored as NumPy arrays, strings are stored as ids into string tables."""
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, dates: np.ndarray, mutations: np.ndarray, columns: Dict[str, np.ndarray],
+                 tables: Dict[str, List[str]]) -> None:
+        self.dates = dates  # datetime64[D]
+        self.mutations = mutations  # float64, zero if not set
+        self.descriptions = tables["description"]
+        self.description_ids = columns["description"]
+        self.names = tables["name"]
+        self.name_ids = columns["name"]
+        self.isins = tables["isin"]
+        self.isin_ids = columns["isin"]
+        self.currencies = tables["currency"]
+        self.currency_ids = columns["currency"]
+        self.row_hashes = columns["row_hash"]  # uint64 fingerprint of each full row, to detect changes in the data
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def first_date(self) -> datetime.date:
+        """Returns the date of the oldest row."""
+        return self.dates.min().astype(datetime.date)
+
+
+# Columns of the CSV file stored as interned strings, with their index in a row
+STRING_COLUMNS = {"name": 3, "isin": 4, "description": 5, "currency": 7}
+
+
+def hash_row(row: List[str]) -> int:
+    """Computes a 64-bit fingerprint of a row, stable across runs (unlike Python's built-in 'hash')."""
+    return int.from_bytes(hashlib.blake2b(",".join(row).encode(), digest_size=8).digest(), "little")
+
+
+def read_rows(rows: Iterable[List[str]], chunk_size: int = 65536, decimal_comma: bool = True) -> AccountData:
+    """Reads the rows (without header) of a DeGiro 'Account.csv' file into columnar arrays. The rows are processed in
+    chunks, converting the dates and the mutations in bulk per chunk. Mutations use a decimal comma (e.g. '1000,00') by
+    default, or otherwise a decimal point with optional thousands separators (e.g. '1,000.00', as in English-language
+    exports). Rows without a date are skipped."""
+    # pylint: disable=too-many-locals
+    tables = {column: StringTable() for column in STRING_COLUMNS}
+    date_table = StringTable()
+    date_chunks: List[np.ndarray] = []
+    mutation_chunks: List[np.ndarray] = []
+    hash_chunks: List[np.ndarray] = []
+    column_chunks: Dict[str, List[np.ndarray]] = {column: [] for column in STRING_COLUMNS}
+
+    row_iterator = iter(rows)
+    for chunk in iter(lambda: list(itertools.islice(row_iterator, chunk_size)), []):
+        chunk = [row for row in chunk if row[0] != ""]
+        date_chunks.append(np.array([date_table.intern(row[0]) for row in chunk], dtype=np.int32))
+        mutation_strings = np.array([row[8] if row[8] != "" else "0" for row in chunk], dtype=str)
+        mutation_strings = np.char.replace(mutation_strings, ",", "." if decimal_comma else "")
+        mutation_chunks.append(mutation_strings.astype(np.float64))
+        hash_chunks.append(np.array([hash_row(row) for row in chunk], dtype=np.uint64))
+        for column, column_index in STRING_COLUMNS.items():
+            table = tables[column]
+            column_chunks[column].append(np.array([table.intern(row[column_index]) for row in chunk], dtype=np.int32))
+
+    # Each distinct 'DD-MM-YYYY' date string is converted only once
+    unique_dates = np.array([f"{date[6:10]}-{date[3:5]}-{date[0:2]}" for date in date_table.strings],
+                            dtype="datetime64[D]")
+    date_ids = np.concatenate(date_chunks) if date_chunks else np.zeros(shape=0, dtype=np.int32)
+
+    def reverse(chunks: List[np.ndarray], dtype: Any) -> np.ndarray:
+        return (np.concatenate(chunks) if chunks else np.zeros(shape=0, dtype=dtype))[::-1]
+
+    columns = {column: reverse(chunks, np.int32) for column, chunks in column_chunks.items()}
+    columns["row_hash"] = reverse(hash_chunks, np.uint64)
+    return AccountData(unique_dates[date_ids][::-1], reverse(mutation_chunks, np.float64), columns,
+                       {column: table.strings for column, table in tables.items()})
+
+
+def read_csv(lines: Iterable[str], source: str = "Account.csv") -> AccountData:
+    """Reads the lines of a DeGiro 'Account.csv' file (including the header) as a stream into columnar arrays. Both
+    Dutch- and English-language exports are supported."""
+    reader = csv.reader(lines)
+    header = next(reader, [])
+    if header not in (CSV_HEADER.split(","), CSV_HEADER_ENGLISH.split(",")):
+        raise RuntimeError(f"Error while parsing '{source}' file, unexpected header\nFound: {header}"
+                           f"\nExpected: {CSV_HEADER.split(',')}\nor: {CSV_HEADER_ENGLISH.split(',')}")
+    return read_rows(reader, decimal_comma=header == CSV_HEADER.split(","))
+
+
+def read_account(account_csv: Path) -> Tuple[AccountData, datetime.date]:
     """Opens a DeGiro 'Account.csv' file and returns the contents as well as the first date"""
-    csv_data = list(csv.reader(account_csv.open()))
-    if csv_data[0] != CSV_HEADER.split(","):
-        raise RuntimeError(f"Error while parsing '{account_csv}' file, unexpected header"
-                           f"\nFound: {csv_data[0]}\nExpected: {CSV_HEADER.split(',')}")
-    first_date = datetime.datetime.strptime(csv_data[-1][0], "%d-%m-%Y").date()
-    return csv_data, first_date
-
-
-def parse_single_row(row: List[str], dates: Sequence[datetime.date], date_index: int,
-                     invested: np.ndarray, cash: np.ndarray, shares_value: np.ndarray, bank_cash: np.ndarray) -> None:
-    """Parses a single row of the CSV data, updating all the NumPy arrays (they are both input and output)."""
-    # pylint: disable=too-many-locals,too-many-arguments,too-many-statements,too-many-branches
-
-    date, _, _, name, isin, description, _, currency, mutation_string, _, _, _ = row
-    mutation = float(mutation_string.replace(",", ".")) if mutation_string != '' else 0.0
-    currency_modifier = market.to_euro_modifier(currency, dates)[date_index] if currency not in ("", "EUR") else 1
-
+    with account_csv.open() as file:
+        account = read_csv(file, source=str(account_csv))
+    return account, account.first_date()
+
+
+ETF_PATTERN = re.compile("|".join(re.escape(etf_subname) for etf_subname in SUBSTRINGS_IN_ETF), re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=None)
+def is_etf(name: str) -> bool:
+    """Returns whether the stock/ETF with the given name is considered to be an ETF."""
+    return ETF_PATTERN.search(name) is not None
+
+
+def get_market_queries(account: AccountData) -> Tuple[Set[Tuple[str, bool]], Set[str]]:
+    """Scans the account data for all the market data that parsing will need: the (ISIN, is-ETF) pairs of all the
+    bought and sold stocks/ETFs and all the non-EUR currencies."""
+    trade_description_ids = [description_id for description_id, description in enumerate(account.descriptions)
+                             if classify(description) in (TransactionKind.BUY, TransactionKind.SELL)]
+    is_trade = np.isin(account.description_ids, trade_description_ids)
+    trades = set(zip(account.isin_ids[is_trade].tolist(), account.name_ids[is_trade].tolist()))
+    isins = {(account.isins[isin_id], is_etf(account.names[name_id])) for isin_id, name_id in trades}
+    currencies = {account.currencies[currency_id] for currency_id in np.unique(account.currency_ids)}
+    return isins, currencies - {"", "EUR"}
+
+
+class Ledger:
+    """Collects all changes to a DeGiro account as dated deltas while parsing. Instead of updating all future values of
+    the arrays for every parsed row, each row only records its change on the day it happens. The resulting time series
+    are afterwards constructed with a single cumulative sum."""
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, num_days: int) -> None:
+        self.num_days = num_days
+        self.invested = np.zeros(shape=num_days)
+        self.cash = np.zeros(shape=num_days)
+
+        # Changes in the number of shares per ISIN, together with whether the ISIN is an ETF to query its prices, and
+        # the cash flows in EUR per ISIN (buying, selling, dividends) to compute the profit/loss per position
+        self.shares: Dict[str, np.ndarray] = {}
+        self.etfs: Dict[str, bool] = {}
+        self.cash_flows: Dict[str, np.ndarray] = {}
+
+        # Changes in value of shares for which no historical prices are available, the value is kept constant
+        self.fixed_value = np.zeros(shape=num_days)
+
+        # We make the assumption that any money going out of the DeGiro account is still on a bank and thus counted
+        # here as cash. This value holds the amount of money on the bank at the current date while parsing, with future
+        # cash deposits reducing this value.
+        self.bank_cash = 0.0
+
+    def add_shares(self, isin: str, etf: bool, date_index: int, num_shares: int, cash_flow: float) -> None:
+        """Records buying (positive) or selling (negative) a number of shares of the given ISIN at the given date, for
+        the given amount in EUR (negative when buying)."""
+        if isin not in self.shares:
+            self.shares[isin] = np.zeros(shape=self.num_days)
+            self.cash_flows[isin] = np.zeros(shape=self.num_days)
+            self.etfs[isin] = etf
+        self.shares[isin][date_index] += num_shares
+        self.cash_flows[isin][date_index] += cash_flow
+
+    def add_cash_flow(self, isin: str, date_index: int, cash_flow: float) -> None:
+        """Records an amount in EUR received (positive) or paid (negative) for a position, e.g. a dividend. Amounts for
+        ISINs without shares or without known prices are not recorded."""
+        if isin in self.cash_flows:
+            self.cash_flows[isin][date_index] += cash_flow
+
+    def extend(self, num_days: int) -> None:
+        """Extends the date range of the ledger to a larger number of days, e.g. to continue parsing new data."""
+        padding = num_days - self.num_days
+        self.num_days = num_days
+        self.invested = np.pad(self.invested, (0, padding))
+        self.cash = np.pad(self.cash, (0, padding))
+        self.fixed_value = np.pad(self.fixed_value, (0, padding))
+        self.shares = {isin: np.pad(share_deltas, (0, padding)) for isin, share_deltas in self.shares.items()}
+        self.cash_flows = {isin: np.pad(cash_flows, (0, padding)) for isin, cash_flows in self.cash_flows.items()}
+
+    def build_positions(self, calendar: Calendar) -> Positions:
+        """Constructs the per-position matrices (ISINs x days) for the days of the calendar from all the recorded
+        deltas of the stocks/ETFs with known prices."""
+        isins, symbols, prices = [], [], []
+        for isin in self.shares:
+            isin_prices, symbol = market.get_data_by_isin(isin, calendar, is_etf=self.etfs[isin])
+            if isin_prices is not None:
+                isins.append(isin)
+                symbols.append(symbol)
+                prices.append(isin_prices)
+        shape = (len(isins), self.num_days)
+        return compute_positions(isins, symbols, np.array([self.shares[isin] for isin in isins]).reshape(shape),
+                                 np.array([self.cash_flows[isin] for isin in isins]).reshape(shape),
+                                 np.array(prices).reshape(shape))
+
+    def build(self, calendar: Calendar) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Positions]:
+        """Constructs the invested, cash, and shares value time series for the days of the calendar from all the
+        recorded deltas, together with the per-position breakdown of the shares value."""
+        invested = np.cumsum(self.invested)
+        cash = np.cumsum(self.cash)
+        positions = self.build_positions(calendar)
+        shares_value = np.cumsum(self.fixed_value) + positions.value.sum(axis=0)
+        return invested, cash, shares_value, positions
+
+
+class TransactionKind(enum.Enum):
+    """The kinds of rows in a DeGiro account, each with their own way of changing the account."""
+    DEPOSIT = enum.auto()
+    WITHDRAWAL = enum.auto()
+    BUY = enum.auto()
+    SELL = enum.auto()
+    SPECIAL_SELL = enum.auto()  # cash settlement of shares
+    DEGIRO_COSTS = enum.auto()  # costs in EUR
+    COSTS = enum.auto()  # costs in any currency
+    DIVIDEND = enum.auto()
+    MONEY_MARKET = enum.auto()  # cash related: money market funds and interest
+    IGNORED = enum.auto()  # nothing to do, e.g. already taken into account elsewhere
+    UNSUPPORTED = enum.auto()
+
+
+class Row(NamedTuple):
+    """The data of a single row of the account data, as passed to the handlers."""
+    kind: TransactionKind
+    date: datetime.date
+    date_index: int
+    calendar: Calendar
+    name: str
+    isin: str
+    description: str
+    currency: str
+    mutation: float
+    currency_modifier: float
+
+
+# Rules to classify a row based on its description, in order of precedence: the first matching pattern decides. The
+# patterns are regular expressions matched at the start of the description. More rules can be added through
+# 'register_rule', e.g. for new kinds of descriptions.
+CLASSIFICATION_RULES: List[Tuple[str, TransactionKind]] = [
     # ----- Cash in and out -----
-
-    if description in ("iDEAL storting", "Storting"):
-        if bank_cash[date_index] > mutation:
-            bank_cash[date_index:] -= mutation
-        else:
-            invested[date_index:] += (mutation - bank_cash[date_index])
-            cash[date_index:] += (mutation - bank_cash[date_index])
-            bank_cash[date_index:] = 0
-
-    elif description in ("Terugstorting",):
-        bank_cash[date_index:] -= mutation
-
+    (r"(?:iDEAL storting|Storting)$", TransactionKind.DEPOSIT),
+    (r"Terugstorting$", TransactionKind.WITHDRAWAL),
     # ----- Buying and selling -----
-
-    elif description.split(" ")[0] in ("Koop", "Verkoop"):
-        buy_or_sell = "sell" if description.split(" ")[0] == "Verkoop" else "buy"
-        multiplier = -1 if buy_or_sell == "sell" else 1
-        num_shares = int(description.split(" ")[1].replace(".", ""))
-        is_etf = any([etf_subname.lower() in name.lower() for etf_subname in SUBSTRINGS_IN_ETF])
-        this_share_value, _ = market.get_data_by_isin(isin, dates, is_etf=is_etf)
-        if this_share_value is None:  # no historical prices available for this stock/etf
-            this_share_value = np.zeros(shape=len(dates)) + (-mutation / num_shares)
-
-        print(f"[DGPC] {date}: {buy_or_sell:4s} {num_shares:4d} @ {this_share_value[date_index]:8.2f} EUR of {name}")
-
-        shares_value[date_index:] += multiplier * num_shares * this_share_value[date_index:]
-        cash[date_index:] += mutation * currency_modifier
-
-    elif description == "Contante Verrekening Aandelen":
-        cash[date_index:] += mutation
-        print(f"[DGPC] {date}: special sell for {mutation} EUR")
-
+    (r"Koop ", TransactionKind.BUY),
+    (r"Verkoop ", TransactionKind.SELL),
+    (r"Contante Verrekening Aandelen$", TransactionKind.SPECIAL_SELL),
     # ----- DeGiro usage costs -----
-
-    elif description == "DEGIRO transactiekosten":
-        cash[date_index:] += mutation
-
-    elif "DEGIRO Aansluitingskosten" in description:
-        cash[date_index:] += mutation
-
-    elif "Externe Kosten" in description:
-        cash[date_index:] += mutation * currency_modifier
-
-    elif "Stamp Duty" in description:
-        cash[date_index:] += mutation * currency_modifier
-
+    (r"DEGIRO transactiekosten$", TransactionKind.DEGIRO_COSTS),
+    (r".*DEGIRO Aansluitingskosten", TransactionKind.DEGIRO_COSTS),
+    (r".*Externe Kosten", TransactionKind.COSTS),
+    (r".*Stamp Duty", TransactionKind.COSTS),
     # ----- Dividend -----
-
-    elif description == "Dividend":
-        cash[date_index:] += mutation * currency_modifier
-
-    elif "dividendbelasting" in description.lower():
-        cash[date_index:] += mutation * currency_modifier
-
+    (r"Dividend$", TransactionKind.DIVIDEND),
+    (r"(?i:.*dividendbelasting)", TransactionKind.DIVIDEND),
     # ----- Implications of cash on the DeGiro account -----
+    (r".*Koersverandering geldmarktfonds", TransactionKind.MONEY_MARKET),
+    (r"DEGIRO Geldmarktfondsen Compensatie$", TransactionKind.MONEY_MARKET),
+    (r"Fondsuitkering$", TransactionKind.MONEY_MARKET),
+    (r"Rente$", TransactionKind.MONEY_MARKET),
+    (r".*Conversie geldmarktfonds", TransactionKind.IGNORED),
+    # ----- Others -----
+    (r"Valuta (?:Creditering|Debitering)$", TransactionKind.IGNORED),
+    # ----- English-language exports -----
+    (r"(?:iDEAL Deposit|Deposit)$", TransactionKind.DEPOSIT),
+    (r"Withdrawal$", TransactionKind.WITHDRAWAL),
+    (r"Buy ", TransactionKind.BUY),
+    (r"Sell ", TransactionKind.SELL),
+    (r"DEGIRO Transaction (?:Fee|and/or third party fees)$", TransactionKind.DEGIRO_COSTS),
+    (r".*DEGIRO Exchange Connection Fee", TransactionKind.DEGIRO_COSTS),
+    (r"Dividend Tax$", TransactionKind.DIVIDEND),
+    (r"Interest$", TransactionKind.MONEY_MARKET),
+    (r"FX (?:Credit|Debit)$", TransactionKind.IGNORED),
+]
+
+# Handlers per kind of transaction, set through 'register_handler'
+Handler = Callable[[Row, Ledger], None]
+HANDLERS: Dict[TransactionKind, Handler] = {}
+
+
+def compile_rules() -> Pattern[str]:
+    """Combines all classification rules into a single regular expression with a named group per rule. Alternatives are
+    tried in order, so the first matching rule decides."""
+    rules = [f"(?P<rule{index}>{pattern})" for index, (pattern, _) in enumerate(CLASSIFICATION_RULES)]
+    return re.compile("|".join(rules))
+
+
+_RULES_PATTERN = compile_rules()
+
+
+def register_rule(pattern: str, kind: TransactionKind, first: bool = False) -> None:
+    """Adds a rule to classify rows with a description matching the given regular expression as the given kind. The
+    rule is added with the lowest precedence, or with the highest precedence if 'first' is set."""
+    global _RULES_PATTERN  # pylint: disable=global-statement
+    CLASSIFICATION_RULES.insert(0 if first else len(CLASSIFICATION_RULES), (pattern, kind))
+    _RULES_PATTERN = compile_rules()
+    classify.cache_clear()
+
+
+def register_handler(kind: TransactionKind) -> Callable[[Handler], Handler]:
+    """Decorator to set the function handling all rows of the given kind."""
+    def decorator(handler: Handler) -> Handler:
+        HANDLERS[kind] = handler
+        return handler
+    return decorator
+
+
+@functools.lru_cache(maxsize=None)
+def classify(description: str) -> TransactionKind:
+    """Determines the kind of transaction of a row based on its description."""
+    match = _RULES_PATTERN.match(description)
+    if match is None or match.lastgroup is None:
+        return TransactionKind.UNSUPPORTED
+    return CLASSIFICATION_RULES[int(match.lastgroup[len("rule"):])][1]
+
+
+@register_handler(TransactionKind.DEPOSIT)
+def handle_deposit(row: Row, ledger: Ledger) -> None:
+    """Cash in: money on the bank is used first, only the remainder is considered an investment."""
+    if ledger.bank_cash > row.mutation:
+        ledger.bank_cash -= row.mutation
+    else:
+        ledger.invested[row.date_index] += (row.mutation - ledger.bank_cash)
+        ledger.cash[row.date_index] += (row.mutation - ledger.bank_cash)
+        ledger.bank_cash = 0
 
-    elif "Koersverandering geldmarktfonds" in description:
-        cash[date_index:] += mutation * currency_modifier
-
-    elif description == "DEGIRO Geldmarktfondsen Compensatie":
-        cash[date_index:] += mutation * currency_modifier
-
-    elif description == "Fondsuitkering":
-        cash[date_index:] += mutation * currency_modifier
-
-    elif description == "Rente":
-        cash[date_index:] += mutation * currency_modifier
 
-    elif "Conversie geldmarktfonds" in description:
-        pass  # Nothing to do?
+@register_handler(TransactionKind.WITHDRAWAL)
+def handle_withdrawal(row: Row, ledger: Ledger) -> None:
+    """Cash out: the money is assumed to be still on the bank."""
+    ledger.bank_cash -= row.mutation
 
-    # ----- Others -----
 
-    elif description in ("Valuta Creditering", "Valuta Debitering"):
-        pass  # Nothing to do - already taken into account?
+@register_handler(TransactionKind.BUY)
+@register_handler(TransactionKind.SELL)
+def handle_buy_or_sell(row: Row, ledger: Ledger) -> None:
+    """Buying or selling shares, e.g. 'Koop 1.000 @ 13,93 USD'."""
+    buy_or_sell = "sell" if row.kind == TransactionKind.SELL else "buy"
+    multiplier = -1 if buy_or_sell == "sell" else 1
+    num_shares = int(re.sub(r"[.,]", "", row.description.split(" ")[1]))
+    this_share_value, _ = market.get_data_by_isin(row.isin, row.calendar, is_etf=is_etf(row.name))
 
+    if this_share_value is None:  # no historical prices available for this stock/etf
+        share_price = -row.mutation / num_shares
+        ledger.fixed_value[row.date_index] += multiplier * num_shares * share_price
     else:
-        print(f"[DGPC] {date}: Unsupported type of entry '{description}', contents:")
-        print(row)
-
-
-def parse_account(csv_data: List[List[str]], dates: List[datetime.date]) -> Tuple[Dict[str, np.ndarray],
-                                                                                  Dict[str, np.ndarray]]:
-    """Parses the csv-data and constructs NumPy arrays for the given date range with cash value, total account value,
-    and total invested."""
-
-    # Initial values
-    num_days = len(dates)
-    invested = np.zeros(shape=num_days)
-    cash = np.zeros(shape=num_days)
-    shares_value = np.zeros(shape=num_days)
-
-    # We make the assumption that any money going out of the DeGiro account is still on a bank and thus counted here
-    # as cash. This value holds the amount of money on the bank at a given time while parsing, with future cash
-    # deposits reducing this value.
-    bank_cash = np.zeros(shape=num_days)
-
-    # Parse the CSV data
-    date_index = 0
-    stop_parsing = False
-    for row in csv_data[1:][::-1]:
-
-        # Retrieves the data of this CSV row
-        if row[0] == "":
-            continue
-        date = datetime.datetime.strptime(row[0], "%d-%m-%Y").date()
-
-        # Advance the date till we reach the date of the CSV entry
-        while date != dates[date_index]:
-            date_index += 1
-            if date_index == num_days:
-                print(f"[DGPC] Warning, CSV date {date} larger than dates range (up to {dates[-1]}), skipping data")
-                stop_parsing = True
-                break
-
-        if stop_parsing:
-            break
-
-        parse_single_row(row, tuple(dates), date_index,
-                         invested, cash, shares_value, bank_cash)
+        share_price = this_share_value[row.date_index]
+        ledger.add_shares(row.isin, is_etf(row.name), row.date_index, multiplier * num_shares,
+                          row.mutation * row.currency_modifier)
+
+    LOGGER.debug("%s: %-4s %4d @ %8.2f EUR of %s", row.date, buy_or_sell, num_shares, share_price, row.name)
+    ledger.cash[row.date_index] += row.mutation * row.currency_modifier
+
+
+@register_handler(TransactionKind.SPECIAL_SELL)
+def handle_special_sell(row: Row, ledger: Ledger) -> None:
+    """Cash settlement of shares in EUR."""
+    ledger.cash[row.date_index] += row.mutation
+    LOGGER.debug("%s: special sell for %s EUR", row.date, row.mutation)
+
+
+@register_handler(TransactionKind.DEGIRO_COSTS)
+def handle_degiro_costs(row: Row, ledger: Ledger) -> None:
+    """DeGiro usage costs in EUR."""
+    ledger.cash[row.date_index] += row.mutation
+
+
+@register_handler(TransactionKind.COSTS)
+@register_handler(TransactionKind.MONEY_MARKET)
+def handle_cash_change(row: Row, ledger: Ledger) -> None:
+    """Any other change of cash on the DeGiro account, in any currency."""
+    ledger.cash[row.date_index] += row.mutation * row.currency_modifier
+
+
+@register_handler(TransactionKind.DIVIDEND)
+def handle_dividend(row: Row, ledger: Ledger) -> None:
+    """Dividend or dividend tax in any currency, also counted for the profit/loss of the position."""
+    ledger.cash[row.date_index] += row.mutation * row.currency_modifier
+    ledger.add_cash_flow(row.isin, row.date_index, row.mutation * row.currency_modifier)
+
+
+@register_handler(TransactionKind.IGNORED)
+def handle_ignored(row: Row, ledger: Ledger) -> None:  # pylint: disable=unused-argument
+    """Nothing to do - already taken into account?"""
+
+
+@register_handler(TransactionKind.UNSUPPORTED)
+def handle_unsupported(row: Row, ledger: Ledger) -> None:  # pylint: disable=unused-argument
+    """Reports rows that can't be parsed (yet)."""
+    LOGGER.warning("%s: Unsupported type of entry '%s', contents: %s", row.date, row.description,
+                   [row.name, row.isin, row.description, row.currency, row.mutation])
+
+
+def parse_single_row(account: AccountData, row_index: int, calendar: Calendar, date_index: int, ledger: Ledger,
+                     kind: TransactionKind) -> None:
+    """Parses a single row of the account data of the given kind, recording all changes to the account in the
+    ledger."""
+    # pylint: disable=too-many-arguments
+    currency = account.currencies[account.currency_ids[row_index]]
+    currency_modifier = 1.0
+    if currency not in ("", "EUR"):
+        to_euro = market.to_euro_modifier(currency, calendar)
+        if to_euro is None:
+            LOGGER.warning("%s: Skipping entry in %s without currency data, contents: %s", calendar[date_index],
+                           currency, account.descriptions[account.description_ids[row_index]])
+            return
+        currency_modifier = to_euro[date_index]
+    row = Row(kind, calendar[date_index], date_index, calendar, account.names[account.name_ids[row_index]],
+              account.isins[account.isin_ids[row_index]], account.descriptions[account.description_ids[row_index]],
+              currency, float(account.mutations[row_index]), currency_modifier)
+    HANDLERS[kind](row, ledger)
+
+
+def parse_rows(account: AccountData, calendar: Calendar, ledger: Ledger, first_row: int = 0) -> int:
+    """Parses the rows of the account data starting at 'first_row', recording all changes in the ledger. Only rows up
+    to the first date outside of the calendar are parsed. Rows on days that are not in the calendar (e.g. weekends for
+    a business-day calendar) count from the next calendar day, when the money or shares are actually available.
+    Returns the index after the last parsed row."""
+
+    # Finds the index into the calendar for all rows at once
+    date_indices, in_range = calendar.locate(account.dates)
+    unknown_dates = np.flatnonzero(~in_range)
+    end_row = len(account) if len(unknown_dates) == 0 else int(unknown_dates[0])
+    if end_row < len(account):
+        LOGGER.warning("Warning, CSV date %s larger than dates range (up to %s), skipping data", account.dates[end_row],
+                       calendar.last_date)
+
+    # Parse the account data, classifying each distinct description only once
+    kinds = [classify(description) for description in account.descriptions]
+    rows_per_description = np.bincount(account.description_ids[first_row:end_row], minlength=len(kinds))
+    for kind, num_rows in zip(kinds, rows_per_description):
+        if num_rows > 0:
+            instrumentation.count(f"rows: {kind.name.lower()}", int(num_rows))
+    for row_index in range(first_row, end_row):
+        kind = kinds[account.description_ids[row_index]]
+        parse_single_row(account, row_index, calendar, int(date_indices[row_index]), ledger, kind)
+    return max(first_row, end_row)
+
+
+def build_series(ledger: Ledger, calendar: Calendar) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray],
+                                                              Positions]:
+    """Constructs NumPy arrays for the days of the calendar with cash value, total account value, and total invested
+    from the changes recorded in the ledger. Also returns the per-position breakdown."""
 
     # Set the absolute value metrics
+    invested, cash, shares_value, positions = ledger.build(calendar)
     total_account = shares_value + cash
     absolutes = {"nominal account (without profit/loss)": invested,
                  "cash in DeGiro account": cash,
@@ -168,4 +487,15 @@ def parse_account(csv_data: List[List[str]], dates: List[datetime.date]) -> Tupl
     performance = np.divide(total_account, invested, out=np.zeros_like(invested), where=invested != 0)
 
     relatives = {"account performance":  performance}
-    return absolutes, relatives
+    return absolutes, relatives, positions
+
+
+def parse_account(account: AccountData, calendar: Calendar) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray],
+                                                                      Positions]:
+    """Parses the account data and constructs NumPy arrays for the days of the calendar with cash value, total account
+    value, and total invested, together with the per-position breakdown (value, profit/loss, and weight)."""
+
+    # All changes are first recorded per day, the actual time series are constructed afterwards
+    ledger = Ledger(len(calendar))
+    parse_rows(account, calendar, ledger)
+    return build_series(ledger, calendar)
@@ -0,0 +1,90 @@
+"""
+Instrumentation of DGPC: a levelled logger for all progress output, per-stage wall-clock and CPU timers, and counters
+(e.g. market data queries and parsed rows). The timers and counters are collected process-wide and thread-safe, such
+that a run can be stored as a JSON trace, optionally together with a cProfile of the whole run.
+"""
+import contextlib
+import cProfile
+import json
+import logging
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional
+
+LOGGER = logging.getLogger("dgpc")
+
+# Levels that can be chosen from the command-line, the default shows the progress of a run
+LOG_LEVELS = ["debug", "info", "warning", "error"]
+DEFAULT_LOG_LEVEL = "info"
+
+_LOCK = threading.Lock()
+_STAGES: Dict[str, Dict[str, float]] = {}
+_COUNTERS: Dict[str, float] = {}
+
+
+def set_up_logging(level: str = DEFAULT_LOG_LEVEL) -> None:
+    """Sends all log messages of at least the given level to stdout, each prefixed with '[DGPC]'."""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("[DGPC] %(message)s"))
+    LOGGER.handlers = [handler]
+    LOGGER.setLevel(level.upper())
+    LOGGER.propagate = False
+
+
+def reset() -> None:
+    """Removes all collected timings and counters."""
+    with _LOCK:
+        _STAGES.clear()
+        _COUNTERS.clear()
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Times the code within the context as the stage with the given name. Multiple calls of the same stage are
+    summed. The CPU time is that of the whole process, i.e. including other threads working for the stage."""
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield
+    finally:
+        wall_seconds = time.perf_counter() - start_wall
+        cpu_seconds = time.process_time() - start_cpu
+        with _LOCK:
+            timing = _STAGES.setdefault(name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+            timing["calls"] += 1
+            timing["wall_seconds"] += wall_seconds
+            timing["cpu_seconds"] += cpu_seconds
+        LOGGER.debug("Stage '%s' took %.3fs (%.3fs CPU)", name, wall_seconds, cpu_seconds)
+
+
+def count(name: str, amount: float = 1) -> None:
+    """Adds the amount to the counter with the given name."""
+    with _LOCK:
+        _COUNTERS[name] = _COUNTERS.get(name, 0) + amount
+
+
+def trace() -> Dict[str, Any]:
+    """Returns a copy of all timings per stage (in order of first use) and all counters (sorted by name)."""
+    with _LOCK:
+        return {"stages": {name: dict(timing) for name, timing in _STAGES.items()},
+                "counters": dict(sorted(_COUNTERS.items()))}
+
+
+def store_trace(output_file: Path, extra: Optional[Dict[str, Any]] = None) -> None:
+    """Stores the timings and counters as a JSON file, together with any extra data."""
+    output_file.write_text(json.dumps({**trace(), **(extra or {})}, indent=2))
+
+
+def run_profiled(function: Callable[..., Any], cprofile_file: Optional[Path], **kwargs: Any) -> Any:
+    """Runs the function with the given arguments, if a file is given under cProfile with the statistics stored in that
+    file (e.g. for 'python -m pstats' or 'snakeviz')."""
+    if cprofile_file is None:
+        return function(**kwargs)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, **kwargs)
+    finally:
+        profiler.dump_stats(cprofile_file)
+        LOGGER.info("Stored cProfile statistics as '%s'", cprofile_file)
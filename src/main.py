@@ -1,14 +1,26 @@
-"""Main DGPC (DeGiro Performance Charts) entry point with argument parser and main function."""
+"""Main DGPC (DeGiro Performance Charts) entry point with argument parser and main function. The heavy packages
+(Matplotlib, investpy, pandas) are only imported when they are needed, such that e.g. '--help' starts quickly."""
 import argparse
 import datetime
+import sys
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 
+from . import cache
+from . import checkpoint
 from . import degiro
+from . import instrumentation
 from . import market
-from . import plot
+from . import metrics
+from . import output
+from . import parse_cache
+from . import whatif
+from .calendar import Calendar
+from .instrumentation import LOGGER
+from .positions import Positions
+from .providers import LocalProvider
 
 
 def parse_date(date_string: str) -> datetime.date:
@@ -19,106 +31,382 @@ def parse_date(date_string: str) -> datetime.date:
         raise argparse.ArgumentTypeError(f"Not a valid date: '{date_string}'")
 
 
-def parse_arguments() -> Any:
-    """Sets the command-line arguments."""
-    parser = argparse.ArgumentParser(description="DGPC: DeGiro Performance Chart tool",
-                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument("-i", "--input_file", required=True, help="Location of DeGiro account CSV file", type=Path)
-    parser.add_argument("-p", "--output_png", default="dgpc.png", help="Path for output PNG image", type=Path)
-    parser.add_argument("-c", "--output_csv", default="dgpc.csv", help="Path for output CSV file", type=Path)
+def add_common_arguments(parser: argparse.ArgumentParser) -> None:
+    """Sets the command-line arguments shared between the single account and the batch mode."""
     parser.add_argument("-e", "--end_date", help="End date for plotting, as DD-MM-YYYY", type=parse_date,
                         default=datetime.datetime.now().date())
     parser.add_argument("-s", "--start_date", help="Start date for plotting, as DD-MM-YYYY", type=parse_date,
                         default=datetime.date(2000, 1, 1))
-    parser.add_argument("-r", "--reference_isin", default="IE00B4L5Y983", type=str,
-                        help="ISIN to plot as reference, by default this is set to IWDA")
+    parser.add_argument("-r", "--reference_isin", default=["IE00B4L5Y983"], type=str, nargs="+",
+                        dest="reference_isins", help="ISIN(s) to plot as reference, by default this is set to IWDA")
     parser.add_argument("-y", "--png_height_pixels", default=1080, type=int,
                         help="Height of image in pixels, width is determined with the standard 16:9 aspect ratio")
     parser.add_argument("--plot_hide_eur_values", action="store_true",
                         help="Hides absolute EUR values in the plot, e.g. for privacy reasons")
-    return vars(parser.parse_args())
-
-
-def compute_reference_invested(reference: np.ndarray, invested: np.ndarray) -> np.ndarray:
-    """Given some amount of cash investment over time, compute the reference stock/ETF's value given that all the
-    invested cash was used to buy the reference stock/ETF at the time when it was available. Assumes partial shares
-    exist."""
-    result = np.zeros(shape=reference.shape)
-    num_shares = invested[0] / reference[0]
-    result += num_shares * reference
-    for date_index, investment in enumerate(np.diff(invested)):
-        if investment != 0:
-            num_shares = investment / reference[date_index + 1]
-            result[date_index + 1:] += num_shares * reference[date_index + 1:]
-    return result
-
-
-def store_csv(dates: List[datetime.date], absolute_data: Dict[str, np.ndarray],
-              relative_data: Dict[str, np.ndarray], output_file: Path) -> None:
-    """Stores all the collected data as a simple CSV file."""
-    absolutes = list(absolute_data.keys())
-    relatives = list(relative_data.keys())
-    with output_file.open("w") as file:
-        file.write(",".join(["date", *absolutes, *relatives]).replace(" ", "_") + "\n")
-        for date_index, date in enumerate(dates):
-            absolute_vals = [str(round(absolute_data[name][date_index], 2)) for name in absolutes]
-            relative_vals = [str(round(absolute_data[name][date_index], 2)) for name in absolutes]
-            file.write(",".join([str(date), *absolute_vals, *relative_vals]).replace(" ", "_") + "\n")
+    parser.add_argument("--no_plot", action="store_true",
+                        help="Skips creating the PNG image, e.g. for a faster run with only the data output")
+    parser.add_argument("--plot_positions", action="store_true",
+                        help="Adds a sub-plot with the value per stock/ETF in the account stacked on top of each other")
+    parser.add_argument("--rolling_window", default=0, type=int,
+                        help="Adds the return and volatility over a rolling window of this many days and the drawdown "
+                             "to the output data file, 0 for none")
+    parser.add_argument("--business_days", action="store_true",
+                        help="Only computes values for business days (Monday till Friday) instead of all days")
+    parser.add_argument("--num_threads", default=8, type=int,
+                        help="Maximum number of concurrent market data queries")
+    parser.add_argument("--cache_dir", default=cache.DEFAULT_CACHE_DIR, type=Path,
+                        help="Directory to store downloaded market data in for future runs")
+    parser.add_argument("--cache_max_age", default=12.0, type=float,
+                        help="Number of hours after which the most recent stored market data is queried again")
+    parser.add_argument("--market_data_dir", type=Path,
+                        help="Directory with local price files (and an 'isins.csv') to use instead of Investing.com")
+    parser.add_argument("--offline", action="store_true",
+                        help="Does not query any market data, only uses the data stored in the cache directory")
+    parser.add_argument("--purge_cache", action="store_true",
+                        help="Removes all stored market data and parsed accounts from the cache directory before "
+                             "running")
+    parser.add_argument("--no_parse_cache", action="store_true",
+                        help="Always parses the account CSV file, instead of reusing the stored results of a previous "
+                             "run on the same file and end date")
+    parser.add_argument("--log_level", default=instrumentation.DEFAULT_LOG_LEVEL, choices=instrumentation.LOG_LEVELS,
+                        help="Minimum level of the messages to show, 'debug' also shows every transaction")
 
 
-def dgpc(input_file: Path, output_png: Path, output_csv: Path, end_date: datetime.date, start_date: datetime.date,
-         reference_isin: str, png_height_pixels: int, plot_hide_eur_values: bool) -> None:
-    """Main entry point of DGPC after parsing the command-line arguments. This function is the main script, calling all
-    other functions. The input file needs to point to an 'Account.csv' file from DeGiro, whereas the output file paths
-    are the locations of the resulting chart as PNG file and full data CSV. Furthermore, the reference ISIN can be set.
-    """
-    # pylint: disable=too-many-arguments,too-many-locals
+def parse_arguments() -> Any:
+    """Sets the command-line arguments."""
+    parser = argparse.ArgumentParser(description="DGPC: DeGiro Performance Chart tool",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-i", "--input_file", help="Location of DeGiro account CSV file", type=Path)
+    parser.add_argument("-p", "--output_png", default="dgpc.png", help="Path for output PNG image", type=Path)
+    parser.add_argument("-c", "--output_csv", default="dgpc.csv", type=Path,
+                        help="Path for output data file: CSV (.csv or .csv.gz), Parquet, Arrow/Feather or NPZ")
+    parser.add_argument("-m", "--output_metrics", default="dgpc_metrics.json", type=Path,
+                        help="Path for output JSON file with the return and risk metrics")
+    parser.add_argument("--checkpoint", type=Path, dest="checkpoint_file",
+                        help="Path for a checkpoint file: a next run only parses the rows added since this run")
+    parser.add_argument("--profile", type=Path, dest="profile_file",
+                        help="Path for a JSON trace with the time per stage and counters such as market data queries")
+    parser.add_argument("--cprofile", action="store_true",
+                        help="Also runs with cProfile, storing its statistics next to the --profile trace (.prof)")
+    parser.add_argument("--whatif_isin", default=[], type=str, nargs="+", dest="whatif_isins",
+                        help="ISIN(s) of ETFs to simulate investing the account's money in with several strategies, "
+                             "ranked together with the account")
+    parser.add_argument("--whatif_bond_isin", default=whatif.DEFAULT_BOND_ISIN, type=str,
+                        help="ISIN of the bond ETF for the 60/40 rebalanced what-if strategy")
+    parser.add_argument("--whatif_output", default="dgpc_whatif.csv", type=Path,
+                        help="Path for the output CSV file with the ranking of the what-if simulations")
+    parser.add_argument("--whatif_top_k", default=0, type=int,
+                        help="Plots the account and the top-k what-if simulations next to the ranking (.png), 0 for "
+                             "none")
+    add_common_arguments(parser)
+    args = parser.parse_args()
+    if args.input_file is None and not args.purge_cache:
+        parser.error("the following arguments are required: -i/--input_file")
+    if args.cprofile and args.profile_file is None:
+        parser.error("--cprofile requires a --profile trace file")
+    try:
+        output.get_writer(args.output_csv)
+    except RuntimeError as error:
+        parser.error(str(error))
+    return vars(args)
+
+
+def compute_account(input_file: Path, end_date: datetime.date, start_date: datetime.date, num_threads: int = 8,
+                    checkpoint_file: Optional[Path] = None, business_days: bool = False,
+                    parse_cache_dir: Optional[Path] = None) -> Tuple[Calendar, Dict[str, np.ndarray],
+                                                                     Dict[str, np.ndarray], Positions]:
+    """Reads and parses a DeGiro 'Account.csv' file, returning the calendar together with the absolute and relative
+    data and the per-position breakdown of the account from the 'start_date' (if within the data range) till the
+    'end_date'. If a checkpoint file is given, only the rows added since the checkpoint of the previous run are
+    parsed. If a parse cache directory is given, the parsed account is loaded from there if the same file was parsed
+    before for the same end date and market data, and stored there otherwise if all market data was retrieved and the
+    end date is in the past (the prices of today are not final yet)."""
+    # pylint: disable=too-many-arguments
+    parsed = None
+    key = ""
+    if parse_cache_dir is not None:
+        key = parse_cache.cache_key(input_file, end_date, business_days, market.identity())
+        with instrumentation.stage("load parsed account"):
+            parsed = parse_cache.load(parse_cache_dir, key)
+        instrumentation.count("parse cache hits" if parsed is not None else "parse cache misses")
+        if parsed is not None:
+            LOGGER.info("Using the stored parsed DeGiro data of '%s'", input_file)
+    if parsed is None:
+        parsed = parse_account_file(input_file, end_date, num_threads, checkpoint_file, business_days)
+        if parse_cache_dir is not None and not market.is_complete(parsed[0]):
+            LOGGER.info("Not storing the parsed DeGiro data, since not all market data was retrieved")
+        elif parse_cache_dir is not None and end_date < datetime.date.today():
+            with instrumentation.stage("store parsed account"):
+                parse_cache.save(parse_cache_dir, key, *parsed)
+    calendar, absolute_data, relative_data, positions = parsed
+
+    # Filter out all values before the chosen 'start_date' (default: today)
+    first_index = calendar.find(start_date)
+    if first_index is not None:
+        LOGGER.info("Filtering out all data from before %s", start_date)
+        return slice_account(calendar, absolute_data, relative_data, positions, first_index, len(calendar))
+    return calendar, absolute_data, relative_data, positions
+
+
+def parse_account_file(input_file: Path, end_date: datetime.date, num_threads: int = 8,
+                       checkpoint_file: Optional[Path] = None,
+                       business_days: bool = False) -> Tuple[Calendar, Dict[str, np.ndarray], Dict[str, np.ndarray],
+                                                             Positions]:
+    """Reads and parses a DeGiro 'Account.csv' file over its full date range till the 'end_date', continuing from the
+    checkpoint of a previous run if given."""
+    # pylint: disable=too-many-locals
 
     # Preliminaries: read the CSV file and set the date range structure
-    print(f"[DGPC] Reading DeGiro data from '{input_file}'")
-    csv_data, first_date = degiro.read_account(input_file)
+    LOGGER.info("Reading DeGiro data from '%s'", input_file)
+    with instrumentation.stage("read account"):
+        account, first_date = degiro.read_account(input_file)
+    instrumentation.count("rows read", len(account))
+
+    calendar = Calendar(first_date, end_date, business_days=business_days)
+    num_days = len(calendar)
 
-    num_days = (end_date - first_date).days
-    dates = [first_date + datetime.timedelta(days=days) for days in range(0, num_days)]
+    # Restores the state of the previous run if possible
+    state = None
+    if checkpoint_file is not None:
+        with instrumentation.stage("load checkpoint"):
+            state = checkpoint.load_checkpoint(checkpoint_file, account, calendar)
+    ledger = state.ledger if state is not None else degiro.Ledger(num_days)
+    first_row = state.num_rows if state is not None else 0
+
+    # Query all the required market data concurrently up-front, also without new rows: the series are always built
+    # from the current market data
+    isins, currencies = degiro.get_market_queries(account)
+    LOGGER.info("Retrieving market data for %d stocks/ETFs and %d currencies", len(isins), len(currencies))
+    with instrumentation.stage("prefetch market data"):
+        market.prefetch(isins, currencies, calendar, num_threads=num_threads)
 
     # Parse the DeGiro account data
-    print(f"[DGPC] Parsing DeGiro data with {len(csv_data)} rows from {dates[0]} till {dates[-1]}")
-    absolute_data, relative_data = degiro.parse_account(csv_data, dates)
+    LOGGER.info("Parsing DeGiro data with %d rows from %s till %s", len(account) - first_row,
+                calendar.first_date, calendar.last_date)
+    with instrumentation.stage("parse account"):
+        end_row = degiro.parse_rows(account, calendar, ledger, first_row=first_row)
+    with instrumentation.stage("build series"):
+        absolute_data, relative_data, positions = degiro.build_series(ledger, calendar)
+    if checkpoint_file is not None:
+        LOGGER.info("Storing checkpoint '%s'", checkpoint_file)
+        with instrumentation.stage("save checkpoint"):
+            checkpoint.save_checkpoint(checkpoint_file, account, end_row, ledger, calendar)
+    return calendar, absolute_data, relative_data, positions
 
-    # Filter out all values before the chosen 'start_date' (default: today)
-    if start_date in dates:
-        print(f"[DGPC] Filtering out all data from before {start_date}")
-        first_index = dates.index(start_date)
-        dates = dates[first_index:]
-        for name, values in absolute_data.items():
-            absolute_data[name] = values[first_index:]
-        # Relative data is recalculated to start at 0% performance at the given start date
+
+def slice_account(calendar: Calendar, absolute_data: Dict[str, np.ndarray], relative_data: Dict[str, np.ndarray],
+                  positions: Positions, first_index: int,
+                  end_index: int) -> Tuple[Calendar, Dict[str, np.ndarray], Dict[str, np.ndarray], Positions]:
+    """Returns the account data for the days from 'first_index' up to (but not including) 'end_index' of the calendar,
+    without modifying the given data. The relative data is recalculated to start at 0% performance at the first day,
+    and the profit/loss per position to start at zero."""
+    # pylint: disable=too-many-arguments
+    absolute_data = {name: values[first_index:end_index] for name, values in absolute_data.items()}
+    relative_data = {name: values[first_index:end_index] for name, values in relative_data.items()}
+    invested = absolute_data["nominal account (without profit/loss)"]
+    invested_restart = invested + absolute_data["total account value"][0] - invested[0]
+    relative_data["account performance"] = absolute_data["total account value"] / invested_restart
+    return (calendar[first_index:end_index], absolute_data, relative_data,
+            positions.sliced(first_index, end_index))
+
+
+def add_references(calendar: Calendar, absolute_data: Dict[str, np.ndarray],
+                   relative_data: Dict[str, np.ndarray], reference_isins: List[str]) -> List[str]:
+    """Adds the data of the reference stocks/ETFs to compare the account with to the absolute and relative data.
+    Returns the names of the references for which data was found."""
+    reference_names, references = get_references(calendar, reference_isins)
+    add_reference_data(absolute_data, relative_data, reference_names, references)
+    return reference_names
+
+
+def get_references(calendar: Calendar, reference_isins: List[str]) -> Tuple[List[str], List[np.ndarray]]:
+    """Retrieves the prices of the reference stocks/ETFs for the days of the calendar. Returns the names and prices of
+    the references for which data was found."""
+    references = []
+    reference_names = []
+    for reference_isin in reference_isins:
+        LOGGER.info("Retrieving reference data for %s", reference_isin)
+        reference, reference_name = market.get_data_by_isin(reference_isin, calendar, is_etf=True)
+        if reference is None:
+            LOGGER.warning("Could not find data for reference %s: %s, skipping", reference_isin, reference_name)
+        else:
+            references.append(reference)
+            reference_names.append(reference_name)
+    return reference_names, references
+
+
+def add_reference_data(absolute_data: Dict[str, np.ndarray], relative_data: Dict[str, np.ndarray],
+                       reference_names: List[str], references: List[np.ndarray]) -> None:
+    """Adds the data of the references with the given names and prices (for the same days as the account data) to the
+    absolute and relative data: the value when investing the same amounts as in the account, and the performance."""
+    if references:
         invested = absolute_data["nominal account (without profit/loss)"]
-        invested_restart = invested + absolute_data["total account value"][0] - invested[0]
-        relative_data["account performance"] = absolute_data["total account value"] / invested_restart
+        references_invested = whatif.compute_reference_invested(np.array(references), invested)
+        for reference, reference_invested, reference_name in zip(references, references_invested, reference_names):
+            absolute_data[f"{reference_name}: given investment"] = reference_invested
+            relative_data[f"{reference_name}: all-in day one"] = reference / reference[0]
+            relative_data[f"{reference_name}: given investment"] = reference_invested / invested
+
+
+def metric_series(absolute_data: Dict[str, np.ndarray],
+                  reference_names: List[str]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Returns the invested amount over time, and the values to compute the metrics of: the account and the references
+    with the same investments."""
+    series = {"account": absolute_data["total account value"]}
+    series.update({name: absolute_data[f"{name}: given investment"] for name in reference_names})
+    return absolute_data["nominal account (without profit/loss)"], series
+
+
+def compute_metrics(calendar: Calendar, absolute_data: Dict[str, np.ndarray], reference_names: List[str],
+                    output_metrics: Optional[Path], rolling_window: int) -> Dict[str, np.ndarray]:
+    """Computes, logs and stores (if an output file is given) the return and risk metrics of the account and of the
+    references with the same investments. Returns the rolling-window series if a window is set."""
+    invested, series = metric_series(absolute_data, reference_names)
+    account_metrics = metrics.compute_metrics(calendar, invested, series)
+    metrics.log_metrics(account_metrics)
+    if output_metrics is not None:
+        LOGGER.info("Storing metrics as JSON '%s'", output_metrics)
+        metrics.store_metrics(account_metrics, output_metrics)
+    if rolling_window <= 0:
+        return {}
+    return metrics.rolling_series(calendar, invested, series, rolling_window)
+
+
+def compare_whatif(calendar: Calendar, absolute_data: Dict[str, np.ndarray], whatif_isins: List[str],
+                   whatif_bond_isin: str, whatif_output: Path, whatif_top_k: int, plot_size_y: int,
+                   hide_eur_values: bool, num_threads: int = 8) -> None:
+    """Simulates investing the money of the account in each of the what-if ETFs with all strategies at once, and logs
+    and stores the ranking together with the account. Optionally plots the account and the top-k simulations."""
+    # pylint: disable=too-many-arguments,too-many-locals
+    prices = whatif.get_prices(calendar, [*whatif_isins, whatif_bond_isin], num_threads=num_threads)
+    references = {name: values for isin, (name, values) in prices.items() if isin in whatif_isins}
+    bond = prices[whatif_bond_isin][1] if whatif_bond_isin in prices else None
+    if bond is None:
+        LOGGER.warning("Warning, no data for bond ETF %s, skipping the '%s' strategy", whatif_bond_isin,
+                       whatif.REBALANCED_STRATEGY)
+    invested = absolute_data["nominal account (without profit/loss)"]
+    account_value = absolute_data["total account value"]
+    simulation = whatif.simulate(calendar, invested, references, bond)
+    ranking = whatif.rank(calendar, account_value, invested, simulation)
+    whatif.log_ranking(ranking)
+    LOGGER.info("Storing what-if ranking as CSV '%s'", whatif_output)
+    whatif.store_ranking(ranking, whatif_output)
+
+    if whatif_top_k > 0:
+        output_png = whatif_output.with_suffix(".png")
+        LOGGER.info("Plotting the top-%d what-if simulations as image '%s'", whatif_top_k, output_png)
+        series = whatif.top_series(ranking, simulation, account_value, invested, whatif_top_k)
+        from . import plot  # pylint: disable=import-outside-toplevel
+        plot.plot(calendar, series["absolute"], series["relative"], output_png, plot_size_y=plot_size_y,
+                  hide_eur_values=hide_eur_values)
+
+
+def dgpc(input_file: Path, output_png: Path, output_csv: Path, end_date: datetime.date, start_date: datetime.date,
+         reference_isins: List[str], png_height_pixels: int, plot_hide_eur_values: bool,
+         num_threads: int = 8, checkpoint_file: Optional[Path] = None, business_days: bool = False,
+         plot_positions: bool = False, output_metrics: Optional[Path] = None, rolling_window: int = 0,
+         no_plot: bool = False, whatif_isins: Optional[List[str]] = None,
+         whatif_bond_isin: str = whatif.DEFAULT_BOND_ISIN, whatif_output: Path = Path("dgpc_whatif.csv"),
+         whatif_top_k: int = 0,
+         parse_cache_dir: Optional[Path] = None) -> Tuple[Calendar, Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """Main entry point of DGPC after parsing the command-line arguments. This function is the main script, calling all
+    other functions. The input file needs to point to an 'Account.csv' file from DeGiro, whereas the output file paths
+    are the locations of the resulting chart as PNG file and full data CSV (including the value, profit/loss and weight
+    per stock/ETF). The PNG file is skipped with 'no_plot'. The return and risk metrics are printed and optionally
+    stored as JSON file. Furthermore, the reference ISINs can be set, as well as ISINs to simulate and rank what-if
+    strategies for. The parsed account is reused from (or stored in) the parse cache directory, if given.
+    Returns the calendar together with all the absolute and relative data."""
+    # pylint: disable=too-many-arguments,too-many-locals
+
+    calendar, absolute_data, relative_data, positions = compute_account(input_file, end_date, start_date,
+                                                                        num_threads=num_threads,
+                                                                        checkpoint_file=checkpoint_file,
+                                                                        business_days=business_days,
+                                                                        parse_cache_dir=parse_cache_dir)
 
     # Add reference data to compare the graph with
-    print(f"[DGPC] Retrieving reference data for {reference_isin}")
-    reference, reference_name = market.get_data_by_isin(reference_isin, tuple(dates), is_etf=True)
-    if reference is None:
-        print(f"[DGPC] Could not find data for reference {reference_isin}: {reference_name}, skipping")
-    else:
-        invested = absolute_data["nominal account (without profit/loss)"]
-        reference_invested = compute_reference_invested(reference, invested)
-        absolute_data[f"{reference_name}: given investment"] = reference_invested
-        relative_data[f"{reference_name}: all-in day one"] = reference / reference[0]
-        relative_data[f"{reference_name}: given investment"] = reference_invested / invested
+    with instrumentation.stage("references"):
+        reference_names = add_references(calendar, absolute_data, relative_data, reference_isins)
+
+    # Compute the return and risk metrics
+    with instrumentation.stage("metrics"):
+        rolling_data = compute_metrics(calendar, absolute_data, reference_names, output_metrics, rolling_window)
+
+    # Simulate and rank investing the same money differently
+    if whatif_isins:
+        with instrumentation.stage("what-if"):
+            compare_whatif(calendar, absolute_data, whatif_isins, whatif_bond_isin, whatif_output,
+                           0 if no_plot else whatif_top_k, png_height_pixels, plot_hide_eur_values,
+                           num_threads=num_threads)
 
     # Plotting the final results
-    print(f"[DGPC] Plotting results as image '{output_png}'")
-    plot.plot(dates, absolute_data, relative_data, output_png, plot_size_y=png_height_pixels,
-              hide_eur_values=plot_hide_eur_values)
+    if not no_plot:
+        LOGGER.info("Plotting results as image '%s'", output_png)
+        with instrumentation.stage("plot"):
+            from . import plot  # pylint: disable=import-outside-toplevel
+            plot.plot(calendar, absolute_data, relative_data, output_png, plot_size_y=png_height_pixels,
+                      hide_eur_values=plot_hide_eur_values, positions=positions if plot_positions else None)
+
+    # Storing data also as CSV (or another data format) for reference
+    LOGGER.info("Storing results also as data file '%s'", output_csv)
+    with instrumentation.stage("store output"):
+        output.store(calendar, absolute_data, relative_data, output_csv, positions=positions, metric_data=rolling_data)
+    return calendar, absolute_data, relative_data
 
-    # Storing data also as CSV for reference
-    print(f"[DGPC] Storing results also as CSV '{output_csv}'")
-    store_csv(dates, absolute_data, relative_data, output_csv)
+
+def set_up_parse_cache(args: Dict[str, Any]) -> None:
+    """Sets the directory of the parsed accounts based on the command-line arguments, replacing those arguments. Must be
+    called before 'set_up_store', since it uses the market data cache directory."""
+    parse_cache_dir = args["cache_dir"] / parse_cache.PARSE_CACHE_DIR_NAME
+    if args["purge_cache"]:
+        LOGGER.info("Removing all stored parsed accounts from '%s'", parse_cache_dir)
+        parse_cache.purge(parse_cache_dir)
+    args["parse_cache_dir"] = None if args.pop("no_parse_cache") else parse_cache_dir
+
+
+def set_up_store(args: Dict[str, Any]) -> cache.MarketStore:
+    """Creates the persistent store of market data based on the command-line arguments, removing those arguments."""
+    store = cache.MarketStore(args.pop("cache_dir"), max_age_hours=args.pop("cache_max_age"),
+                              offline=args.pop("offline"))
+    if args.pop("purge_cache"):
+        LOGGER.info("Removing all stored market data from '%s'", store.path)
+        store.purge()
+    return store
+
+
+def set_up_provider(args: Dict[str, Any]) -> Optional[Path]:
+    """Sets the provider of market data based on the command-line arguments, removing those arguments. Returns the
+    directory of the local market data, if any."""
+    market_data_dir = args.pop("market_data_dir")
+    if market_data_dir is not None:
+        market.set_provider(LocalProvider(market_data_dir))
+    return market_data_dir
 
 
 def main() -> None:
     """Main entry point of DGPC from the command-line."""
-    dgpc(**parse_arguments())
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from . import batch  # pylint: disable=import-outside-toplevel,cyclic-import
+        batch.main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        from . import serve  # pylint: disable=import-outside-toplevel,cyclic-import
+        serve.main(sys.argv[2:])
+        return
+
+    args = parse_arguments()
+    instrumentation.set_up_logging(args.pop("log_level"))
+    profile_file = args.pop("profile_file")
+    cprofile_file = profile_file.with_suffix(".prof") if args.pop("cprofile") else None
+    set_up_provider(args)
+    set_up_parse_cache(args)
+    store = set_up_store(args)
+    if args["input_file"] is None:
+        return
+    market.set_store(store)
+
+    with instrumentation.stage("total"):
+        instrumentation.run_profiled(dgpc, cprofile_file, **args)
+    if profile_file is not None:
+        LOGGER.info("Storing profile trace as JSON '%s'", profile_file)
+        instrumentation.store_trace(profile_file, extra={"market_caches": market.cache_statistics()})
@@ -1,90 +1,274 @@
 """
-Functionality to query market data using the 'investpy' package, querying data from Investing.com.
+Functionality to query market data, by default using the 'investpy' package querying data from Investing.com. Another
+provider of market data can be set, e.g. one reading local price files. All data is queried in batches where possible,
+and optionally kept in a persistent store such that it is only queried once. The 'pandas' package is only imported
+once market data is actually needed.
 """
 import datetime
 import functools
-from typing import Optional, Sequence, Tuple
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
 
-import investpy
 import numpy as np
-from pandas import DataFrame
 
+from . import instrumentation
+from .cache import IsinInfo, MarketStore
+from .calendar import Calendar, to_days
+from .instrumentation import LOGGER
+from .providers import HistoryQuery, InvestpyProvider, MarketProvider
 
-# Countries to consider in order of preference for etf/stock information
-PREFERRED_COUNTRIES = ["netherlands", "united states", "united kingdom"]
+if TYPE_CHECKING:
+    from pandas import DataFrame
 
 
-def densify_history(history_df: DataFrame, dates: Sequence[datetime.date]) -> np.ndarray:
+# Number of days of prices to query beyond the last day of a calendar, such that the last day always has a close
+EXTRA_QUERY_DAYS = 7
+
+# Optional persistent store of market data, set through 'set_store'. If not set, everything is queried each run.
+_STORE: Optional[MarketStore] = None
+
+# Provider of the market data, set through 'set_provider', by default querying Investing.com
+_PROVIDER: MarketProvider = InvestpyProvider()
+
+# ISIN lookups and histories retrieved in this process, such that each is only queried once without a store
+_LOOKUPS: Dict[Tuple[str, bool], Optional[IsinInfo]] = {}
+_HISTORIES: Dict[HistoryQuery, Optional["DataFrame"]] = {}
+
+# Calendars for which some market data could not be retrieved (completely), and the keys of the histories of which the
+# missing data was not queried in offline mode
+_INCOMPLETE_CALENDARS: Set[Calendar] = set()
+_SKIPPED_KEYS: Set[str] = set()
+
+
+def clear_caches() -> None:
+    """Clears all market data kept in memory."""
+    _LOOKUPS.clear()
+    _HISTORIES.clear()
+    _INCOMPLETE_CALENDARS.clear()
+    _SKIPPED_KEYS.clear()
+    to_euro_modifier.cache_clear()
+    get_data_by_isin.cache_clear()
+
+
+def set_store(store: Optional[MarketStore]) -> None:
+    """Sets (or unsets with None) the persistent store to keep the queried market data in."""
+    global _STORE  # pylint: disable=global-statement
+    _STORE = store
+    clear_caches()
+
+
+def set_provider(provider: MarketProvider) -> None:
+    """Sets the provider to query all market data from."""
+    global _PROVIDER  # pylint: disable=global-statement
+    _PROVIDER = provider
+    clear_caches()
+
+
+def active_store() -> Optional[MarketStore]:
+    """Returns the persistent store to use with the current provider, if any. Providers of local data don't use it,
+    such that they never get the stored data of another provider and updated local files are always read."""
+    return _STORE if _PROVIDER.uses_store else None
+
+
+def identity() -> str:
+    """Returns an identification of the source of the market data: the provider, and whether only stored data is
+    used."""
+    store = active_store()
+    return f"{_PROVIDER.identity()}|offline={store is not None and store.offline}"
+
+
+def is_complete(calendar: Calendar) -> bool:
+    """Returns whether all the market data for the days of the calendar was retrieved so far: no ISIN lookup or
+    history failed, and no missing data was skipped in offline mode."""
+    return calendar not in _INCOMPLETE_CALENDARS
+
+
+def densify_history(history_df: "DataFrame", dates: Union[Calendar, Sequence[datetime.date]]) -> np.ndarray:
     """Expand the history data to include every date in the 'dates' array."""
-    values = np.zeros(shape=len(dates))
-    df_dates = list(history_df["Date"])
-    df_close = list(history_df["Close"])
-    previous_value = df_close[0]
-    for date_index, date in enumerate(dates):
-        if date in df_dates:
-            df_index = df_dates.index(dates[date_index])
-            value = df_close[df_index]
-            previous_value = value
-        else:
-            value = previous_value
-        values[date_index] = value
+    return densify_histories([history_df], dates)[0]
+
+
+def densify_histories(history_dfs: Sequence["DataFrame"],
+                      dates: Union[Calendar, Sequence[datetime.date]]) -> np.ndarray:
+    """Aligns multiple histories onto the same 'dates' array at once, resulting in a 2D array with one row per history.
+    Dates without data get the last known close, dates before the first known date get the first close."""
+    target_dates = to_days(dates)
+    values = np.zeros(shape=(len(history_dfs), len(target_dates)))
+    for history_index, history_df in enumerate(history_dfs):
+        df_dates = history_df["Date"].to_numpy().astype("datetime64[D]")
+        df_close = history_df["Close"].to_numpy(dtype=np.float64)
+
+        # Sorts the history by date, taking the first occurrence of duplicate dates
+        df_dates, unique_indices = np.unique(df_dates, return_index=True)
+        df_close = df_close[unique_indices]
+
+        # Finds for each target date the index of the last known date, or of the first date if none is known yet
+        df_indices = np.maximum(np.searchsorted(df_dates, target_dates, side="right") - 1, 0)
+        values[history_index] = df_close[df_indices]
     return values
 
 
+def resolve_isins(isins: Sequence[Tuple[str, bool]], num_threads: int = 1) -> List[Optional[IsinInfo]]:
+    """Retrieves the symbol, name, country, and currency of the stocks/ETFs based on their ISIN and whether they are an
+    ETF, None for those not found. Only those not known yet are queried, all at once."""
+    store = active_store()
+    missing = []
+    for isin_etf in isins:
+        if isin_etf in _LOOKUPS or isin_etf in missing:
+            continue
+        info = store.get_lookup(*isin_etf) if store is not None else None
+        if info is not None or (store is not None and store.offline):
+            _LOOKUPS[isin_etf] = info
+        else:
+            missing.append(isin_etf)
+
+    if missing:
+        for isin_etf, info in zip(missing, _PROVIDER.resolve(missing, num_threads=num_threads)):
+            _LOOKUPS[isin_etf] = info
+            if store is not None and info is not None:
+                store.put_lookup(*isin_etf, info)
+    return [_LOOKUPS[isin_etf] for isin_etf in isins]
+
+
+def lookup_isin(isin: str, is_etf: bool) -> Optional[IsinInfo]:
+    """Retrieves the symbol, name, country, and currency of a stock/ETF based on its ISIN. Returns None if not found."""
+    return resolve_isins([(isin, is_etf)])[0]
+
+
+def fetch_histories(queries: Sequence[HistoryQuery], num_threads: int = 1) -> None:
+    """Retrieves the histories of the queries from the provider, all at once, as far as not available yet: without a
+    persistent store those not queried before, with a store only the date ranges that are missing in the store."""
+    store = active_store()
+    missing = []
+    for query in queries:
+        if store is None:
+            if query not in _HISTORIES and query not in missing:
+                missing.append(query)
+            continue
+        missing_ranges = store.missing_ranges(query.key(), query.first_date, query.last_date)
+        instrumentation.count("market store misses" if missing_ranges else "market store hits")
+        if store.offline and missing_ranges:
+            LOGGER.warning("Warning, offline mode, using only stored data for %s", query.key())
+            _SKIPPED_KEYS.add(query.key())
+            continue
+        # A query needs at least two days, the extra data is just stored as well
+        missing += [query.with_range(from_date, max(to_date, from_date + datetime.timedelta(days=1)))
+                    for from_date, to_date in missing_ranges]
+    if not missing:
+        return
+
+    for query, history in zip(missing, _PROVIDER.fetch(missing, num_threads=num_threads)):
+        instrumentation.count(f"market fetches: {query.key()}")
+        if history is not None:
+            instrumentation.count("market rows downloaded", len(history))
+        if store is None:
+            _HISTORIES[query] = history
+        elif history is None:  # no data in this range, e.g. only a weekend, but the range is covered nevertheless
+            store.put_closes(query.key(), query.first_date, query.last_date, [], [])
+        else:
+            store.put_closes(query.key(), query.first_date, query.last_date,
+                              [timestamp.date() for timestamp in history["Date"]], list(history["Close"]))
+
+
+def get_history(query: HistoryQuery) -> Optional["DataFrame"]:
+    """Retrieves the history with 'Date' and 'Close' columns for the query. Returns None if no data is available."""
+    fetch_histories([query])
+    store = active_store()
+    if store is None:
+        return _HISTORIES[query]
+
+    history_dates, closes = store.get_closes(query.key(), query.first_date, query.last_date)
+    if len(history_dates) == 0:
+        return None
+    import pandas  # pylint: disable=import-outside-toplevel
+    return pandas.DataFrame({"Date": pandas.to_datetime(history_dates), "Close": closes})
+
+
+def currency_query(currency: str, calendar: Calendar) -> HistoryQuery:
+    """Returns the query for the EUR-to-currency conversion for the days of the calendar."""
+    return HistoryQuery("currency", f"EUR/{currency}", "", "", calendar.first_date,
+                        calendar.last_date + datetime.timedelta(days=EXTRA_QUERY_DAYS))
+
+
+def isin_query(info: IsinInfo, calendar: Calendar, is_etf: bool) -> HistoryQuery:
+    """Returns the query for the prices of a stock/ETF for the days of the calendar."""
+    symbol, name, country, _ = info
+    return HistoryQuery("etf" if is_etf else "stock", symbol, name, country, calendar.first_date,
+                        calendar.last_date + datetime.timedelta(days=EXTRA_QUERY_DAYS))
+
+
 @functools.lru_cache()
-def to_euro_modifier(currency: str, dates: Tuple[datetime.date]) -> np.ndarray:
-    """Retrieves currency-to-EUR conversion for the given dates. Cached to make sure this is only queried once for
-    a given currency & date-range."""
-    from_date = dates[0].strftime("%d/%m/%Y")
-    to_date = (dates[-1] + datetime.timedelta(days=7)).strftime("%d/%m/%Y")
-    history = investpy.get_currency_cross_historical_data(currency_cross=f"EUR/{currency}",
-                                                          from_date=from_date, to_date=to_date)
-    history = history.reset_index()
-    values = densify_history(history, dates)
+def to_euro_modifier(currency: str, calendar: Calendar) -> Optional[np.ndarray]:
+    """Retrieves currency-to-EUR conversion for the days of the calendar. Returns None if no data is available, e.g.
+    in offline mode without stored data. Cached to make sure this is only queried once for a given currency &
+    calendar."""
+    query = currency_query(currency, calendar)
+    history = get_history(query)
+    if history is None or query.key() in _SKIPPED_KEYS:
+        _INCOMPLETE_CALENDARS.add(calendar)
+    if history is None:
+        LOGGER.warning("Warning, no currency data available for EUR/%s.", currency)
+        return None
+    values = densify_history(history, calendar)
     return 1 / values
 
 
 @functools.lru_cache()
-def get_data_by_isin(isin: str, dates: Tuple[datetime.date], is_etf: bool) -> Tuple[Optional[np.ndarray], str]:
-    """Retrieves stock/ETF prices in EUR by ISIN for the given dates. Cached to make sure this is only queried once for
-    a given currency & date-range."""
-    from_date = dates[0].strftime("%d/%m/%Y")
-    to_date = (dates[-1] + datetime.timedelta(days=7)).strftime("%d/%m/%Y")
-
-    # Retrieves stock/etf information based on the ISIN
-    try:
-        if is_etf:
-            data = investpy.search_etfs(by="isin", value=isin)
-        else:
-            data = investpy.search_stocks(by="isin", value=isin)
-    except RuntimeError:
-        print(f"[DGPC] Warning, could not retrieve {'ETF' if is_etf else 'stock'} data for ISIN {isin}.")
+def get_data_by_isin(isin: str, calendar: Calendar, is_etf: bool) -> Tuple[Optional[np.ndarray], str]:
+    """Retrieves stock/ETF prices in EUR by ISIN for the days of the calendar. Cached to make sure this is only queried
+    once for a given ISIN & calendar."""
+    info = lookup_isin(isin, is_etf)
+    if info is None:
+        LOGGER.warning("Warning, could not retrieve %s data for ISIN %s.", "ETF" if is_etf else "stock", isin)
+        _INCOMPLETE_CALENDARS.add(calendar)
         return None, ""
-
-    # When a stock/ETF is listed in multiple countries, take one of the preferred countries if found
-    for country in PREFERRED_COUNTRIES:
-        local_data = data[data["country"] == country]
-        if local_data.shape[0] > 0:
-            break
-    else:
-        # Taking the first country from the results if none of the preferred countries is found
-        country = data["country"][0]
-        local_data = data
+    symbol, _, _, currency = info
 
     # Retrieves the actual historical prices for the stock/etf
-    currency = list(local_data["currency"])[0]
-    symbol = list(local_data["symbol"])[0]
-    if is_etf:
-        name = list(local_data["name"])[0]
-        history = investpy.get_etf_historical_data(name, country=country, from_date=from_date, to_date=to_date)
-    else:
-        history = investpy.get_stock_historical_data(symbol, country=country, from_date=from_date, to_date=to_date)
-    history = history.reset_index()
-    values = densify_history(history, dates)
+    query = isin_query(info, calendar, is_etf)
+    history = get_history(query)
+    if history is None or query.key() in _SKIPPED_KEYS:
+        _INCOMPLETE_CALENDARS.add(calendar)
+    if history is None:
+        LOGGER.warning("Warning, no historical prices available for ISIN %s.", isin)
+        return None, ""
+    values = densify_history(history, calendar)
 
     # Convert the results to euro
     if currency != "EUR":
-        currency_modifier = to_euro_modifier(currency, tuple(dates))
+        currency_modifier = to_euro_modifier(currency, calendar)
+        if currency_modifier is None:
+            return None, ""
         values *= currency_modifier
 
     return values, symbol
+
+
+def prefetch(isins: Iterable[Tuple[str, bool]], currencies: Iterable[str], calendar: Calendar,
+             num_threads: int = 8) -> None:
+    """Queries the data of all the given (ISIN, is-ETF) pairs and currencies for the calendar in two batches (first the
+    ISIN lookups, then all histories including the currencies of the stocks/ETFs), with up to 'num_threads' concurrent
+    queries. Later calls to 'get_data_by_isin' and 'to_euro_modifier' are served from the cache."""
+    isins = list(isins)
+    infos = resolve_isins(isins, num_threads=num_threads)
+    all_currencies = set(currencies) | {info[3] for info in infos if info is not None}
+    all_currencies -= {"", "EUR"}
+    queries = [currency_query(currency, calendar) for currency in sorted(all_currencies)]
+    queries += [isin_query(info, calendar, is_etf) for (_, is_etf), info in zip(isins, infos) if info is not None]
+    fetch_histories(queries, num_threads=num_threads)
+
+    for currency in sorted(all_currencies):
+        to_euro_modifier(currency, calendar)
+    for isin, is_etf in isins:
+        get_data_by_isin(isin, calendar, is_etf=is_etf)
+
+
+def cache_statistics() -> Dict[str, Dict[str, float]]:
+    """Returns the number of hits and misses and the hit ratio of the in-memory caches of the market data."""
+    # pylint: disable=no-value-for-parameter
+    statistics = {}
+    for name, info in (("get_data_by_isin", get_data_by_isin.cache_info()),
+                       ("to_euro_modifier", to_euro_modifier.cache_info())):
+        calls = info.hits + info.misses
+        statistics[name] = {"hits": info.hits, "misses": info.misses,
+                            "hit_ratio": info.hits / calls if calls > 0 else 0.0}
+    return statistics
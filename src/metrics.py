@@ -0,0 +1,171 @@
+"""
+Risk and return metrics of the account and of the reference stocks/ETFs, computed on the daily series at once for all
+of them: time-weighted return, money-weighted return (XIRR), volatility, maximum drawdown, and the Sharpe ratio of the
+account against each reference. All are based on the account value together with the invested amount (the deposits
+and withdrawals), such that money moving in and out of the account doesn't count as a return.
+"""
+import json
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from .calendar import Calendar
+from .instrumentation import LOGGER
+
+
+DAYS_PER_YEAR = 365.25
+
+# Settings of the Newton solver for the money-weighted return
+XIRR_INITIAL_RATE = 0.1
+XIRR_MAX_ITERATIONS = 100
+XIRR_TOLERANCE = 1e-10
+
+
+def periods_per_year(calendar: Calendar) -> float:
+    """Returns the number of days in the calendar per year, e.g. about 261 for a business-day calendar."""
+    num_days = (calendar.last_date - calendar.first_date).days
+    return DAYS_PER_YEAR * (len(calendar) - 1) / num_days if num_days > 0 else DAYS_PER_YEAR
+
+
+def daily_returns(values: np.ndarray, invested: np.ndarray) -> np.ndarray:
+    """Computes the returns from each day to the next for one or more series of values (series x days), excluding the
+    changes in the invested amount. Days after a day without value have no return."""
+    flows = np.diff(invested)
+    previous = values[..., :-1]
+    return np.divide(values[..., 1:] - flows - previous, previous, out=np.zeros_like(previous), where=previous > 0)
+
+
+def growth_index(returns: np.ndarray) -> np.ndarray:
+    """Compounds the daily returns (series x days - 1) into a growth index starting at 1 (series x days)."""
+    return np.cumprod(np.concatenate([np.ones(shape=(*returns.shape[:-1], 1)), 1 + returns], axis=-1), axis=-1)
+
+
+def xirr(years: np.ndarray, cash_flows: np.ndarray) -> np.ndarray:
+    """Solves the annual rate at which the net present value of the cash flows (series x events) is zero, given the
+    time of each event in years. All series are solved at once using Newton's method, until the steps are small
+    relative to the rates (which can be huge for short periods). Returns NaN for a series if the solver doesn't
+    converge, e.g. if all its cash flows have the same sign."""
+    rates = np.full(shape=cash_flows.shape[0], fill_value=XIRR_INITIAL_RATE)
+    converged = np.zeros_like(rates, dtype=bool)
+    with np.errstate(all="ignore"):
+        for _ in range(XIRR_MAX_ITERATIONS):
+            discounts = (1 + rates[:, np.newaxis]) ** -years
+            present_value = np.sum(cash_flows * discounts, axis=1)
+            derivative = np.sum(-years * cash_flows * discounts, axis=1) / (1 + rates)
+            step = np.divide(present_value, derivative, out=np.full_like(rates, np.inf), where=derivative != 0)
+            rates = np.maximum(rates - step, -1 + XIRR_TOLERANCE)
+            converged = np.abs(step) < XIRR_TOLERANCE * np.maximum(1, np.abs(rates))
+            if np.all(converged):
+                break
+    return np.where(converged, rates, np.nan)
+
+
+def compute_metrics(calendar: Calendar, invested: np.ndarray,
+                    series: Dict[str, np.ndarray]) -> Dict[str, Dict[str, Any]]:
+    """Computes all metrics for each of the given series of values, all with the same invested amount. The first series
+    is considered the account: its Sharpe ratio is computed against each of the other series (the references) based on
+    the daily excess returns. Returns the metrics per series."""
+    # pylint: disable=too-many-locals
+    names = list(series.keys())
+    values = np.array(list(series.values())).reshape(len(names), len(calendar))
+    if len(calendar) < 2:
+        return {name: {} for name in names}
+    years = (calendar.last_date - calendar.first_date).days / DAYS_PER_YEAR
+    annualization = np.sqrt(periods_per_year(calendar))
+
+    # Time-weighted return, volatility and drawdown, all from the daily returns
+    returns = daily_returns(values, invested)
+    growth = growth_index(returns)
+    time_weighted = growth[:, -1] - 1
+    volatility = np.std(returns, axis=1, ddof=1) * annualization
+    max_drawdown = np.max(1 - growth / np.maximum.accumulate(growth, axis=1), axis=1)
+
+    # Money-weighted return: the value at the first day and each change in the invested amount are the deposits, the
+    # value at the last day is what is received back
+    event_indices = np.flatnonzero(np.diff(invested)) + 1
+    event_years = (calendar.days[event_indices] - calendar.days[0]).astype(np.float64) / DAYS_PER_YEAR
+    cash_flows = np.concatenate([-values[:, :1], np.tile(-np.diff(invested)[event_indices - 1], (len(names), 1)),
+                                 values[:, -1:]], axis=1)
+    money_weighted = xirr(np.concatenate([[0.0], event_years, [years]]), cash_flows)
+
+    metrics: Dict[str, Dict[str, Any]] = {}
+    with np.errstate(all="ignore"):
+        for index, name in enumerate(names):
+            metrics[name] = {
+                "time_weighted_return": float(time_weighted[index]),
+                "time_weighted_return_annualized": float((1 + time_weighted[index]) ** (1 / years) - 1),
+                "money_weighted_return_annualized": float(money_weighted[index]),
+                "volatility_annualized": float(volatility[index]),
+                "max_drawdown": float(max_drawdown[index]),
+            }
+        if len(names) > 1:
+            excess_returns = returns[0] - returns[1:]
+            sharpe = np.mean(excess_returns, axis=1) / np.std(excess_returns, axis=1, ddof=1) * annualization
+            metrics[names[0]]["sharpe_vs_reference"] = {name: float(ratio) for name, ratio in zip(names[1:], sharpe)}
+    return metrics
+
+
+def rolling_series(calendar: Calendar, invested: np.ndarray, series: Dict[str, np.ndarray],
+                   window_days: int) -> Dict[str, np.ndarray]:
+    """Computes for each of the given series the return and the annualized volatility over a rolling window of the
+    given number of days, as well as the drawdown from the highest value so far. Days before the first full window
+    are NaN."""
+    # pylint: disable=too-many-locals
+    names = list(series.keys())
+    values = np.array(list(series.values())).reshape(len(names), len(calendar))
+    window = max(2, int(round(window_days * periods_per_year(calendar) / DAYS_PER_YEAR)))
+    returns = daily_returns(values, invested)
+    growth = growth_index(returns)
+
+    # Rolling sums of the returns and their squares for the mean and variance per window
+    sums = np.cumsum(np.concatenate([np.zeros(shape=(len(names), 2, 1)), np.stack([returns, returns ** 2], axis=1)],
+                                    axis=2), axis=2)
+    rolling_return = np.full_like(values, np.nan)
+    rolling_volatility = np.full_like(values, np.nan)
+    if window < len(calendar):
+        rolling_return[:, window:] = growth[:, window:] / growth[:, :-window] - 1
+        window_sums = sums[:, :, window:] - sums[:, :, :-window]
+        variance = (window_sums[:, 1] - window_sums[:, 0] ** 2 / window) / (window - 1)
+        rolling_volatility[:, window:] = np.sqrt(np.maximum(variance, 0)) * np.sqrt(periods_per_year(calendar))
+    drawdown = 1 - growth / np.maximum.accumulate(growth, axis=1)
+
+    rolling: Dict[str, np.ndarray] = {}
+    for index, name in enumerate(names):
+        rolling[f"{name}: {window_days}-day return"] = rolling_return[index]
+        rolling[f"{name}: {window_days}-day volatility"] = rolling_volatility[index]
+        rolling[f"{name}: drawdown"] = drawdown[index]
+    return rolling
+
+
+def format_percentage(value: Optional[float]) -> str:
+    """Formats a fraction as a percentage, or 'n/a' if not available."""
+    return "n/a" if value is None or np.isnan(value) else f"{100 * value:.2f}%"
+
+
+def log_metrics(metrics: Dict[str, Dict[str, Any]]) -> None:
+    """Logs the metrics of all series."""
+    for name, values in metrics.items():
+        if not values:
+            continue
+        LOGGER.info("%s: time-weighted return %s (%s per year), money-weighted return %s per year, volatility %s, "
+                    "max drawdown %s", name, format_percentage(values["time_weighted_return"]),
+                    format_percentage(values["time_weighted_return_annualized"]),
+                    format_percentage(values["money_weighted_return_annualized"]),
+                    format_percentage(values["volatility_annualized"]), format_percentage(values["max_drawdown"]))
+        for reference_name, sharpe in values.get("sharpe_vs_reference", {}).items():
+            LOGGER.info("%s: Sharpe ratio against %s: %.2f", name, reference_name, sharpe)
+
+
+def replace_nan(value: Any) -> Any:
+    """Replaces all NaN values in (nested dictionaries and lists of) floats by None, e.g. to store as JSON null."""
+    if isinstance(value, dict):
+        return {key: replace_nan(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [replace_nan(item) for item in value]
+    return None if isinstance(value, float) and np.isnan(value) else value
+
+
+def store_metrics(metrics: Dict[str, Dict[str, Any]], output_file: Path) -> None:
+    """Stores the metrics of all series as a JSON file, with null for metrics that are not available."""
+    output_file.write_text(json.dumps(replace_nan(metrics), indent=2))
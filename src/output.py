@@ -0,0 +1,166 @@
+"""
+Storing of the resulting series of DGPC as a data file. All series are stacked into a single 2D array (days x columns),
+which is written in bulk in chunks of days. The format is selected by the file extension: CSV (optionally gzipped),
+Parquet, Arrow (IPC/Feather) or compressed NumPy NPZ.
+"""
+import gzip
+import importlib.util
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+import numpy as np
+
+from .calendar import Calendar
+from .positions import Positions
+
+
+# Number of decimals in the CSV output for the absolute (EUR) and the relative data
+ABSOLUTE_DECIMALS = 2
+RELATIVE_DECIMALS = 4
+
+# Number of days written at once, such that the memory use stays bounded for long histories
+DEFAULT_CHUNK_SIZE = 8192
+
+PYARROW_MISSING = "Storing as Parquet or Arrow requires the 'pyarrow' package: pip install pyarrow"
+
+
+def stack_series(absolute_data: Dict[str, np.ndarray],
+                 relative_data: Dict[str, np.ndarray]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Stacks all the absolute and relative series into a single 2D array with one column per series. Returns the
+    column names (with underscores instead of spaces), the 2D array, and the number of decimals per column."""
+    names = [name.replace(" ", "_") for name in [*absolute_data.keys(), *relative_data.keys()]]
+    series = [*absolute_data.values(), *relative_data.values()]
+    num_days = len(series[0]) if series else 0
+    values = np.empty(shape=(num_days, len(series)))
+    for index, column in enumerate(series):
+        values[:, index] = column
+    decimals = np.array([ABSOLUTE_DECIMALS] * len(absolute_data) + [RELATIVE_DECIMALS] * len(relative_data))
+    return names, values, decimals
+
+
+def stack_outputs(absolute_data: Dict[str, np.ndarray], relative_data: Dict[str, np.ndarray],
+                  positions: Optional[Positions] = None,
+                  metric_data: Optional[Dict[str, np.ndarray]] = None) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Stacks all the output series as 'stack_series'. If given, the value and profit/loss per position are placed
+    after the absolute data, and the weight per position and the (rolling) metric series after the relative data."""
+    if positions is not None:
+        absolute_data = {**absolute_data, **positions.absolute_series()}
+        relative_data = {**relative_data, **positions.relative_series()}
+    if metric_data is not None:
+        relative_data = {**relative_data, **metric_data}
+    return stack_series(absolute_data, relative_data)
+
+
+def write_csv(file: TextIO, dates: np.ndarray, names: List[str], values: np.ndarray, decimals: np.ndarray,
+              chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+    """Writes the series as CSV with one row per day to an opened text file (or e.g. an in-memory buffer)."""
+    # pylint: disable=too-many-arguments
+    row_format = ",".join(["%s", *(f"%.{decimal}f" for decimal in decimals)]) + "\n"
+    scales = 10.0 ** decimals
+    date_strings = np.datetime_as_string(dates, unit="D")
+    file.write(",".join(["date", *names]) + "\n")
+    for start in range(0, len(dates), chunk_size):
+        # Rounds up-front to avoid '-0.00' in the output
+        chunk = np.round(values[start:start + chunk_size] * scales) / scales + 0.0
+        rows = zip(date_strings[start:start + chunk_size], *chunk.T.tolist())
+        file.write("".join([row_format % row for row in rows]))
+
+
+def store_csv(output_file: Path, dates: np.ndarray, names: List[str], values: np.ndarray, decimals: np.ndarray,
+              chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+    """Stores the series as a CSV file with one row per day, gzipped if the file name ends with '.gz'."""
+    # pylint: disable=too-many-arguments
+    opener: Callable[..., Any] = gzip.open if output_file.suffix.lower() == ".gz" else open
+    with opener(output_file, "wt") as file:
+        write_csv(file, dates, names, values, decimals, chunk_size=chunk_size)
+
+
+def import_pyarrow() -> Any:
+    """Imports the optional 'pyarrow' dependency, needed for the Parquet and Arrow outputs."""
+    try:
+        import pyarrow  # pylint: disable=import-outside-toplevel
+    except ImportError as error:
+        raise RuntimeError(PYARROW_MISSING) from error
+    return pyarrow
+
+
+def arrow_schema(names: List[str]) -> Any:
+    """Returns the Arrow schema of the output: a date column followed by one floating-point column per series."""
+    pyarrow = import_pyarrow()
+    return pyarrow.schema([("date", pyarrow.date32()), *((name, pyarrow.float64()) for name in names)])
+
+
+def arrow_batches(schema: Any, dates: np.ndarray, values: np.ndarray, chunk_size: int) -> Iterator[Any]:
+    """Converts the series into Arrow record batches of at most 'chunk_size' days each, one at a time."""
+    pyarrow = import_pyarrow()
+    for start in range(0, len(dates), chunk_size):
+        columns = [pyarrow.array(dates[start:start + chunk_size]),
+                   *(pyarrow.array(column) for column in values[start:start + chunk_size].T)]
+        yield pyarrow.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def store_parquet(output_file: Path, dates: np.ndarray, names: List[str], values: np.ndarray, _: np.ndarray,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+    """Stores the series as a Parquet file, with one row group per chunk of days."""
+    # pylint: disable=too-many-arguments
+    schema = arrow_schema(names)
+    import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+    with pyarrow.parquet.ParquetWriter(str(output_file), schema) as writer:
+        for batch in arrow_batches(schema, dates, values, chunk_size):
+            writer.write_batch(batch)
+
+
+def store_arrow(output_file: Path, dates: np.ndarray, names: List[str], values: np.ndarray, _: np.ndarray,
+                chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+    """Stores the series as an Arrow IPC (Feather version 2) file, with one record batch per chunk of days."""
+    # pylint: disable=too-many-arguments
+    schema = arrow_schema(names)
+    pyarrow = import_pyarrow()
+    with pyarrow.ipc.new_file(str(output_file), schema) as writer:
+        for batch in arrow_batches(schema, dates, values, chunk_size):
+            writer.write_batch(batch)
+
+
+def store_npz(output_file: Path, dates: np.ndarray, names: List[str], values: np.ndarray, _: np.ndarray,
+              chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+    """Stores the series as a compressed NPZ file with the arrays 'dates', 'names' and 'values' (days x names). The
+    full-precision values are stored, the chunk size is unused since the arrays are already in memory."""
+    # pylint: disable=too-many-arguments,unused-argument
+    with output_file.open("wb") as file:
+        np.savez_compressed(file, dates=dates, names=np.array(names), values=values)
+
+
+# The supported output formats, by file extension
+WRITERS: Dict[str, Callable[..., None]] = {
+    ".csv": store_csv,
+    ".csv.gz": store_csv,
+    ".parquet": store_parquet,
+    ".arrow": store_arrow,
+    ".feather": store_arrow,
+    ".npz": store_npz,
+}
+
+
+def get_writer(output_file: Path) -> Callable[..., None]:
+    """Returns the function to store the output with, based on the extension of the output file. Formats depending on
+    the optional 'pyarrow' package are only accepted if it is installed, without importing it yet."""
+    suffixes = [suffix.lower() for suffix in output_file.suffixes]
+    for extension in ["".join(suffixes[-2:]), "".join(suffixes[-1:])]:
+        if extension in WRITERS:
+            writer = WRITERS[extension]
+            if writer in (store_parquet, store_arrow) and importlib.util.find_spec("pyarrow") is None:
+                raise RuntimeError(PYARROW_MISSING)
+            return writer
+    raise RuntimeError(f"Unsupported output file extension of '{output_file}', expected one of: {', '.join(WRITERS)}")
+
+
+def store(calendar: Calendar, absolute_data: Dict[str, np.ndarray], relative_data: Dict[str, np.ndarray],
+          output_file: Path, chunk_size: int = DEFAULT_CHUNK_SIZE, positions: Optional[Positions] = None,
+          metric_data: Optional[Dict[str, np.ndarray]] = None) -> None:
+    """Stores all the collected data in the format given by the extension of the output file. If given, the value and
+    profit/loss per position are stored after the absolute data, and the weight per position and the (rolling) metric
+    series after the relative data."""
+    # pylint: disable=too-many-arguments
+    writer = get_writer(output_file)
+    names, values, decimals = stack_outputs(absolute_data, relative_data, positions, metric_data)
+    writer(output_file, calendar.days, names, values, decimals, chunk_size=chunk_size)
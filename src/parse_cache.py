@@ -0,0 +1,111 @@
+"""
+On-disk cache of parsed accounts, such that running DGPC again on the same 'Account.csv' file with other plot or output
+options (or another start date) only loads and slices the stored series instead of reading and parsing the file. Each
+entry holds the date axis, the absolute and relative data, and the per-position breakdown as compressed NPZ file. Its
+key is a hash of the contents of the file together with the end date, the kind of days, the source of the market data,
+and the parser version, such that a changed file, market data source or parser automatically uses a new entry. Results
+that are not final, because market data was missing or the end date is not in the past, should not be stored.
+"""
+import datetime
+import hashlib
+import json
+import os
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from . import degiro
+from .calendar import Calendar
+from .instrumentation import LOGGER
+from .positions import Positions
+
+
+# Name of the directory with the parsed accounts within the cache directory
+PARSE_CACHE_DIR_NAME = "parsed"
+
+# Maximum number of stored parsed accounts, the least recently used ones are removed first
+MAX_PARSE_CACHE_FILES = 32
+
+# Size of the blocks in which the account file is read for hashing
+HASH_BLOCK_SIZE = 1 << 20
+
+ParsedAccount = Tuple[Calendar, Dict[str, np.ndarray], Dict[str, np.ndarray], Positions]
+
+
+def cache_key(input_file: Path, end_date: datetime.date, business_days: bool, market_identity: str = "") -> str:
+    """Computes the key of the parsed results of the account file for the given end date, kind of days, and source of
+    the market data (see 'market.identity')."""
+    digest = hashlib.sha256()
+    with input_file.open("rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    digest.update(f"|{end_date.isoformat()}|{business_days}|{market_identity}|{degiro.PARSER_VERSION}".encode())
+    return digest.hexdigest()
+
+
+def load(cache_dir: Path, key: str) -> Optional[ParsedAccount]:
+    """Loads the parsed account with the given key, or returns None if it is not stored (or not readable)."""
+    cache_file = cache_dir / f"{key}.npz"
+    if not cache_file.exists():
+        return None
+    try:
+        with np.load(cache_file) as data:
+            metadata = json.loads(str(data["metadata"]))
+            calendar = Calendar(datetime.date.fromisoformat(metadata["first_date"]),
+                                datetime.date.fromisoformat(metadata["end_date"]), metadata["business_days"])
+            absolute_data = {name: data[f"absolute_{index}"] for index, name in enumerate(metadata["absolutes"])}
+            relative_data = {name: data[f"relative_{index}"] for index, name in enumerate(metadata["relatives"])}
+            positions = Positions(metadata["isins"], metadata["symbols"], data["shares"], data["prices"],
+                                  data["value"], data["profit"], data["weight"])
+        os.utime(cache_file)  # marks the entry as recently used
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as error:
+        LOGGER.warning("Warning, could not read parsed account '%s', parsing again: %s", cache_file, error)
+        return None
+    return calendar, absolute_data, relative_data, positions
+
+
+def save(cache_dir: Path, key: str, calendar: Calendar, absolute_data: Dict[str, np.ndarray],
+         relative_data: Dict[str, np.ndarray], positions: Positions) -> None:
+    """Stores the parsed account under the given key, removing the least recently used entries if there are too
+    many."""
+    # pylint: disable=too-many-arguments
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    metadata = {"first_date": calendar.first_date.isoformat(), "end_date": calendar.end_date.isoformat(),
+                "business_days": calendar.business_days, "absolutes": list(absolute_data.keys()),
+                "relatives": list(relative_data.keys()), "isins": positions.isins, "symbols": positions.symbols}
+    arrays: Dict[str, Any] = {"shares": positions.shares, "prices": positions.prices, "value": positions.value,
+                              "profit": positions.profit, "weight": positions.weight}
+    arrays.update({f"absolute_{index}": values for index, values in enumerate(absolute_data.values())})
+    arrays.update({f"relative_{index}": values for index, values in enumerate(relative_data.values())})
+
+    # Writes to a temporary file first, such that concurrent or interrupted runs never see a partial entry
+    cache_file = cache_dir / f"{key}.npz"
+    temporary_file = cache_dir / f"{key}.{os.getpid()}.tmp"
+    with temporary_file.open("wb") as file:
+        np.savez_compressed(file, metadata=np.array(json.dumps(metadata)), **arrays)
+    temporary_file.replace(cache_file)
+    prune(cache_dir)
+
+
+def prune(cache_dir: Path, max_files: int = MAX_PARSE_CACHE_FILES) -> None:
+    """Removes the least recently used parsed accounts until at most 'max_files' remain. Entries removed by another
+    (concurrent) run in the meantime are skipped."""
+    modified_times = {}
+    for cache_file in cache_dir.glob("*.npz"):
+        try:
+            modified_times[cache_file] = cache_file.stat().st_mtime
+        except FileNotFoundError:
+            continue
+    for cache_file in sorted(modified_times, key=lambda path: modified_times[path], reverse=True)[max_files:]:
+        LOGGER.debug("Removing parsed account '%s' from the cache", cache_file)
+        try:
+            cache_file.unlink()
+        except FileNotFoundError:
+            continue
+
+
+def purge(cache_dir: Path) -> None:
+    """Removes all parsed accounts from the cache."""
+    prune(cache_dir, max_files=0)
@@ -1,12 +1,20 @@
 """
 Plotting functionality for the DGPC tool based on Matplotlib.
 """
-import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import BinaryIO, Dict, List, Optional, Union
 
 import numpy as np
-from matplotlib import pyplot as plt
+from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from .calendar import Calendar
+from .positions import Positions
+
+
+# Maximum number of stocks/ETFs shown separately in the positions sub-plot, the smaller ones are summed as 'other'
+MAX_PLOTTED_POSITIONS = 10
 
 
 def get_colour(label: str) -> Optional[str]:
@@ -24,52 +32,119 @@ def get_colour(label: str) -> Optional[str]:
     return None
 
 
-def plot(dates: List[datetime.date], absolute_data: Dict[str, np.ndarray],
-         relative_data: Dict[str, np.ndarray], output_file: Path, plot_size_y: int = 1080,
-         hide_eur_values: bool = False) -> None:
+def get_colours(labels: List[str]) -> List[Optional[str]]:
+    """Determines the colours for all the labels in a single plot. A colour is only used for the first label it matches
+    (e.g. with multiple references), the other labels get the default Matplotlib colours."""
+    colours: List[Optional[str]] = []
+    for label in labels:
+        colour = get_colour(label)
+        colours.append(colour if colour not in colours else None)
+    return colours
+
+
+def downsample(values: np.ndarray, num_buckets: int) -> np.ndarray:
+    """Returns the indices of the values to plot when there is only room for 'num_buckets' points, e.g. the width of
+    the plot in pixels. The values are split in buckets, of which both the minimum and the maximum are kept (in their
+    original order), such that peaks and drawdowns remain visible. NaN values are only kept for all-NaN buckets."""
+    num_values = len(values)
+    if num_values <= 2 * num_buckets:
+        return np.arange(num_values)
+    bucket_size = -(-num_values // num_buckets)  # rounded up
+    num_buckets = -(-num_values // bucket_size)
+    padded = np.full(shape=num_buckets * bucket_size, fill_value=np.nan)
+    padded[:num_values] = values
+    buckets = padded.reshape(num_buckets, bucket_size)
+    minimum_indices = np.argmin(np.where(np.isnan(buckets), np.inf, buckets), axis=1)
+    maximum_indices = np.argmax(np.where(np.isnan(buckets), -np.inf, buckets), axis=1)
+    offsets = np.arange(num_buckets) * bucket_size
+    indices = np.stack([offsets + np.minimum(minimum_indices, maximum_indices),
+                        offsets + np.maximum(minimum_indices, maximum_indices)], axis=1).ravel()
+    return np.unique(np.minimum(indices, num_values - 1))
+
+
+def plot_series(axis: Axes, data: Dict[str, np.ndarray], num_buckets: int, scale: float = 1.0,
+                offset: float = 0.0) -> None:
+    """Plots all the series in one sub-plot as 'scale * values + offset', each downsampled to 'num_buckets' points."""
+    for (name, values), colour in zip(data.items(), get_colours(list(data.keys()))):
+        indices = downsample(values, num_buckets)
+        axis.plot(indices, scale * values[indices] + offset, label=name, color=colour)
+
+
+def plot_positions(axis: Axes, positions: Positions, num_buckets: int) -> None:
+    """Plots the value per position stacked on top of each other, the largest positions (by their maximum value) at
+    the bottom. All positions are downsampled at the same days, those with the minimum and maximum total value."""
+    order = np.argsort(-positions.value.max(axis=1), kind="stable")
+    labels = positions.labels()
+    names = [labels[index] for index in order[:MAX_PLOTTED_POSITIONS]]
+    values = positions.value[order[:MAX_PLOTTED_POSITIONS]]
+    if len(order) > MAX_PLOTTED_POSITIONS:
+        names.append("other")
+        values = np.vstack([values, positions.value[order[MAX_PLOTTED_POSITIONS:]].sum(axis=0)])
+    indices = downsample(values.sum(axis=0), num_buckets)
+    axis.stackplot(indices, values[:, indices], labels=names)
+
+
+def plot(calendar: Calendar, absolute_data: Dict[str, np.ndarray],
+         relative_data: Dict[str, np.ndarray], output_file: Union[Path, BinaryIO], plot_size_y: int = 1080,
+         hide_eur_values: bool = False, positions: Optional[Positions] = None) -> None:
     """Creates a two-sub-plot with a shared x-axis with absolute data on top (measured in EUR), and relative data in
-    the bottom (measured in percentages). The plot size can be determined in pixels with a standard 16:9 aspect ratio"""
-    # pylint: disable=too-many-arguments
+    the bottom (measured in percentages). If positions are given, a third sub-plot in the middle shows the value per
+    stock/ETF (in EUR) stacked on top of each other. The plot size can be determined in pixels with a standard 16:9
+    aspect ratio. The output is a PNG file, or e.g. an in-memory buffer. This uses Matplotlib's object-oriented API
+    without global state, such that it can be called repeatedly in a single process without leaking figures."""
+    # pylint: disable=too-many-arguments,too-many-locals
 
     # Sets the plotting sizes
     plot_size_x = plot_size_y * 16 / 9
-    plt.figure(figsize=(plot_size_x / 100, plot_size_y / 100))
+    figure = Figure(figsize=(plot_size_x / 100, plot_size_y / 100))
+    FigureCanvasAgg(figure)
     num_labels_x = int(plot_size_x // 80)  # roughly every 80 pixels one x-label
+    num_buckets = int(plot_size_x) // 2  # each bucket adds two points: at most one point per pixel
 
     # Sets the x-data
-    x_label_freq = max(1, len(dates) // num_labels_x)
-    x_values = np.arange(0, len(dates))
-
-    # Absolute values plot
-    plt.subplot(211)
-    axis = plt.gca()
-    plt.title("[DGPC] DeGiro Performance Chart, obtained using 'https://github.com/CNugteren/DGPC'")
-    for name, values in absolute_data.items():
-        plt.plot(x_values, values, label=name, color=get_colour(name))
-    plt.ylabel("EUR")
-    plt.xticks(x_values[::x_label_freq], labels="" * len(x_values[::x_label_freq]))
-    axis.set_xlim(xmin=0, xmax=len(x_values))
-    if hide_eur_values:
-        axis.yaxis.set_ticklabels([])
-    plt.grid(True)
-    plt.legend(loc="upper left")
-
-    # Relative values plot
-    plt.subplot(212)
-    axis = plt.gca()
-    for name, values in relative_data.items():
-        plt.plot(x_values, 100 * values - 100, label=name, color=get_colour(name))
-    plt.ylabel("Performance (%)")
-    plt.xticks(x_values[::x_label_freq], labels=dates[::x_label_freq], rotation=45)
-    axis.set_xlim(xmin=0, xmax=len(x_values))
-    plt.grid(True)
-    plt.legend(loc="upper left")
-
-    # Larger plots can do with smaller margins
-    if plot_size_y > 800:
-        plt.subplots_adjust(left=0.05, right=0.98, top=0.95, bottom=0.10, hspace=0.05)
-    else:
-        plt.subplots_adjust(left=0.09, right=0.96, top=0.93, bottom=0.16, hspace=0.05)
-
-    # Final output to file
-    plt.savefig(output_file, dpi=100)
+    x_label_freq = max(1, len(calendar) // num_labels_x)
+    x_ticks = np.arange(0, len(calendar), x_label_freq)
+
+    try:
+        if positions is not None and len(positions.isins) > 0:
+            absolute_axis, positions_axis, relative_axis = figure.subplots(3, 1, sharex=True,
+                                                                           gridspec_kw={"height_ratios": [2, 1, 2]})
+            plot_positions(positions_axis, positions, num_buckets)
+            positions_axis.set_ylabel("EUR per position")
+            positions_axis.tick_params(labelbottom=False)
+            if hide_eur_values:
+                positions_axis.yaxis.set_ticklabels([])
+            positions_axis.grid(True)
+            positions_axis.legend(loc="upper left", ncol=2, fontsize="small")
+        else:
+            absolute_axis, relative_axis = figure.subplots(2, 1, sharex=True)
+
+        # Absolute values plot
+        absolute_axis.set_title("[DGPC] DeGiro Performance Chart, obtained using 'https://github.com/CNugteren/DGPC'")
+        plot_series(absolute_axis, absolute_data, num_buckets)
+        absolute_axis.set_ylabel("EUR")
+        absolute_axis.tick_params(labelbottom=False)
+        if hide_eur_values:
+            absolute_axis.yaxis.set_ticklabels([])
+        absolute_axis.grid(True)
+        absolute_axis.legend(loc="upper left")
+
+        # Relative values plot
+        plot_series(relative_axis, relative_data, num_buckets, scale=100, offset=-100)
+        relative_axis.set_ylabel("Performance (%)")
+        relative_axis.set_xticks(x_ticks)
+        relative_axis.set_xticklabels(np.datetime_as_string(calendar.days[x_ticks]), rotation=45)
+        relative_axis.set_xlim(xmin=0, xmax=len(calendar))
+        relative_axis.grid(True)
+        relative_axis.legend(loc="upper left")
+
+        # Larger plots can do with smaller margins
+        if plot_size_y > 800:
+            figure.subplots_adjust(left=0.05, right=0.98, top=0.95, bottom=0.10, hspace=0.05)
+        else:
+            figure.subplots_adjust(left=0.09, right=0.96, top=0.93, bottom=0.16, hspace=0.05)
+
+        # Final output to file
+        figure.savefig(output_file, dpi=100)
+    finally:
+        figure.clear()
@@ -0,0 +1,55 @@
+"""
+Per-position breakdown of a DeGiro account: the number of shares, the price, the value, the profit/loss, and the weight
+of each stock/ETF over time. All are stored as matrices with one row per position (ISIN) and one column per day.
+"""
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+
+class Positions(NamedTuple):
+    """The per-position matrices (positions x days), all values in EUR. The profit/loss includes the paid and received
+    amounts of buying and selling and the received dividends. The weight is the fraction of the total shares value."""
+    isins: List[str]
+    symbols: List[str]
+    shares: np.ndarray
+    prices: np.ndarray
+    value: np.ndarray
+    profit: np.ndarray
+    weight: np.ndarray
+
+    def labels(self) -> List[str]:
+        """Returns a readable label per position: its symbol, or its ISIN if the symbol is not known."""
+        return [symbol if symbol != "" else isin for isin, symbol in zip(self.isins, self.symbols)]
+
+    def sliced(self, first_index: int, end_index: Optional[int] = None) -> "Positions":
+        """Returns the positions from the given day onwards (up to but not including the end day, if given), with the
+        profit/loss restarting at zero on the first day."""
+        days = slice(first_index, end_index)
+        profit = self.profit[:, days] - self.profit[:, first_index:first_index + 1]
+        return Positions(self.isins, self.symbols, self.shares[:, days], self.prices[:, days], self.value[:, days],
+                         profit, self.weight[:, days])
+
+    def absolute_series(self) -> Dict[str, np.ndarray]:
+        """Returns the value and profit/loss series per position, e.g. to store next to the absolute account data."""
+        series = {}
+        for label, value, profit in zip(self.labels(), self.value, self.profit):
+            series[f"position {label}: value"] = value
+            series[f"position {label}: profit/loss"] = profit
+        return series
+
+    def relative_series(self) -> Dict[str, np.ndarray]:
+        """Returns the weight series per position, e.g. to store next to the relative account data."""
+        return {f"position {label}: weight": weight for label, weight in zip(self.labels(), self.weight)}
+
+
+def compute_positions(isins: List[str], symbols: List[str], share_deltas: np.ndarray, cash_flows: np.ndarray,
+                      prices: np.ndarray) -> Positions:
+    """Computes all the per-position matrices at once from the changes in the number of shares and the cash flows in
+    EUR per position and day (negative when buying), given the matching prices in EUR."""
+    shares = np.cumsum(share_deltas, axis=1)
+    value = shares * prices
+    profit = value + np.cumsum(cash_flows, axis=1)
+    total_value = value.sum(axis=0)
+    weight = np.divide(value, total_value, out=np.zeros_like(value), where=total_value != 0)
+    return Positions(isins, symbols, shares, prices, value, profit, weight)
@@ -0,0 +1,207 @@
+"""
+Providers of market data: they resolve ISINs into stock/ETF information and fetch daily closing prices. All methods
+work on batches, such that a provider can answer many queries at once (concurrently or from a single local dump) instead
+of one query at a time. Two providers are available: one querying Investing.com through the 'investpy' package, and one
+reading a local directory of price files, e.g. a nightly dump, which needs no network at all.
+"""
+import csv
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from . import instrumentation
+from .cache import IsinInfo
+from .instrumentation import LOGGER
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+
+# Countries to consider in order of preference for etf/stock information
+PREFERRED_COUNTRIES = ["netherlands", "united states", "united kingdom"]
+
+# Default number of retries of a market data query in case of connection errors, and the initial delay between them
+NUM_QUERY_RETRIES = 3
+QUERY_RETRY_DELAY_SECONDS = 1.0
+
+# Name of the file with the ISIN information in a local market data directory, and the supported price file formats
+LOCAL_ISINS_FILE = "isins.csv"
+LOCAL_PRICE_EXTENSIONS = [".csv", ".parquet"]
+
+
+class HistoryQuery(NamedTuple):
+    """A query for the daily closing prices from 'first_date' till 'last_date' (inclusive). The kind is 'etf', 'stock'
+    or 'currency'. The symbol is that of the stock/ETF or a currency cross such as 'EUR/USD' (the price of one EUR)."""
+    kind: str
+    symbol: str
+    name: str
+    country: str
+    first_date: datetime.date
+    last_date: datetime.date
+
+    def key(self) -> str:
+        """Returns the key of the prices in the persistent store."""
+        if self.kind == "currency":
+            return f"currency/{self.symbol}"
+        return f"{self.kind}/{self.country}/{self.name if self.kind == 'etf' else self.symbol}"
+
+    def with_range(self, first_date: datetime.date, last_date: datetime.date) -> "HistoryQuery":
+        """Returns the same query for another date range."""
+        return HistoryQuery(self.kind, self.symbol, self.name, self.country, first_date, last_date)
+
+
+class MarketProvider:
+    """Interface of a provider of market data. Both methods take a batch of queries and return one result per query in
+    the same order, None if not available. The number of threads is a hint for providers that query over a network."""
+
+    # Whether the queried data is kept in the persistent store, which holds the data of a single (network) provider
+    uses_store = True
+
+    def identity(self) -> str:
+        """Returns an identification of the market data of this provider, e.g. for results computed with it."""
+        return type(self).__name__
+
+    def resolve(self, isins: Sequence[Tuple[str, bool]], num_threads: int = 1) -> List[Optional[IsinInfo]]:
+        """Looks up the symbol, name, country, and currency of each (ISIN, is-ETF) pair."""
+        raise NotImplementedError
+
+    def fetch(self, queries: Sequence[HistoryQuery], num_threads: int = 1) -> List[Optional["DataFrame"]]:
+        """Retrieves the histories with 'Date' and 'Close' columns, None if there is no data in the date range."""
+        raise NotImplementedError
+
+
+class InvestpyProvider(MarketProvider):
+    """Queries Investing.com through the 'investpy' package (or a replacement with the same functions, e.g. a fake for
+    testing). The package is only imported at the first query. Batches are queried concurrently, one query per
+    ISIN or history, since Investing.com has no batch queries. Queries failing with a connection error are retried
+    'num_retries' times, with a delay starting at 'retry_delay_seconds' and doubling each time."""
+
+    def __init__(self, module: Any = None, num_retries: int = NUM_QUERY_RETRIES,
+                 retry_delay_seconds: float = QUERY_RETRY_DELAY_SECONDS) -> None:
+        self._module = module
+        self.num_retries = num_retries
+        self.retry_delay_seconds = retry_delay_seconds
+
+    def query(self, function_name: str, *args: Any, **kwargs: Any) -> "DataFrame":
+        """Calls one of the 'investpy' query functions by name, retrying with an exponential backoff in case of
+        connection errors."""
+        if self._module is None:
+            import investpy  # pylint: disable=import-outside-toplevel
+            self._module = investpy
+        function: Callable[..., "DataFrame"] = getattr(self._module, function_name)
+        instrumentation.count(f"market queries: {function_name}")
+        delay = self.retry_delay_seconds
+        for _ in range(self.num_retries):
+            try:
+                return function(*args, **kwargs)
+            except OSError:  # includes the connection errors of the 'requests' package
+                LOGGER.warning("Warning, connection error while querying market data, retrying in %.0fs", delay)
+                instrumentation.count("market query retries")
+                time.sleep(delay)
+                delay *= 2
+        return function(*args, **kwargs)
+
+    def resolve_one(self, isin: str, is_etf: bool) -> Optional[IsinInfo]:
+        """Looks up a single ISIN, taking one of the preferred countries when it is listed in multiple countries."""
+        try:
+            data = self.query("search_etfs" if is_etf else "search_stocks", by="isin", value=isin)
+        except RuntimeError:
+            return None
+        for country in PREFERRED_COUNTRIES:
+            local_data = data[data["country"] == country]
+            if local_data.shape[0] > 0:
+                break
+        else:
+            # Taking the first country from the results if none of the preferred countries is found
+            country = data["country"][0]
+            local_data = data
+        return list(local_data["symbol"])[0], list(local_data["name"])[0], country, list(local_data["currency"])[0]
+
+    def fetch_one(self, query: HistoryQuery) -> Optional["DataFrame"]:
+        """Retrieves a single history, None if Investing.com has no data for it (in the date range)."""
+        from_date, to_date = query.first_date.strftime("%d/%m/%Y"), query.last_date.strftime("%d/%m/%Y")
+        try:
+            if query.kind == "currency":
+                history = self.query("get_currency_cross_historical_data", currency_cross=query.symbol,
+                                     from_date=from_date, to_date=to_date)
+            elif query.kind == "etf":
+                history = self.query("get_etf_historical_data", query.name, country=query.country,
+                                     from_date=from_date, to_date=to_date)
+            else:
+                history = self.query("get_stock_historical_data", query.symbol, country=query.country,
+                                     from_date=from_date, to_date=to_date)
+        except (IndexError, RuntimeError, ValueError):
+            return None
+        return history.reset_index()
+
+    def resolve(self, isins: Sequence[Tuple[str, bool]], num_threads: int = 1) -> List[Optional[IsinInfo]]:
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            return list(executor.map(lambda isin_etf: self.resolve_one(*isin_etf), isins))
+
+    def fetch(self, queries: Sequence[HistoryQuery], num_threads: int = 1) -> List[Optional["DataFrame"]]:
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            return list(executor.map(self.fetch_one, queries))
+
+
+class LocalProvider(MarketProvider):
+    """Reads market data from a local directory. The ISINs are resolved with the 'isins.csv' file, with the columns
+    'isin', 'symbol', 'name', 'country' and 'currency'. The prices are read from one CSV or Parquet file per symbol
+    with 'Date' and 'Close' columns, e.g. 'IWDA.csv', and 'EUR_USD.csv' for a currency cross. Each file is read once."""
+
+    # The files are local already, and should not be mixed with the stored data of other providers
+    uses_store = False
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self._isins: Optional[Dict[str, IsinInfo]] = None
+        self._histories: Dict[str, Optional["DataFrame"]] = {}
+
+    def read_isins(self) -> Dict[str, IsinInfo]:
+        """Reads the ISIN information file, if not read already. Raises an error if the file doesn't exist."""
+        if self._isins is None:
+            isins_file = self.directory / LOCAL_ISINS_FILE
+            if not isins_file.exists():
+                raise RuntimeError(f"Missing '{LOCAL_ISINS_FILE}' in the market data directory '{self.directory}'")
+            with isins_file.open(newline="") as csv_file:
+                self._isins = {row["isin"]: (row["symbol"], row["name"], row["country"], row["currency"])
+                               for row in csv.DictReader(csv_file)}
+        return self._isins
+
+    def read_history(self, symbol: str) -> Optional["DataFrame"]:
+        """Reads the full price history of a symbol, if not read already. Returns None if there is no file for it."""
+        if symbol not in self._histories:
+            import pandas  # pylint: disable=import-outside-toplevel
+            self._histories[symbol] = None
+            for extension in LOCAL_PRICE_EXTENSIONS:
+                price_file = self.directory / (symbol.replace("/", "_") + extension)
+                if price_file.exists():
+                    history = pandas.read_csv(price_file) if extension == ".csv" else pandas.read_parquet(price_file)
+                    history = history[["Date", "Close"]].assign(Date=pandas.to_datetime(history["Date"]))
+                    self._histories[symbol] = history.sort_values("Date", ignore_index=True)
+                    instrumentation.count("market files read")
+                    break
+        return self._histories[symbol]
+
+    def identity(self) -> str:
+        """Identifies the directory together with the last modification time of its files, such that updated files
+        give another identity."""
+        last_modified = 0
+        if self.directory.is_dir():
+            last_modified = max((path.stat().st_mtime_ns for path in self.directory.iterdir()), default=0)
+        return f"{type(self).__name__}:{self.directory.resolve()}:{last_modified}"
+
+    def resolve(self, isins: Sequence[Tuple[str, bool]], num_threads: int = 1) -> List[Optional[IsinInfo]]:
+        known_isins = self.read_isins()
+        return [known_isins.get(isin) for isin, _ in isins]
+
+    def fetch(self, queries: Sequence[HistoryQuery], num_threads: int = 1) -> List[Optional["DataFrame"]]:
+        histories: List[Optional["DataFrame"]] = []
+        for query in queries:
+            history = self.read_history(query.symbol)
+            if history is not None:
+                dates = history["Date"].dt.date
+                history = history[(dates >= query.first_date) & (dates <= query.last_date)].reset_index(drop=True)
+            histories.append(history if history is not None and history.shape[0] > 0 else None)
+        return histories
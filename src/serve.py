@@ -0,0 +1,461 @@
+"""
+Service mode of DGPC: a local HTTP server that keeps parsed accounts warm in memory, such that charts and data of any
+date window and with any references are served by slicing the precomputed series instead of re-parsing the account.
+The parsed accounts are kept in a least-recently-used cache with a maximum number of accounts and memory size, and an
+uploaded account is re-parsed in the background. The endpoints are:
+
+    GET /accounts                      the names of the available accounts as JSON
+    PUT /accounts/<name>               uploads a DeGiro 'Account.csv' file as the body, parsed in the background
+    GET /accounts/<name>/chart.png     the chart as PNG image
+    GET /accounts/<name>/data.csv      all the series as CSV
+    GET /accounts/<name>/data.json     all the series and the return and risk metrics as JSON
+
+The GET endpoints of an account take the optional query parameters 'start_date' and 'end_date' (as DD-MM-YYYY, with
+the same meaning as on the command-line), 'reference_isin' (repeatable), 'rolling_window', and for the chart
+'png_height_pixels', 'plot_hide_eur_values' and 'plot_positions'. The defaults are taken from the command-line. Unless
+an end date is given on the command-line, the accounts are parsed up to the current date, and parsed again once a new
+day has started.
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import io
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, OrderedDict, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from . import instrumentation
+from . import main as dgpc_main
+from . import market
+from . import metrics
+from . import output
+from .calendar import Calendar
+from .instrumentation import LOGGER
+from .positions import Positions
+
+
+# Maximum size of an uploaded account file and of the request headers
+MAX_UPLOAD_BYTES = 64 * 1024 * 1024
+MAX_HEADER_LINES = 100
+
+# Allowed account names, which are also the file names (without '.csv') in the accounts directory
+ACCOUNT_NAME_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+
+# Matplotlib is not thread-safe, so only one chart is drawn at a time
+_PLOT_LOCK = threading.Lock()
+
+
+class HttpError(RuntimeError):
+    """An error to respond with to the client, with the HTTP status code."""
+
+    def __init__(self, status: HTTPStatus, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class ParsedAccount(NamedTuple):
+    """The full series of a parsed account, together with the modification time of the account file it was parsed
+    from, such that changes of the file on disk are noticed."""
+    calendar: Calendar
+    absolute_data: Dict[str, np.ndarray]
+    relative_data: Dict[str, np.ndarray]
+    positions: Positions
+    modified_time: float
+
+    def num_bytes(self) -> int:
+        """Returns the memory size of all the arrays of the account."""
+        arrays = [*self.absolute_data.values(), *self.relative_data.values(), self.positions.shares,
+                  self.positions.prices, self.positions.value, self.positions.profit, self.positions.weight]
+        return sum(array.nbytes for array in arrays)
+
+
+class AccountCache:
+    """A least-recently-used cache of parsed accounts, limited in the number of accounts and in the total memory size
+    of their arrays. The most recently added account is always kept, even if it exceeds the memory size by itself."""
+
+    def __init__(self, max_accounts: int, max_bytes: int) -> None:
+        self.max_accounts = max_accounts
+        self.max_bytes = max_bytes
+        self._accounts: OrderedDict[str, ParsedAccount] = collections.OrderedDict()
+        self._num_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._accounts)
+
+    @property
+    def num_bytes(self) -> int:
+        """The total memory size of the arrays of all cached accounts."""
+        return self._num_bytes
+
+    def get(self, name: str) -> Optional[ParsedAccount]:
+        """Returns the parsed account, marking it as most recently used, or None if not in the cache."""
+        account = self._accounts.get(name)
+        if account is not None:
+            self._accounts.move_to_end(name)
+        return account
+
+    def put(self, name: str, account: ParsedAccount) -> None:
+        """Adds or replaces the parsed account, evicting the least recently used accounts if over the limits."""
+        self.remove(name)
+        self._accounts[name] = account
+        self._num_bytes += account.num_bytes()
+        while len(self._accounts) > 1 and (len(self._accounts) > self.max_accounts or
+                                           self._num_bytes > self.max_bytes):
+            evicted_name, evicted = self._accounts.popitem(last=False)
+            self._num_bytes -= evicted.num_bytes()
+            instrumentation.count("served account evictions")
+            LOGGER.debug("Evicted account '%s' from memory", evicted_name)
+
+    def remove(self, name: str) -> None:
+        """Removes the parsed account from the cache, if present."""
+        account = self._accounts.pop(name, None)
+        if account is not None:
+            self._num_bytes -= account.num_bytes()
+
+
+def window_indices(calendar: Calendar, start_date: datetime.date, end_date: datetime.date) -> Tuple[int, int]:
+    """Returns the indices of the first day on or after the start date and of the first day on or after the end date,
+    i.e. the days from the start date up to (but not including) the end date."""
+    first_index, end_index = np.searchsorted(calendar.days, [np.datetime64(start_date, "D"),
+                                                             np.datetime64(end_date, "D")])
+    return int(first_index), int(end_index)
+
+
+def parse_flag(value: str) -> bool:
+    """Parses a boolean query parameter."""
+    if value.lower() in ("1", "true", "yes", ""):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise HttpError(HTTPStatus.BAD_REQUEST, f"Not a valid boolean: '{value}'")
+
+
+class QueryParameters(NamedTuple):
+    """The parameters of a GET request of an account. Without an end date, the account is served up to the end date of
+    the service."""
+    start_date: datetime.date
+    end_date: Optional[datetime.date]
+    reference_isins: List[str]
+    rolling_window: int
+    png_height_pixels: int
+    plot_hide_eur_values: bool
+    plot_positions: bool
+
+
+def parse_query(query: Dict[str, List[str]], defaults: Dict[str, Any]) -> QueryParameters:
+    """Parses the query parameters of a GET request of an account, taking the defaults for missing parameters. The
+    references are given as repeated 'reference_isin' parameters, an empty one for no references."""
+    def get(name: str, parse: Callable[[str], Any]) -> Any:
+        if name not in query:
+            return defaults[name]
+        try:
+            return parse(query[name][-1])
+        except (argparse.ArgumentTypeError, ValueError) as error:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"Invalid '{name}': {error}") from error
+
+    reference_isins = defaults["reference_isins"]
+    if "reference_isin" in query:
+        reference_isins = [isin for isin in query["reference_isin"] if isin != ""]
+    parameters = QueryParameters(get("start_date", dgpc_main.parse_date), get("end_date", dgpc_main.parse_date),
+                                 reference_isins, get("rolling_window", int), get("png_height_pixels", int),
+                                 get("plot_hide_eur_values", parse_flag), get("plot_positions", parse_flag))
+    if not 100 <= parameters.png_height_pixels <= 4320:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "The 'png_height_pixels' should be between 100 and 4320")
+    return parameters
+
+
+class AccountService:
+    """Serves the accounts in a directory, with one '<name>.csv' file per account. Parsing and market data queries are
+    done one at a time in a background thread, such that the server keeps responding in the meantime. The accounts are
+    parsed up to the given end date, or up to the current date if None."""
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, accounts_dir: Path, cache: AccountCache, end_date: Optional[datetime.date], num_threads: int = 8,
+                 business_days: bool = False, defaults: Optional[Dict[str, Any]] = None,
+                 parse_cache_dir: Optional[Path] = None) -> None:
+        # pylint: disable=too-many-arguments
+        self.accounts_dir = accounts_dir
+        self.cache = cache
+        self.end_date = end_date
+        self.num_threads = num_threads
+        self.business_days = business_days
+        self.parse_cache_dir = parse_cache_dir
+        self.defaults = defaults or {}
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._parses: Dict[str, "asyncio.Task[ParsedAccount]"] = {}
+
+    def account_file(self, name: str) -> Path:
+        """Returns the path of the account file with the given name, which doesn't have to exist yet."""
+        if ACCOUNT_NAME_PATTERN.fullmatch(name) is None:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"Invalid account name '{name}', expected letters, digits, '_' "
+                                                    "or '-'")
+        return self.accounts_dir / f"{name}.csv"
+
+    def names(self) -> List[str]:
+        """Returns the names of all available accounts."""
+        return sorted(path.stem for path in self.accounts_dir.glob("*.csv")
+                      if ACCOUNT_NAME_PATTERN.fullmatch(path.stem) is not None)
+
+    def current_end_date(self) -> datetime.date:
+        """Returns the end date up to which the accounts are served now: the fixed end date or the current date."""
+        return self.end_date if self.end_date is not None else datetime.date.today()
+
+    def parse(self, name: str, end_date: datetime.date) -> ParsedAccount:
+        """Reads and parses the account from its file over the full date range up to the end date (runs in the
+        background thread). The parsed account is also reused from (or stored in) the parse cache directory, e.g. after
+        a restart."""
+        input_file = self.account_file(name)
+        modified_time = input_file.stat().st_mtime
+        with instrumentation.stage("serve: parse account"):
+            calendar, absolute_data, relative_data, positions = dgpc_main.compute_account(
+                input_file, end_date, datetime.date.min, num_threads=self.num_threads,
+                business_days=self.business_days, parse_cache_dir=self.parse_cache_dir)
+        return ParsedAccount(calendar, absolute_data, relative_data, positions, modified_time)
+
+    def start_parse(self, name: str) -> "asyncio.Task[ParsedAccount]":
+        """Starts parsing the account up to the current end date in the background, adding it to the cache when
+        done."""
+        end_date = self.current_end_date()
+
+        async def parse_and_cache() -> ParsedAccount:
+            account = await asyncio.get_running_loop().run_in_executor(self._executor, self.parse, name, end_date)
+            self.cache.put(name, account)
+            LOGGER.info("Parsed account '%s' with %d days", name, len(account.calendar))
+            return account
+
+        def finish(task: "asyncio.Task[ParsedAccount]") -> None:
+            if self._parses.get(name) is task:
+                del self._parses[name]
+            if not task.cancelled() and task.exception() is not None:
+                LOGGER.warning("Warning, could not parse account '%s': %s", name, task.exception())
+
+        task = asyncio.get_running_loop().create_task(parse_and_cache())
+        task.add_done_callback(finish)
+        self._parses[name] = task
+        return task
+
+    async def get_account(self, name: str) -> ParsedAccount:
+        """Returns the parsed account, waiting for a running parse, or parsing it if it is not in the cache (anymore),
+        if the file was changed since, or if it was parsed up to an earlier end date than the current one."""
+        input_file = self.account_file(name)
+        end_date = self.current_end_date()
+        if name in self._parses:
+            parsed = await asyncio.shield(self._parses[name])
+            if parsed.calendar.end_date >= end_date:
+                return parsed
+        if not input_file.exists():
+            raise HttpError(HTTPStatus.NOT_FOUND, f"Unknown account '{name}'")
+        account = self.cache.get(name)
+        if account is not None and account.modified_time == input_file.stat().st_mtime and \
+                account.calendar.end_date >= end_date:
+            instrumentation.count("served account hits")
+            return account
+        instrumentation.count("served account misses")
+        return await asyncio.shield(self.start_parse(name))
+
+    async def upload(self, name: str, body: bytes) -> None:
+        """Stores an uploaded account file, replacing any previous version at once, and parses it in the background."""
+        input_file = self.account_file(name)
+        temporary_file = input_file.with_suffix(".upload")
+        temporary_file.write_bytes(body)
+        os.replace(temporary_file, input_file)
+        LOGGER.info("Received account '%s' of %d bytes, parsing in the background", name, len(body))
+        if name in self._parses:
+            # The new file is parsed after the current one, since the parses run one at a time
+            self._parses[name].add_done_callback(lambda _: self.start_parse(name))
+        else:
+            self.start_parse(name)
+
+    def get_references(self, calendar: Calendar, reference_isins: List[str]) -> Tuple[List[str], List[np.ndarray]]:
+        """Retrieves the prices of the references for the full calendar of an account (runs in the background thread,
+        the prices are kept in memory by the market data caches)."""
+        with instrumentation.stage("serve: references"):
+            return dgpc_main.get_references(calendar, reference_isins)
+
+    async def window(self, name: str, parameters: QueryParameters) -> Tuple[Calendar, Dict[str, np.ndarray],
+                                                                            Dict[str, np.ndarray], Positions,
+                                                                            List[str]]:
+        """Returns the account data from the start date up to the end date of the request, including the references.
+        Returns the calendar, the absolute and relative data, the positions and the names of the references."""
+        end_date = parameters.end_date if parameters.end_date is not None else self.current_end_date()
+        if end_date > self.current_end_date():
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"The end date {end_date} is after the end date of the service "
+                                                    f"{self.current_end_date()}")
+        account = await self.get_account(name)
+        first_index, end_index = window_indices(account.calendar, parameters.start_date, end_date)
+        if first_index >= end_index:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"No data for account '{name}' from {parameters.start_date} till "
+                                                    f"{end_date}")
+        reference_names, references = await asyncio.get_running_loop().run_in_executor(
+            self._executor, self.get_references, account.calendar, parameters.reference_isins)
+        calendar, absolute_data, relative_data, positions = dgpc_main.slice_account(
+            account.calendar, account.absolute_data, account.relative_data, account.positions, first_index, end_index)
+        dgpc_main.add_reference_data(absolute_data, relative_data, reference_names,
+                                     [reference[first_index:end_index] for reference in references])
+        return calendar, absolute_data, relative_data, positions, reference_names
+
+    async def chart(self, name: str, parameters: QueryParameters) -> bytes:
+        """Returns the chart of the account as PNG image."""
+        if self.defaults.get("no_plot", False):
+            raise HttpError(HTTPStatus.NOT_FOUND, "Charts are disabled with --no_plot")
+        calendar, absolute_data, relative_data, positions, _ = await self.window(name, parameters)
+
+        def draw() -> bytes:
+            from . import plot  # pylint: disable=import-outside-toplevel
+            buffer = io.BytesIO()
+            with _PLOT_LOCK, instrumentation.stage("serve: plot"):
+                plot.plot(calendar, absolute_data, relative_data, buffer, plot_size_y=parameters.png_height_pixels,
+                          hide_eur_values=parameters.plot_hide_eur_values,
+                          positions=positions if parameters.plot_positions else None)
+            return buffer.getvalue()
+        return await asyncio.get_running_loop().run_in_executor(None, draw)
+
+    async def data(self, name: str, parameters: QueryParameters,
+                   as_json: bool) -> Tuple[np.ndarray, List[str], np.ndarray, np.ndarray, Dict[str, Any]]:
+        """Returns the days, the names, values and decimals of all series as in the data file output, and the return and
+        risk metrics (only computed for JSON)."""
+        # pylint: disable=too-many-locals
+        calendar, absolute_data, relative_data, positions, reference_names = await self.window(name, parameters)
+        invested, series = dgpc_main.metric_series(absolute_data, reference_names)
+        account_metrics = metrics.compute_metrics(calendar, invested, series) if as_json else {}
+        rolling_data = None
+        if parameters.rolling_window > 0:
+            rolling_data = metrics.rolling_series(calendar, invested, series, parameters.rolling_window)
+        names, values, decimals = output.stack_outputs(absolute_data, relative_data, positions, rolling_data)
+        return calendar.days, names, values, decimals, account_metrics
+
+    async def data_csv(self, name: str, parameters: QueryParameters) -> bytes:
+        """Returns all the series of the account as CSV, in the same format as the CSV output file."""
+        days, names, values, decimals, _ = await self.data(name, parameters, as_json=False)
+        buffer = io.StringIO()
+        output.write_csv(buffer, days, names, values, decimals)
+        return buffer.getvalue().encode()
+
+    async def data_json(self, name: str, parameters: QueryParameters) -> bytes:
+        """Returns all the series (at full precision) and the metrics of the account as JSON, with null for NaN."""
+        days, names, values, _, account_metrics = await self.data(name, parameters, as_json=True)
+        result = {"dates": np.datetime_as_string(days, unit="D").tolist(),
+                  "series": {name: column.tolist() for name, column in zip(names, values.T)},
+                  "metrics": account_metrics}
+        return json.dumps(metrics.replace_nan(result)).encode()
+
+    async def handle(self, method: str, target: str, body: bytes) -> Tuple[HTTPStatus, str, bytes]:
+        """Handles a single request, returning the status, the content type and the content of the response."""
+        url = urlsplit(target)
+        parts = [part for part in url.path.split("/") if part != ""]
+        if parts == ["accounts"] and method == "GET":
+            return HTTPStatus.OK, "application/json", json.dumps(self.names()).encode()
+        if len(parts) == 2 and parts[0] == "accounts" and method == "PUT":
+            await self.upload(parts[1], body)
+            return HTTPStatus.ACCEPTED, "application/json", json.dumps({"account": parts[1]}).encode()
+        endpoints = {"chart.png": (self.chart, "image/png"), "data.csv": (self.data_csv, "text/csv"),
+                     "data.json": (self.data_json, "application/json")}
+        if len(parts) == 3 and parts[0] == "accounts" and parts[2] in endpoints:
+            if method != "GET":
+                raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, f"Method {method} not allowed for '{url.path}'")
+            endpoint, content_type = endpoints[parts[2]]
+            parameters = parse_query(parse_qs(url.query, keep_blank_values=True), self.defaults)
+            return HTTPStatus.OK, content_type, await endpoint(parts[1], parameters)
+        raise HttpError(HTTPStatus.NOT_FOUND, f"Unknown endpoint {method} '{url.path}'")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Reads a single HTTP/1.1 request from the connection, responds to it and closes the connection."""
+        try:
+            try:
+                method, target, body = await read_request(reader)
+                instrumentation.count(f"served requests: {method}")
+                status, content_type, content = await self.handle(method, target, body)
+            except HttpError as error:
+                status, content_type, content = error.status, "text/plain", str(error).encode()
+            except Exception as error:  # pylint: disable=broad-except
+                LOGGER.warning("Warning, request failed: %s", error)
+                status, content_type, content = HTTPStatus.INTERNAL_SERVER_ERROR, "text/plain", str(error).encode()
+            header = f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: {content_type}\r\n" \
+                     f"Content-Length: {len(content)}\r\nConnection: close\r\n\r\n"
+            writer.write(header.encode() + content)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def read_request(reader: asyncio.StreamReader) -> Tuple[str, str, bytes]:
+    """Reads the method, the target and the body of an HTTP request."""
+    request_line = (await reader.readline()).decode("latin-1").split()
+    if len(request_line) != 3 or not request_line[2].startswith("HTTP/"):
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = (await reader.readline()).decode("latin-1").strip()
+        if line == "":
+            break
+        key, _, value = line.partition(":")
+        headers[key.strip().lower()] = value.strip()
+    else:
+        raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Too many header lines")
+    try:
+        content_length = int(headers.get("content-length", "0"))
+    except ValueError as error:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length") from error
+    if content_length > MAX_UPLOAD_BYTES:
+        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Uploads are limited to {MAX_UPLOAD_BYTES} bytes")
+    body = await reader.readexactly(content_length) if content_length > 0 else b""
+    return request_line[0].upper(), request_line[1], body
+
+
+async def serve(service: AccountService, host: str, port: int) -> None:
+    """Runs the HTTP server until interrupted. All existing accounts are parsed in the background at the start, as far
+    as they fit in the cache."""
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    for name in service.names()[:service.cache.max_accounts]:
+        service.start_parse(name)
+    address = server.sockets[0].getsockname()
+    LOGGER.info("Serving accounts from '%s' on http://%s:%d", service.accounts_dir, address[0], address[1])
+    async with server:
+        await server.serve_forever()
+
+
+def parse_arguments(argv: Sequence[str]) -> Any:
+    """Sets the command-line arguments of the service mode."""
+    parser = argparse.ArgumentParser(prog="dgpc.py serve", description="DGPC: local HTTP server for charts and data",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("accounts_dir", type=Path,
+                        help="Directory with one DeGiro account CSV file per account, named '<name>.csv'")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", default=8050, type=int, help="Port to listen on")
+    parser.add_argument("--max_accounts", default=16, type=int, help="Maximum number of parsed accounts in memory")
+    parser.add_argument("--max_memory_mb", default=512.0, type=float,
+                        help="Maximum memory size in MB of the series of the parsed accounts")
+    dgpc_main.add_common_arguments(parser)
+    parser.set_defaults(end_date=None)  # follows the current date while serving
+    return vars(parser.parse_args(argv))
+
+
+def main(argv: Sequence[str]) -> None:
+    """Main entry point of the service mode from the command-line."""
+    args = parse_arguments(argv)
+    instrumentation.set_up_logging(args.pop("log_level"))
+    dgpc_main.set_up_provider(args)
+    dgpc_main.set_up_parse_cache(args)
+    market.set_store(dgpc_main.set_up_store(args))
+    accounts_dir: Path = args.pop("accounts_dir")
+    accounts_dir.mkdir(parents=True, exist_ok=True)
+    host, port = args.pop("host"), args.pop("port")
+    cache = AccountCache(args.pop("max_accounts"), int(args.pop("max_memory_mb") * 1024 * 1024))
+    service = AccountService(accounts_dir, cache, args["end_date"], num_threads=args.pop("num_threads"),
+                             business_days=args.pop("business_days"), defaults=args,
+                             parse_cache_dir=args.pop("parse_cache_dir"))
+    try:
+        asyncio.run(serve(service, host, port))
+    except KeyboardInterrupt:
+        LOGGER.info("Stopped serving")
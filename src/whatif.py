@@ -0,0 +1,200 @@
+"""
+What-if engine of DGPC: simulates investing the money of the account differently, in many reference stocks/ETFs and
+with several simple strategies, and ranks all of them together with the account itself. All references and strategies
+are simulated at once as (benchmarks x days) arrays. The strategies are:
+
+    given investment   buying the reference with the same deposits and withdrawals as the account
+    lump sum           investing the final invested amount of the account at once on the day of the first deposit
+    monthly DCA        investing the final invested amount in equal parts on the first day of every month
+    60/40 rebalanced   the deposits of the account split 60/40 over the reference and a bond ETF, rebalanced monthly
+"""
+import csv
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from . import market
+from . import metrics
+from .calendar import Calendar
+from .instrumentation import LOGGER
+
+
+# The default bond ETF for the 60/40 strategy (iShares Core Euro Government Bond) and the fraction in the reference
+DEFAULT_BOND_ISIN = "IE00B4WXJJ64"
+EQUITY_WEIGHT = 0.6
+
+# The strategies that buy and hold the reference, by the name of their deposits schedule
+BUY_AND_HOLD_STRATEGIES = ["given investment", "lump sum", "monthly DCA"]
+REBALANCED_STRATEGY = "60/40 rebalanced"
+
+# Number of ranked results that are logged
+NUM_LOGGED_RESULTS = 10
+
+
+class Simulation(NamedTuple):
+    """The simulated values and invested amounts (benchmarks x days) of each reference and strategy combination."""
+    references: List[str]
+    strategies: List[str]
+    values: np.ndarray
+    invested: np.ndarray
+
+    def names(self) -> List[str]:
+        """Returns the name of each simulated benchmark, e.g. 'IWDA: lump sum'."""
+        return [f"{reference}: {strategy}" for reference, strategy in zip(self.references, self.strategies)]
+
+
+def compute_reference_invested(reference: np.ndarray, invested: np.ndarray) -> np.ndarray:
+    """Given some amount of cash investment over time, compute the reference stock/ETF's value given that all the
+    invested cash was used to buy the reference stock/ETF at the time when it was available. Assumes partial shares
+    exist. The reference can also be a 2D array with one row per reference stock/ETF, computing all of them at once."""
+    investments = np.diff(invested, prepend=0)
+    shares_bought = np.divide(investments, reference, out=np.zeros(shape=reference.shape), where=investments != 0)
+    return np.cumsum(shares_bought, axis=-1) * reference
+
+
+def month_starts(calendar: Calendar) -> np.ndarray:
+    """Returns the indices of the first calendar day of every month, including the first day of the calendar."""
+    months = calendar.days.astype("datetime64[M]")
+    return np.concatenate([[0], np.flatnonzero(months[1:] != months[:-1]) + 1]).astype(np.int64)
+
+
+def deposit_schedules(calendar: Calendar, invested: np.ndarray) -> np.ndarray:
+    """Returns the invested amount over time (schedules x days) for each buy-and-hold strategy. The lump sum and the
+    monthly DCA invest the final invested amount of the account, starting on the day of its first deposit."""
+    first_index = int(np.argmax(invested != 0))
+    total = max(float(invested[-1]), 0.0)
+    lump_sum = np.where(np.arange(len(calendar)) >= first_index, total, 0.0)
+    months = month_starts(calendar)
+    dca_days = np.concatenate([[first_index], months[months > first_index]])
+    dca_deposits = np.zeros(len(calendar))
+    dca_deposits[dca_days] = total / len(dca_days)
+    return np.stack([invested, lump_sum, np.cumsum(dca_deposits)])
+
+
+def rebalanced_values(prices: np.ndarray, bond: np.ndarray, invested: np.ndarray, rebalance_days: np.ndarray,
+                      equity_weight: float = EQUITY_WEIGHT) -> np.ndarray:
+    """Computes the value (references x days) of a portfolio of each reference together with the bond, where each
+    deposit is split by the weights and the portfolio is rebalanced to the weights at the start of each period. All
+    references are computed at once, period by period."""
+    # pylint: disable=too-many-locals
+    deposits = np.diff(invested, prepend=0)
+    values = np.zeros(shape=prices.shape)
+    equity_shares = np.zeros(shape=prices.shape[0])
+    bond_shares = np.zeros(shape=prices.shape[0])
+    boundaries = [*rebalance_days.tolist(), len(invested)]
+    with np.errstate(all="ignore"):
+        for start, end in zip(boundaries[:-1], boundaries[1:]):
+            total = equity_shares * prices[:, start] + bond_shares * bond[start]
+            equity_shares = equity_weight * total / prices[:, start]
+            bond_shares = (1 - equity_weight) * total / bond[start]
+            period_deposits = deposits[start:end]
+            equity_bought = np.divide(equity_weight * period_deposits, prices[:, start:end],
+                                      out=np.zeros(shape=prices[:, start:end].shape), where=period_deposits != 0)
+            bond_bought = np.divide((1 - equity_weight) * period_deposits, bond[start:end],
+                                    out=np.zeros(shape=end - start), where=period_deposits != 0)
+            equity = equity_shares[:, np.newaxis] + np.cumsum(equity_bought, axis=1)
+            bonds = bond_shares[:, np.newaxis] + np.cumsum(bond_bought)
+            values[:, start:end] = equity * prices[:, start:end] + bonds * bond[start:end]
+            equity_shares, bond_shares = equity[:, -1], bonds[:, -1]
+    return values
+
+
+def simulate(calendar: Calendar, invested: np.ndarray, references: Dict[str, np.ndarray],
+             bond: Optional[np.ndarray] = None) -> Simulation:
+    """Simulates all strategies for all the given reference prices (in EUR, for the days of the calendar) at once,
+    based on the invested amount of the account. The 60/40 strategy is only simulated if bond prices are given."""
+    names = list(references.keys())
+    prices = np.array(list(references.values())).reshape(len(names), len(calendar))
+    schedules = deposit_schedules(calendar, invested)
+    values = compute_reference_invested(np.broadcast_to(prices, (len(schedules), *prices.shape)),
+                                        schedules[:, np.newaxis, :])
+    values = np.swapaxes(values, 0, 1).reshape(-1, len(calendar))  # ordered by reference, then by strategy
+    all_invested = np.tile(schedules, (len(names), 1))
+    strategies = BUY_AND_HOLD_STRATEGIES * len(names)
+    result_names = [name for name in names for _ in BUY_AND_HOLD_STRATEGIES]
+    if bond is not None:
+        values = np.concatenate([values, rebalanced_values(prices, bond, invested, month_starts(calendar))])
+        all_invested = np.concatenate([all_invested, np.tile(invested, (len(names), 1))])
+        strategies += [REBALANCED_STRATEGY] * len(names)
+        result_names += names
+    return Simulation(result_names, strategies, values, all_invested)
+
+
+def rank(calendar: Calendar, account_value: np.ndarray, account_invested: np.ndarray,
+         simulation: Simulation) -> List[Dict[str, Any]]:
+    """Computes the final value, the returns and the maximum drawdown of the account and of all simulated benchmarks,
+    and ranks them by their money-weighted return (highest first, unknown last). Returns one row per benchmark."""
+    # pylint: disable=too-many-locals
+    values = np.concatenate([account_value[np.newaxis], simulation.values])
+    invested = np.concatenate([account_invested[np.newaxis], simulation.invested])
+    years = max((calendar.last_date - calendar.first_date).days, 1) / metrics.DAYS_PER_YEAR
+
+    # Time-weighted return and drawdown from the daily returns, excluding deposits and withdrawals
+    growth = metrics.growth_index(metrics.daily_returns(values, invested))
+    with np.errstate(all="ignore"):
+        time_weighted = growth[:, -1] ** (1 / years) - 1
+        max_drawdown = np.max(1 - growth / np.maximum.accumulate(growth, axis=1), axis=1)
+
+    # Money-weighted return, only considering the days with a deposit or withdrawal for any of the benchmarks
+    cash_flows = -np.diff(invested, prepend=0, axis=1)
+    cash_flows[:, -1] += values[:, -1]
+    event_indices = np.union1d(np.flatnonzero(np.any(cash_flows != 0, axis=0)), [len(calendar) - 1])
+    event_years = (calendar.days[event_indices] - calendar.days[0]).astype(np.float64) / metrics.DAYS_PER_YEAR
+    money_weighted = metrics.xirr(event_years, cash_flows[:, event_indices])
+
+    names = ["account", *simulation.references]
+    strategies = ["account", *simulation.strategies]
+    order = np.argsort(-np.nan_to_num(money_weighted, nan=-np.inf), kind="stable")
+    return [{"rank": position + 1, "name": names[index], "strategy": strategies[index],
+             "final_value": float(values[index, -1]), "invested": float(invested[index, -1]),
+             "money_weighted_return_annualized": float(money_weighted[index]),
+             "time_weighted_return_annualized": float(time_weighted[index]),
+             "max_drawdown": float(max_drawdown[index])} for position, index in enumerate(order)]
+
+
+def log_ranking(ranking: List[Dict[str, Any]], num_results: int = NUM_LOGGED_RESULTS) -> None:
+    """Logs the top of the ranking, and the rank of the account itself if it is not in the top."""
+    for row in ranking:
+        if row["rank"] <= num_results or row["strategy"] == "account":
+            LOGGER.info("%3d. %s: %s, value %.2f EUR for %.2f EUR invested, money-weighted return %s per year, "
+                        "max drawdown %s", row["rank"], row["name"], row["strategy"], row["final_value"],
+                        row["invested"], metrics.format_percentage(row["money_weighted_return_annualized"]),
+                        metrics.format_percentage(row["max_drawdown"]))
+
+
+def store_ranking(ranking: List[Dict[str, Any]], output_file: Path) -> None:
+    """Stores the ranking as a CSV file with one row per benchmark, empty for returns that are not available."""
+    with output_file.open("w", newline="") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=list(ranking[0].keys()))
+        writer.writeheader()
+        writer.writerows(metrics.replace_nan(row) for row in ranking)
+
+
+def top_series(ranking: List[Dict[str, Any]], simulation: Simulation, account_value: np.ndarray,
+               account_invested: np.ndarray, top_k: int) -> Dict[str, Dict[str, np.ndarray]]:
+    """Returns the values and the performance (value divided by the invested amount) of the account and of the top-k
+    benchmarks of the ranking, e.g. to plot."""
+    names = simulation.names()
+    indices = {name: index for index, name in enumerate(names)}
+    absolute_data = {"account": account_value}
+    relative_data = {"account": account_value / np.where(account_invested != 0, account_invested, np.nan)}
+    for row in [row for row in ranking if row["strategy"] != "account"][:top_k]:
+        index = indices[f"{row['name']}: {row['strategy']}"]
+        invested = simulation.invested[index]
+        absolute_data[names[index]] = simulation.values[index]
+        relative_data[names[index]] = simulation.values[index] / np.where(invested != 0, invested, np.nan)
+    return {"absolute": absolute_data, "relative": relative_data}
+
+
+def get_prices(calendar: Calendar, isins: Iterable[str], num_threads: int = 8) -> Dict[str, Tuple[str, np.ndarray]]:
+    """Retrieves the prices in EUR of all the given ETFs in a single batch of queries. Returns the name and prices by
+    ISIN, skipping the ETFs without data."""
+    isins = list(dict.fromkeys(isins))
+    market.prefetch([(isin, True) for isin in isins], set(), calendar, num_threads=num_threads)
+    prices = {}
+    for isin in isins:
+        values, name = market.get_data_by_isin(isin, calendar, is_etf=True)
+        if values is not None:
+            prices[isin] = (name, values)
+    return prices
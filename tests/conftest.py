@@ -0,0 +1,39 @@
+"""
+Shared test fixtures.
+"""
+from typing import Iterator, List
+
+import pytest
+
+import src.degiro as degiro
+import src.market as market
+from src.providers import InvestpyProvider
+from tests.fake_investpy import FakeInvestpy
+
+
+@pytest.fixture(name="no_retries", autouse=True)
+def fixture_no_retries(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Queries Investing.com without retries, such that tests without network fail at once instead of after delays."""
+    monkeypatch.setattr(market, "_PROVIDER", InvestpyProvider(num_retries=0))
+
+
+@pytest.fixture(name="fake_investpy")
+def fixture_fake_investpy(monkeypatch: pytest.MonkeyPatch) -> Iterator[FakeInvestpy]:
+    """Replaces all market data queries by the local fake, without a persistent store."""
+    fake = FakeInvestpy()
+    monkeypatch.setattr(market, "_PROVIDER", InvestpyProvider(fake))
+    market.set_store(None)
+    yield fake
+    market.set_store(None)
+
+
+@pytest.fixture(name="account_lines")
+def fixture_account_lines() -> List[str]:
+    """A small 'Account.csv' export: a deposit, and buying and selling a stock in USD a few days later."""
+    return [
+        # pylint: disable=line-too-long
+        degiro.CSV_HEADER,
+        '13-07-2017,18:52,13-07-2017,ADVANCED MICRO DEVICES,US0079031078,"Verkoop 8 @ 32,75 USD",,USD,"262,00",USD,"262,00",7fdd089d-e15e-2fa9-a142-bfbg43e42ff1',
+        '11-07-2017,20:19,11-07-2017,ADVANCED MICRO DEVICES,US0079031078,"Koop 8 @ 13,93 USD",,USD,"-111,44",USD,"-111,44",2gfad09a-a935-4b2c-a51a-132egc2bf0ed',
+        '11-07-2017,10:09,11-07-2017,,,iDEAL storting,,EUR,"500,00",EUR,"1461,52",'
+    ]
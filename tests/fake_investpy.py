@@ -0,0 +1,97 @@
+"""
+Local and deterministic fake of the 'investpy' functions used by the market module, such that tests can run offline.
+Every query can be given an artificial latency to mimic the network round-trip to Investing.com.
+"""
+import datetime
+import threading
+import time
+import zlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+from pandas import DataFrame, Index, bdate_range
+
+
+# Known stocks/ETFs: ISIN -> (symbol, name, country, currency)
+INSTRUMENTS = {
+    "IE00B4L5Y983": ("IWDA", "iShares Core MSCI World UCITS", "netherlands", "EUR"),
+    "IE00BKM4GZ66": ("EMIM", "iShares Core MSCI EM IMI UCITS", "netherlands", "EUR"),
+    "US0079031078": ("AMD", "Advanced Micro Devices", "united states", "USD"),
+    "US5949181045": ("MSFT", "Microsoft", "united states", "USD"),
+}
+
+# Prefix of synthetic ISINs, which are all known: 'SY' + currency + 7 digits, e.g. 'SYUSD0000001'
+SYNTHETIC_PREFIX = "SY"
+
+
+def synthetic_isin(currency: str, number: int) -> str:
+    """Returns a synthetic ISIN with the given currency, known by the fake."""
+    return f"{SYNTHETIC_PREFIX}{currency}{number:07d}"
+
+
+def lookup(isin: str) -> Tuple[str, str, str, str]:
+    """Returns the symbol, name, country, and currency of a known or synthetic ISIN, raises a KeyError otherwise."""
+    if isin.startswith(SYNTHETIC_PREFIX) and len(isin) == 12:
+        return isin[5:], f"Synthetic {isin}", "netherlands", isin[2:5]
+    return INSTRUMENTS[isin]
+
+
+def price_history(name: str, from_date: str, to_date: str) -> DataFrame:
+    """Returns deterministic daily closes for business days only, with a price level depending on the name."""
+    first = datetime.datetime.strptime(from_date, "%d/%m/%Y")
+    last = datetime.datetime.strptime(to_date, "%d/%m/%Y")
+    dates = bdate_range(first, last)
+    base = 1 + (zlib.crc32(name.encode()) % 100)
+    days = (dates - datetime.datetime(2000, 1, 1)).days.to_numpy()
+    closes = np.round(base * (1 + 0.1 * np.sin(days / 30.0) + days / 10000.0), 4)
+    return DataFrame({"Close": closes}, index=Index(dates, name="Date"))
+
+
+class FakeInvestpy:
+    """Drop-in replacement for the 'investpy' module, counting the queries per function."""
+
+    def __init__(self, latency_seconds: float = 0.0) -> None:
+        self.latency_seconds = latency_seconds
+        self.queries: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _query(self, function_name: str) -> None:
+        with self._lock:
+            self.queries[function_name] = self.queries.get(function_name, 0) + 1
+        time.sleep(self.latency_seconds)
+
+    def _search(self, function_name: str, value: str) -> DataFrame:
+        self._query(function_name)
+        try:
+            symbol, name, country, currency = lookup(value)
+        except KeyError as error:
+            raise RuntimeError("ERR#0043: no results were found for the introduced value") from error
+        rows: List[Tuple[str, str, str, str, str]] = [(country, name, symbol, currency, value)]
+        return DataFrame(rows, columns=["country", "name", "symbol", "currency", "isin"])
+
+    def search_etfs(self, by: str, value: str) -> DataFrame:  # pylint: disable=unused-argument
+        """Fake of 'investpy.search_etfs'."""
+        return self._search("search_etfs", value)
+
+    def search_stocks(self, by: str, value: str) -> DataFrame:  # pylint: disable=unused-argument
+        """Fake of 'investpy.search_stocks'."""
+        return self._search("search_stocks", value)
+
+    def get_etf_historical_data(self, etf: str, country: str, from_date: str,  # pylint: disable=unused-argument
+                                to_date: str) -> DataFrame:
+        """Fake of 'investpy.get_etf_historical_data'."""
+        self._query("get_etf_historical_data")
+        return price_history(etf, from_date, to_date)
+
+    def get_stock_historical_data(self, stock: str, country: str, from_date: str,  # pylint: disable=unused-argument
+                                  to_date: str) -> DataFrame:
+        """Fake of 'investpy.get_stock_historical_data'."""
+        self._query("get_stock_historical_data")
+        return price_history(stock, from_date, to_date)
+
+    def get_currency_cross_historical_data(self, currency_cross: str, from_date: str, to_date: str) -> DataFrame:
+        """Fake of 'investpy.get_currency_cross_historical_data', with exchange rates around 1."""
+        self._query("get_currency_cross_historical_data")
+        history = price_history(currency_cross, from_date, to_date)
+        history["Close"] = 1 + (history["Close"] % 10) / 100
+        return history
@@ -0,0 +1,78 @@
+"""
+Tests for the batch mode with multiple accounts.
+"""
+import datetime
+from pathlib import Path
+
+import numpy as np
+
+import src.batch as batch
+import src.cache as cache
+import src.degiro as degiro
+import src.market as market
+from src.calendar import Calendar
+from src.providers import InvestpyProvider, LocalProvider
+from tests.test_providers import write_market_data
+
+
+def test_find_accounts(tmp_path: Path) -> None:
+    """Tests finding accounts in a directory and in a manifest file, each with a unique name."""
+    for account in ("alice", "bob"):
+        (tmp_path / account).mkdir()
+        (tmp_path / account / "Account.csv").write_text(degiro.CSV_HEADER + "\n")
+    (tmp_path / "output").mkdir()
+    (tmp_path / "output" / "alice_Account.csv").write_text(degiro.CSV_HEADER + "\n")
+    (tmp_path / "notes.csv").write_text("date,note\n")
+    assert batch.find_accounts(tmp_path, tmp_path / "output") == {"alice_Account": tmp_path / "alice" / "Account.csv",
+                                                                  "bob_Account": tmp_path / "bob" / "Account.csv"}
+
+    (tmp_path / "manifest.txt").write_text("# accounts\nbob/Account.csv\n\n")
+    assert batch.find_accounts(tmp_path / "manifest.txt") == {"bob_Account": tmp_path / "bob" / "Account.csv"}
+
+
+def test_combine_accounts() -> None:
+    """Tests combining two accounts with a different start date into a single portfolio."""
+    calendar = Calendar(datetime.date(2020, 1, 1), datetime.date(2020, 1, 5))
+    names = batch.COMBINED_ABSOLUTES
+    account_a = batch.AccountResult("a", calendar, {name: np.array([100.0, 100, 100, 120]) for name in names}, 0)
+    account_b = batch.AccountResult("b", calendar[2:], {name: np.array([50.0, 60]) for name in names}, 0)
+
+    combined_calendar, absolute_data, relative_data = batch.combine_accounts([account_a, account_b])
+    assert combined_calendar == calendar
+    np.testing.assert_allclose(absolute_data["total account value"], [100, 100, 150, 180])
+    np.testing.assert_allclose(relative_data["account performance"], [1, 1, 1, 1])
+
+
+def test_batch(tmp_path: Path) -> None:
+    """Tests processing two accounts in worker processes with local market data, with the output directory inside the
+    input directory, and combining them into a single portfolio."""
+    market_data_dir = tmp_path / "prices"
+    market_data_dir.mkdir()
+    write_market_data(market_data_dir)
+    accounts_dir = tmp_path / "accounts"
+    for name, rows in (("alice", ['29-04-2020,12:00,29-04-2020,ADVANCED MICRO DEVICES,US0079031078,"Koop 2 @ 24,00 USD"'
+                                  ',,USD,"-48,00",USD,"-48,00",',
+                                  '27-04-2020,10:00,27-04-2020,,,iDEAL storting,,EUR,"100,00",EUR,"100,00",']),
+                       ("bob", ['29-04-2020,10:00,29-04-2020,,,iDEAL storting,,EUR,"50,00",EUR,"50,00",'])):
+        (accounts_dir / name).mkdir(parents=True)
+        (accounts_dir / name / "Account.csv").write_text("\n".join([degiro.CSV_HEADER, *rows]))
+    output_dir = accounts_dir / "output"
+    options = {"end_date": datetime.date(2020, 5, 1), "start_date": datetime.date(2000, 1, 1), "reference_isins": [],
+               "png_height_pixels": 200, "plot_hide_eur_values": False, "num_threads": 1, "business_days": False,
+               "no_plot": True, "rolling_window": 0}
+
+    market.set_provider(LocalProvider(market_data_dir))
+    try:
+        for _ in range(2):  # the second run does not take the output of the first run as accounts
+            batch.batch(accounts_dir, output_dir, 2, True, cache.MarketStore(tmp_path / "cache"), options,
+                        market_data_dir=market_data_dir)
+    finally:
+        market.set_store(None)
+        market.set_provider(InvestpyProvider())
+
+    assert sorted(path.name for path in output_dir.glob("*.csv")) == ["alice_Account.csv", "bob_Account.csv",
+                                                                      "combined.csv"]
+    combined = np.genfromtxt(output_dir / "combined.csv", delimiter=",", names=True, encoding=None, dtype=None)
+
+    # Alice buys 2 shares of 12 USD for 48 USD (at 2 USD per EUR), and Bob deposits 50 EUR
+    np.testing.assert_allclose(combined["total_account_value"], [100, 100, 138, 138])
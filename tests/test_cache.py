@@ -0,0 +1,50 @@
+"""
+Tests for the persistent storage of market data.
+"""
+import datetime
+from pathlib import Path
+
+import src.cache as cache
+
+
+def test_missing_ranges(tmp_path: Path) -> None:
+    """Tests that only the date ranges not stored yet have to be queried."""
+    store = cache.MarketStore(tmp_path, max_age_hours=0)
+    first_date = datetime.date(2020, 4, 1)
+    last_date = datetime.date(2020, 4, 30)
+    assert store.missing_ranges("etf/IWDA", first_date, last_date) == [(first_date, last_date)]
+
+    dates = [datetime.date(2020, 4, 10), datetime.date(2020, 4, 14)]
+    store.put_closes("etf/IWDA", datetime.date(2020, 4, 10), datetime.date(2020, 4, 20), dates, [50.0, 51.0])
+    assert store.missing_ranges("etf/IWDA", first_date, last_date) == [
+        (first_date, datetime.date(2020, 4, 9)),
+        (datetime.date(2020, 4, 21), last_date)
+    ]
+    assert store.get_closes("etf/IWDA", first_date, last_date) == (dates, [50.0, 51.0])
+    assert store.get_closes("etf/IWDA", datetime.date(2020, 4, 11), last_date) == (dates[1:], [51.0])
+
+
+def test_recent_data_is_not_queried_again(tmp_path: Path) -> None:
+    """Tests that recently queried data of today is considered up-to-date, but that older missing days are queried
+    nevertheless."""
+    store = cache.MarketStore(tmp_path, max_age_hours=1)
+    first_date = datetime.date(2020, 4, 1)
+    today = datetime.date.today()
+    store.put_closes("currency/EUR/USD", first_date, today, [first_date], [1.1])
+    assert not store.missing_ranges("currency/EUR/USD", first_date, today + datetime.timedelta(days=1))
+
+    # Extending an old range to a later end date within the maximum age
+    store.put_closes("etf/x", datetime.date(2019, 12, 1), datetime.date(2020, 1, 8), [first_date], [1.1])
+    assert store.missing_ranges("etf/x", datetime.date(2019, 12, 1), today) == [(datetime.date(2020, 1, 9), today)]
+
+
+def test_lookup_and_purge(tmp_path: Path) -> None:
+    """Tests storing ISIN lookups and removing all stored data again."""
+    store = cache.MarketStore(tmp_path)
+    info = ("IWDA", "iShares Core MSCI World UCITS", "netherlands", "EUR")
+    store.put_lookup("IE00B4L5Y983", True, info)
+    assert store.get_lookup("IE00B4L5Y983", True) == info
+    assert store.get_lookup("IE00B4L5Y983", False) is None
+
+    store.purge()
+    assert store.get_lookup("IE00B4L5Y983", True) is None
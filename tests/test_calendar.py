@@ -0,0 +1,46 @@
+"""
+Tests for the calendar of days on which all time series are computed.
+"""
+import datetime
+
+import numpy as np
+
+from src.calendar import Calendar
+
+
+def test_calendar_days() -> None:
+    """Tests a calendar of all days and of business days only, starting on a Saturday."""
+    first_date = datetime.date(2020, 4, 25)
+    calendar = Calendar(first_date, datetime.date(2020, 5, 9))
+    business_calendar = Calendar(first_date, datetime.date(2020, 5, 9), business_days=True)
+    assert len(calendar) == 14
+    assert len(business_calendar) == 10
+    assert calendar[0] == first_date
+    assert business_calendar[0] == datetime.date(2020, 4, 27)
+    assert business_calendar.last_date == datetime.date(2020, 5, 8)
+    assert list(calendar)[-1] == calendar.last_date == datetime.date(2020, 5, 8)
+
+    # Calendars are compared and hashed by their range, such that they can be used as cache keys
+    assert calendar == Calendar(first_date, datetime.date(2020, 5, 9))
+    assert hash(calendar) == hash(Calendar(first_date, datetime.date(2020, 5, 9)))
+    assert calendar != business_calendar
+
+    # Slicing gives a new calendar of the same kind
+    assert business_calendar[5:] == Calendar(datetime.date(2020, 5, 4), datetime.date(2020, 5, 9), business_days=True)
+    np.testing.assert_equal(business_calendar[2:4].days, business_calendar.days[2:4])
+    assert len(calendar[20:]) == 0
+
+
+def test_calendar_locate() -> None:
+    """Tests finding the calendar days of dates, with weekend dates belonging to the Monday after (not looking ahead in
+    time), and thus a weekend at the end being outside of the calendar."""
+    calendar = Calendar(datetime.date(2020, 4, 25), datetime.date(2020, 5, 10), business_days=True)
+    days = np.array(["2020-04-25", "2020-04-27", "2020-05-01", "2020-05-02", "2020-05-03", "2020-05-04", "2020-05-09",
+                     "2020-05-10"], dtype="datetime64[D]")
+    indices, in_range = calendar.locate(days)
+    np.testing.assert_equal(indices, [0, 0, 4, 5, 5, 5, 9, 9])
+    np.testing.assert_equal(in_range, [True, True, True, True, True, True, False, False])
+
+    assert calendar.find(datetime.date(2020, 5, 2)) == 5
+    assert calendar.find(datetime.date(2020, 4, 24)) is None
+    assert calendar.find(datetime.date(2020, 5, 9)) is None
@@ -0,0 +1,100 @@
+"""
+Tests for continuing parsing from the checkpoint of a previous run.
+"""
+import datetime
+from pathlib import Path
+
+import numpy as np
+
+import src.checkpoint as checkpoint
+import src.degiro as degiro
+import src.main as dgpc_main
+import src.market as market
+from src.calendar import Calendar
+from src.providers import LocalProvider
+from tests.test_providers import write_market_data
+
+
+OLD_ROWS = [
+    '11-07-2017,09:05,11-07-2017,ISHARES EMIM,IE00BKM4GZ66,DEGIRO transactiekosten,,EUR,"-2,00",EUR,"296,97",17e55f46',
+    '10-07-2017,10:09,10-07-2017,,,iDEAL storting,,EUR,"500,00",EUR,"1461,52",',
+]
+NEW_ROWS = [
+    '13-07-2017,10:09,13-07-2017,,,iDEAL storting,,EUR,"250,00",EUR,"1461,52",',
+    '12-07-2017,10:09,12-07-2017,,,Terugstorting,,EUR,"-100,00",EUR,"1461,52",',
+]
+
+
+def test_continue_from_checkpoint(tmp_path: Path) -> None:
+    """Tests that parsing the new rows from a checkpoint gives the same results as parsing everything."""
+    # pylint: disable=too-many-locals
+    first_date = datetime.date(2017, 7, 10)
+    old_calendar = Calendar(first_date, first_date + datetime.timedelta(days=3))
+    new_calendar = Calendar(first_date, first_date + datetime.timedelta(days=5))
+
+    # First run with the old data only
+    old_account = degiro.read_csv([degiro.CSV_HEADER, *OLD_ROWS])
+    ledger = degiro.Ledger(len(old_calendar))
+    num_rows = degiro.parse_rows(old_account, old_calendar, ledger)
+    checkpoint_file = tmp_path / "checkpoint.npz"
+    checkpoint.save_checkpoint(checkpoint_file, old_account, num_rows, ledger, old_calendar)
+
+    # Second run with new rows on top, only parsing the new rows
+    new_account = degiro.read_csv([degiro.CSV_HEADER, *NEW_ROWS, *OLD_ROWS])
+    state = checkpoint.load_checkpoint(checkpoint_file, new_account, new_calendar)
+    assert state is not None and state.num_rows == 2
+    degiro.parse_rows(new_account, new_calendar, state.ledger, first_row=state.num_rows)
+    continued_data, _, _ = degiro.build_series(state.ledger, new_calendar)
+
+    expected_data, _, _ = degiro.parse_account(new_account, new_calendar)
+    for name, values in expected_data.items():
+        np.testing.assert_allclose(continued_data[name], values)
+    np.testing.assert_allclose(continued_data["nominal account (without profit/loss)"], [500, 500, 500, 650, 650])
+
+
+def test_changed_data_invalidates_checkpoint(tmp_path: Path) -> None:
+    """Tests that a checkpoint is not used when older data changed."""
+    first_date = datetime.date(2017, 7, 10)
+    calendar = Calendar(first_date, first_date + datetime.timedelta(days=3))
+    account = degiro.read_csv([degiro.CSV_HEADER, *OLD_ROWS])
+    ledger = degiro.Ledger(len(calendar))
+    num_rows = degiro.parse_rows(account, calendar, ledger)
+    checkpoint_file = tmp_path / "checkpoint.npz"
+    checkpoint.save_checkpoint(checkpoint_file, account, num_rows, ledger, calendar)
+
+    changed_account = degiro.read_csv([degiro.CSV_HEADER, *NEW_ROWS, OLD_ROWS[0].replace("-2,00", "-3,00"),
+                                       OLD_ROWS[1]])
+    assert checkpoint.load_checkpoint(checkpoint_file, changed_account, calendar) is None
+    assert checkpoint.load_checkpoint(checkpoint_file, account, calendar[:-1]) is None
+    business_calendar = Calendar(first_date, first_date + datetime.timedelta(days=3), business_days=True)
+    assert checkpoint.load_checkpoint(checkpoint_file, account, business_calendar) is None
+    assert checkpoint.load_checkpoint(checkpoint_file, account, calendar) is not None
+
+
+def test_checkpoint_without_new_rows_uses_current_prices(tmp_path: Path) -> None:
+    """Tests that a run without new rows since the checkpoint still values the positions with the current prices."""
+    account_file = tmp_path / "Account.csv"
+    account_file.write_text("\n".join([
+        # pylint: disable=line-too-long
+        degiro.CSV_HEADER,
+        '28-04-2020,09:05,28-04-2020,ISHARES CORE MSCI WORLD,IE00B4L5Y983,"Koop 2 @ 50 EUR",,EUR,"-100,00",EUR,"0,00",17e55f46',
+        '28-04-2020,09:00,28-04-2020,,,iDEAL storting,,EUR,"100,00",EUR,"100,00",',
+    ]))
+    checkpoint_file = tmp_path / "checkpoint.npz"
+    end_date = datetime.date(2020, 5, 1)
+    old_prices, new_prices = tmp_path / "old", tmp_path / "new"
+    for directory in (old_prices, new_prices):
+        directory.mkdir()
+        write_market_data(directory)
+    (new_prices / "IWDA.csv").write_text("Date,Close\n2020-04-28,50.0\n2020-04-29,60.0\n2020-04-30,70.0\n")
+
+    market.set_provider(LocalProvider(old_prices))
+    _, absolute_data, _, _ = dgpc_main.parse_account_file(account_file, end_date, checkpoint_file=checkpoint_file)
+    np.testing.assert_allclose(absolute_data["total account value"], [100, 102, 104])
+
+    # Second run with other prices, e.g. corrected or completed closes, but the same account rows
+    market.set_provider(LocalProvider(new_prices))
+    _, absolute_data, _, positions = dgpc_main.parse_account_file(account_file, end_date,
+                                                                  checkpoint_file=checkpoint_file)
+    np.testing.assert_allclose(absolute_data["total account value"], [100, 120, 140])
+    np.testing.assert_allclose(positions.value[0], [100, 120, 140])
@@ -1,57 +1,187 @@
 """
 Tests for the DeGiro parsing of various kinds, based on modified snippets of real account data.
 """
-import csv
 import datetime
+from pathlib import Path
+from typing import List
 
 import numpy as np
+import pytest
 
+import src.cache as cache
 import src.degiro as degiro
+import src.market as market
+from src.calendar import Calendar
+from tests.fake_investpy import FakeInvestpy, price_history
 
 
 def test_parse_cash_addition() -> None:
     """Tests adding cash to the account."""
-    csv_data = list(csv.reader([
+    account = degiro.read_csv([
         degiro.CSV_HEADER,
         '12-03-2020,15:45,12-03-2020,,,iDEAL storting,,EUR,"1000,00",EUR,"1046,57",',
         '10-03-2020,10:09,10-03-2020,,,iDEAL storting,,EUR,"500,00",EUR,"1461,52",'
-    ]))
-    dates = [datetime.date(2020, 3, 9) + datetime.timedelta(days=days) for days in range(0, 4)]
+    ])
+    calendar = Calendar(datetime.date(2020, 3, 9), datetime.date(2020, 3, 13))
 
-    abs_data, _ = degiro.parse_account(csv_data, dates)
+    abs_data, _, _ = degiro.parse_account(account, calendar)
     np.testing.assert_equal(abs_data["nominal account (without profit/loss)"], abs_data["cash in DeGiro account"])
     np.testing.assert_equal(abs_data["nominal account (without profit/loss)"], [0, 500, 500, 1500])
 
 
-def test_parse_buy_and_sell() -> None:
-    """Tests buying a stock and selling it again in USD."""
-    csv_data = list(csv.reader([
-        # pylint: disable=line-too-long
-        degiro.CSV_HEADER,
-        '13-07-2017,18:52,13-07-2017,ADVANCED MICRO DEVICES,US0079031078,"Verkoop 8 @ 32,75 USD",,USD,"262,00",USD,"262,00",7fdd089d-e15e-2fa9-a142-bfbg43e42ff1',
-        '11-07-2017,20:19,11-07-2017,ADVANCED MICRO DEVICES,US0079031078,"Koop 8 @ 13,93 USD",,USD,"-111,44",USD,"-111,44",2gfad09a-a935-4b2c-a51a-132egc2bf0ed',
-        '11-07-2017,10:09,11-07-2017,,,iDEAL storting,,EUR,"500,00",EUR,"1461,52",'
-    ]))
-    dates = [datetime.date(2017, 7, 10) + datetime.timedelta(days=days) for days in range(0, 5)]
+def test_parse_english_export() -> None:
+    """Tests an English-language export, with amounts using a decimal point and thousands separators."""
+    account = degiro.read_csv([
+        degiro.CSV_HEADER_ENGLISH,
+        '12-03-2020,15:45,12-03-2020,,,Withdrawal,,EUR,"-250.50",EUR,"1,749.50",',
+        '11-03-2020,09:05,11-03-2020,ISHARES EMIM,IE00BKM4GZ66,DEGIRO Transaction Fee,,EUR,"-2.00",EUR,"1,998.00",',
+        '10-03-2020,10:09,10-03-2020,,,iDEAL Deposit,,EUR,"1,000.00",EUR,"2,000.00",',
+        '09-03-2020,10:09,09-03-2020,,,iDEAL Deposit,,EUR,"1000.00",EUR,"1000.00",',
+    ])
+    np.testing.assert_allclose(account.mutations, [1000, 1000, -2, -250.5])
+    calendar = Calendar(datetime.date(2020, 3, 9), datetime.date(2020, 3, 13))
+
+    abs_data, _, _ = degiro.parse_account(account, calendar)
+    np.testing.assert_allclose(abs_data["nominal account (without profit/loss)"], [1000, 2000, 2000, 2000])
+    np.testing.assert_allclose(abs_data["cash in DeGiro account"], [1000, 2000, 1998, 1998])
+
+
+def test_unexpected_header() -> None:
+    """Tests that the error for an unknown header lists both supported headers."""
+    with pytest.raises(RuntimeError) as error:
+        degiro.read_csv(["Date,Time,Product"])
+    assert str(degiro.CSV_HEADER.split(",")) in str(error.value)
+    assert str(degiro.CSV_HEADER_ENGLISH.split(",")) in str(error.value)
+
 
-    abs_data, _ = degiro.parse_account(csv_data, dates)
+@pytest.mark.parametrize("provider", ["investpy", "offline"])
+def test_parse_buy_and_sell(provider: str, account_lines: List[str], request: pytest.FixtureRequest) -> None:
+    """Tests buying a stock and selling it again in USD, with the market data of Investing.com or of the local fake."""
+    account = degiro.read_csv(account_lines)
+    calendar = Calendar(datetime.date(2017, 7, 10), datetime.date(2017, 7, 15))
+
+    isins, currencies = degiro.get_market_queries(account)
+    assert isins == {("US0079031078", False)}
+    assert currencies == {"USD"}
+
+    if provider == "offline":
+        fake_investpy: FakeInvestpy = request.getfixturevalue("fake_investpy")
+        eur_usd = fake_investpy.get_currency_cross_historical_data("EUR/USD", "10/07/2017", "14/07/2017")
+        usd_to_eur = 1 / eur_usd["Close"].to_numpy()
+        amd_eur = price_history("AMD", "10/07/2017", "14/07/2017")["Close"].to_numpy() * usd_to_eur
+        cash = np.array([0, 500 - 111.44 * usd_to_eur[1], 500 - 111.44 * usd_to_eur[1]])
+        cash = np.concatenate([cash, [cash[-1] + 262 * usd_to_eur[3]] * 2])
+        total = cash + np.array([0, 8, 8, 0, 0]) * amd_eur
+    else:
+        cash = np.array([0, 402.816779, 402.816779, 632.661502, 632.661502])
+        total = np.array([0, 499.720938, 502.992033, 632.661502, 632.661502])
+
+    abs_data, _, positions = degiro.parse_account(account, calendar)
     np.testing.assert_allclose(abs_data["nominal account (without profit/loss)"], [0, 500, 500, 500, 500])
-    np.testing.assert_allclose(abs_data["cash in DeGiro account"], [0, 402.816779, 402.816779, 632.661502, 632.661502])
-    np.testing.assert_allclose(abs_data["total account value"], [0, 499.720938, 502.992033, 632.661502, 632.661502])
+    np.testing.assert_allclose(abs_data["cash in DeGiro account"], cash)
+    np.testing.assert_allclose(abs_data["total account value"], total)
+
+    # The per-position breakdown, with the profit/loss realised when selling
+    assert positions.isins == ["US0079031078"]
+    np.testing.assert_allclose(positions.shares, [[0, 8, 8, 0, 0]])
+    np.testing.assert_allclose(positions.value[0], total - cash, atol=1e-6)
+    np.testing.assert_allclose(positions.profit[0, 3:], [cash[3] - 500] * 2)
+    np.testing.assert_allclose(positions.weight, [[0, 1, 1, 0, 0]])
+    if provider == "offline":
+        assert fake_investpy.queries["get_stock_historical_data"] == 1
+
+
+def test_parse_offline_without_stored_data(account_lines: List[str], fake_investpy: FakeInvestpy,
+                                          tmp_path: Path) -> None:
+    """Tests that in offline mode with an empty store the entries in USD are skipped instead of failing the run."""
+    account = degiro.read_csv(account_lines)
+    calendar = Calendar(datetime.date(2017, 7, 10), datetime.date(2017, 7, 15))
+    market.set_store(cache.MarketStore(tmp_path, offline=True))
+
+    isins, currencies = degiro.get_market_queries(account)
+    market.prefetch(isins, currencies, calendar)
+    abs_data, _, positions = degiro.parse_account(account, calendar)
+    np.testing.assert_allclose(abs_data["cash in DeGiro account"], [0, 500, 500, 500, 500])
+    np.testing.assert_allclose(abs_data["total account value"], [0, 500, 500, 500, 500])
+    assert not positions.isins
+    assert not market.is_complete(calendar)
+    assert not fake_investpy.queries
 
 
 def test_parse_transaction_costs() -> None:
     """Tests paying for two sets of transaction costs."""
-    csv_data = list(csv.reader([
+    account = degiro.read_csv([
         # pylint: disable=line-too-long
         degiro.CSV_HEADER,
         '12-07-2017,09:05,12-07-2017,ISHARES EMIM,IE00BKM4GZ66,DEGIRO transactiekosten,,EUR,"-2,00",EUR,"296,97",17e55f46-efaa-4edf-a76e-209e820223f7',
         '12-07-2017,09:05,12-07-2017,ISHARES EMIM,IE00BKM4GZ66,DEGIRO transactiekosten,,EUR,"-0,62",EUR,"298,97",17e55f46-efaa-4edf-a76e-209e820223f7',
         '11-07-2017,10:09,11-07-2017,,,iDEAL storting,,EUR,"500,00",EUR,"1461,52",'
-    ]))
-    dates = [datetime.date(2017, 7, 10) + datetime.timedelta(days=days) for days in range(0, 3)]
+    ])
+    calendar = Calendar(datetime.date(2017, 7, 10), datetime.date(2017, 7, 13))
 
-    abs_data, _ = degiro.parse_account(csv_data, dates)
+    abs_data, _, _ = degiro.parse_account(account, calendar)
     np.testing.assert_allclose(abs_data["nominal account (without profit/loss)"], [0, 500, 500])
     np.testing.assert_allclose(abs_data["cash in DeGiro account"], [0, 500, 497.38])
     np.testing.assert_allclose(abs_data["total account value"], [0, 500, 497.38])
+
+
+def test_read_rows_in_chunks() -> None:
+    """Tests reading rows into chronologically ordered columns, using chunks smaller than the number of rows."""
+    rows = [
+        ["12-03-2020", "15:45", "12-03-2020", "", "", "iDEAL storting", "", "EUR", "1000,00", "EUR", "1046,57", ""],
+        ["", "", "", "", "", "continuation", "", "", "", "", "", ""],
+        ["11-03-2020", "09:05", "11-03-2020", "ISHARES EMIM", "IE00BKM4GZ66", "DEGIRO transactiekosten", "", "EUR",
+         "-2,00", "EUR", "296,97", "17e55f46"],
+        ["10-03-2020", "10:09", "10-03-2020", "", "", "iDEAL storting", "", "EUR", "500,00", "EUR", "1461,52", ""],
+    ]
+    account = degiro.read_rows(rows, chunk_size=2)
+    assert len(account) == 3
+    np.testing.assert_equal(account.dates, np.array(["2020-03-10", "2020-03-11", "2020-03-12"], dtype="datetime64[D]"))
+    np.testing.assert_equal(account.mutations, [500, -2, 1000])
+    assert [account.descriptions[index] for index in account.description_ids] == [
+        "iDEAL storting", "DEGIRO transactiekosten", "iDEAL storting"]
+    assert [account.isins[index] for index in account.isin_ids] == ["", "IE00BKM4GZ66", ""]
+    assert account.first_date() == datetime.date(2020, 3, 10)
+
+
+def test_classify(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests classifying descriptions of rows, including the precedence of rules and adding a new rule."""
+    assert degiro.classify("iDEAL storting") == degiro.TransactionKind.DEPOSIT
+    assert degiro.classify("Verkoop 1.000 @ 32,75 USD") == degiro.TransactionKind.SELL
+    assert degiro.classify("Koop 8 @ 13,93 USD") == degiro.TransactionKind.BUY
+    assert degiro.classify("Buy 8 @ 13.93 USD") == degiro.TransactionKind.BUY
+    assert degiro.classify("DEGIRO Aansluitingskosten 2020 (Euronext)") == degiro.TransactionKind.DEGIRO_COSTS
+    assert degiro.classify("Dividend") == degiro.TransactionKind.DIVIDEND
+    assert degiro.classify("Dividendbelasting") == degiro.TransactionKind.DIVIDEND
+    assert degiro.classify("Valuta Debitering") == degiro.TransactionKind.IGNORED
+    assert degiro.classify("Test-only costs") == degiro.TransactionKind.UNSUPPORTED
+
+    # Adds the rule to a copy of the rules only, forgetting its classifications afterwards
+    monkeypatch.setattr(degiro, "CLASSIFICATION_RULES", list(degiro.CLASSIFICATION_RULES))
+    monkeypatch.setattr(degiro, "_RULES_PATTERN", degiro.compile_rules())
+    try:
+        degiro.register_rule(r"Test-only costs$", degiro.TransactionKind.COSTS)
+        assert degiro.classify("Test-only costs") == degiro.TransactionKind.COSTS
+    finally:
+        degiro.classify.cache_clear()
+
+
+def test_is_etf() -> None:
+    """Tests recognizing ETFs by name."""
+    assert degiro.is_etf("ISHARES EMIM")
+    assert degiro.is_etf("Vanguard FTSE All-World")
+    assert not degiro.is_etf("ADVANCED MICRO DEVICES")
+
+
+def test_parse_business_days() -> None:
+    """Tests parsing onto business days only, with a deposit on a Saturday counting from the Monday after."""
+    account = degiro.read_csv([
+        # pylint: disable=line-too-long
+        degiro.CSV_HEADER,
+        '15-07-2017,10:09,15-07-2017,,,iDEAL storting,,EUR,"250,00",EUR,"750,00",',
+        '11-07-2017,10:09,11-07-2017,,,iDEAL storting,,EUR,"500,00",EUR,"500,00",'
+    ])
+    calendar = Calendar(datetime.date(2017, 7, 10), datetime.date(2017, 7, 18), business_days=True)
+
+    abs_data, _, _ = degiro.parse_account(account, calendar)
+    np.testing.assert_allclose(abs_data["nominal account (without profit/loss)"], [0, 500, 500, 500, 500, 750])
@@ -0,0 +1,41 @@
+"""
+Tests for the logging, timing and counting of DGPC runs.
+"""
+import json
+import pstats
+from pathlib import Path
+
+import src.instrumentation as instrumentation
+
+
+def test_stages_and_counters(tmp_path: Path) -> None:
+    """Tests that repeated stages and counters are summed, and stored as JSON trace."""
+    instrumentation.reset()
+    for _ in range(2):
+        with instrumentation.stage("parse account"):
+            instrumentation.count("rows: buy", 3)
+    instrumentation.count("market queries: search_etfs")
+
+    trace = instrumentation.trace()
+    assert list(trace["stages"]) == ["parse account"]
+    assert trace["stages"]["parse account"]["calls"] == 2
+    assert trace["stages"]["parse account"]["wall_seconds"] >= 0
+    assert trace["counters"] == {"market queries: search_etfs": 1, "rows: buy": 6}
+
+    trace_file = tmp_path / "trace.json"
+    instrumentation.store_trace(trace_file, extra={"market_caches": {}})
+    assert json.loads(trace_file.read_text()) == {**trace, "market_caches": {}}
+    instrumentation.reset()
+    assert instrumentation.trace() == {"stages": {}, "counters": {}}
+
+
+def test_run_profiled(tmp_path: Path) -> None:
+    """Tests running a function with and without cProfile."""
+    def add(value_a: int, value_b: int) -> int:
+        return value_a + value_b
+
+    assert instrumentation.run_profiled(add, None, value_a=1, value_b=2) == 3
+    cprofile_file = tmp_path / "trace.prof"
+    assert instrumentation.run_profiled(add, cprofile_file, value_a=1, value_b=2) == 3
+    stats = pstats.Stats(str(cprofile_file)).stats  # type: ignore[attr-defined]
+    assert "add" in [function_name for _, _, function_name in stats]
@@ -0,0 +1,13 @@
+"""
+Tests for the main DGPC computations.
+"""
+import subprocess
+import sys
+
+
+def test_lazy_imports() -> None:
+    """Tests that the heavy packages are not imported at startup, but only once they are needed."""
+    script = "import sys, src.main, src.batch; print(' '.join(sorted(set(sys.modules) & {'investpy', 'pandas', " \
+             "'matplotlib'})))"
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
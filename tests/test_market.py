@@ -2,16 +2,98 @@
 Tests for the stock/etf/currency market queries.
 """
 import datetime
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
 
 import numpy as np
+from pandas import DataFrame, date_range, to_datetime
 
+import src.cache as cache
 import src.market as market
+from src.cache import IsinInfo
+from src.calendar import Calendar
+from src.providers import HistoryQuery, InvestpyProvider, MarketProvider
+from tests.fake_investpy import INSTRUMENTS, FakeInvestpy
 
 
 def test_etf_history() -> None:
     """Tests querying historical ETF information using investpy, based on two open market days followed by 3 market
     closing days afterwards ('dag van de arbeid' and Saturday)."""
-    dates = [datetime.date(2020, 4, 28) + datetime.timedelta(days=days) for days in range(0, 5)]
-    market_info, etf_name = market.get_data_by_isin(isin="IE00B4L5Y983", dates=tuple(dates), is_etf=True)
+    calendar = Calendar(datetime.date(2020, 4, 28), datetime.date(2020, 5, 3))
+    market_info, etf_name = market.get_data_by_isin(isin="IE00B4L5Y983", calendar=calendar, is_etf=True)
     assert etf_name == "IWDA"
     np.testing.assert_allclose(market_info, [50.58, 51.55, 50.51, 50.51, 50.51])
+
+
+def test_history_from_store(tmp_path: Path) -> None:
+    """Tests that with a persistent store only the missing date ranges are queried."""
+    queried_ranges = []
+
+    class DayProvider(MarketProvider):
+        """Provides the day of the month as price on weekdays, recording all queried date ranges."""
+        def resolve(self, isins: Sequence[Tuple[str, bool]], num_threads: int = 1) -> List[Optional[IsinInfo]]:
+            return [None for _ in isins]
+
+        def fetch(self, queries: Sequence[HistoryQuery], num_threads: int = 1) -> List[Optional[DataFrame]]:
+            histories: List[Optional[DataFrame]] = []
+            for query in queries:
+                queried_ranges.append((query.first_date, query.last_date))
+                dates = [date for date in date_range(query.first_date, query.last_date) if date.weekday() < 5]
+                histories.append(DataFrame({"Date": dates, "Close": [float(date.day) for date in dates]})
+                                 if dates else None)
+            return histories
+
+    query = HistoryQuery("stock", "TEST", "Test", "netherlands", datetime.date(2020, 4, 10), datetime.date(2020, 4, 20))
+    market.set_provider(DayProvider())
+    market.set_store(cache.MarketStore(tmp_path, max_age_hours=0))
+    try:
+        history = market.get_history(query)
+        history = market.get_history(query.with_range(datetime.date(2020, 4, 5), datetime.date(2020, 4, 20)))
+
+        # A range without any data (a weekend) is not queried again either
+        weekend_query = HistoryQuery("stock", "WEEKEND", "Weekend", "netherlands", datetime.date(2020, 4, 25),
+                                     datetime.date(2020, 4, 26))
+        for _ in range(2):
+            assert market.get_history(weekend_query) is None
+    finally:
+        market.set_store(None)
+        market.set_provider(InvestpyProvider())
+
+    assert queried_ranges == [(datetime.date(2020, 4, 10), datetime.date(2020, 4, 20)),
+                              (datetime.date(2020, 4, 5), datetime.date(2020, 4, 9)),
+                              (datetime.date(2020, 4, 25), datetime.date(2020, 4, 26))]
+    assert history is not None
+    assert list(history["Close"]) == [float(day) for day in range(5, 21) if datetime.date(2020, 4, day).weekday() < 5]
+
+
+def test_densify_histories() -> None:
+    """Tests aligning multiple histories with gaps onto the same dates."""
+    calendar = Calendar(datetime.date(2020, 4, 27), datetime.date(2020, 5, 4))
+    history_a = DataFrame({"Date": date_range("2020-04-28", "2020-04-30"), "Close": [1.0, 2.0, 3.0]})
+    history_b = DataFrame({"Date": to_datetime(["2020-05-01", "2020-04-27", "2020-05-04"]), "Close": [5.0, 4.0, 6.0]})
+
+    values = market.densify_histories([history_a, history_b], calendar)
+    np.testing.assert_equal(values, [[1, 1, 2, 3, 3, 3, 3],
+                                     [4, 4, 4, 4, 5, 5, 5]])
+    np.testing.assert_equal(market.densify_history(history_a, calendar), values[0])
+
+
+def test_prefetch(fake_investpy: FakeInvestpy) -> None:
+    """Tests querying all stocks/ETFs and currencies concurrently, after which everything is served from the cache."""
+    fake_investpy.latency_seconds = 0.1
+    calendar = Calendar(datetime.date(2020, 4, 1), datetime.date(2020, 5, 1))
+    isins = [(isin, isin.startswith("IE")) for isin in INSTRUMENTS]
+
+    start_time = time.perf_counter()
+    market.prefetch(isins, ["USD"], calendar, num_threads=8)
+    elapsed_seconds = time.perf_counter() - start_time
+    num_queries = sum(fake_investpy.queries.values())
+    assert num_queries >= 2 * len(isins) + 1
+    assert elapsed_seconds < num_queries * fake_investpy.latency_seconds
+
+    for isin, is_etf in isins:
+        values, symbol = market.get_data_by_isin(isin, calendar, is_etf=is_etf)
+        assert values is not None and values.shape == (len(calendar),)
+        assert symbol == INSTRUMENTS[isin][0]
+    assert sum(fake_investpy.queries.values()) == num_queries
@@ -0,0 +1,58 @@
+"""
+Tests for the risk and return metrics.
+"""
+import datetime
+import json
+from pathlib import Path
+
+import numpy as np
+
+from src.calendar import Calendar
+from src.metrics import compute_metrics, rolling_series, store_metrics, xirr
+
+
+def test_xirr() -> None:
+    """Tests solving the money-weighted return of multiple series at once."""
+    years = np.array([0.0, 0.5, 1.0])
+    cash_flows = np.array([[-100.0, 0, 110], [-100.0, -100, 210], [-100.0, 0, -10]])
+    rates = xirr(years, cash_flows)
+    np.testing.assert_allclose(rates[:2], [0.1, 0.0670], atol=1e-4)
+    assert np.isnan(rates[2])  # no solution if nothing is received back
+
+
+def test_compute_metrics() -> None:
+    """Tests that deposits don't count as returns, and the drawdown and Sharpe ratio against a reference."""
+    calendar = Calendar(datetime.date(2020, 1, 1), datetime.date(2020, 1, 6))
+    invested = np.array([100.0, 100, 200, 200, 200])
+    series = {"account": np.array([100.0, 110, 210, 189, 220.5]),  # +10%, +0% (deposit), -10%, +16.7%
+              "reference": np.array([100.0, 100, 200, 200, 200])}
+    metrics = compute_metrics(calendar, invested, series)
+
+    account = metrics["account"]
+    np.testing.assert_allclose(account["time_weighted_return"], 1.1 * 1.0 * 0.9 * (220.5 / 189) - 1)
+    np.testing.assert_allclose(account["max_drawdown"], 0.1)
+    assert account["money_weighted_return_annualized"] > 0
+    assert metrics["reference"]["time_weighted_return"] == 0
+    assert metrics["reference"]["max_drawdown"] == 0
+    assert account["sharpe_vs_reference"]["reference"] > 0
+
+
+def test_rolling_series() -> None:
+    """Tests the rolling return, volatility and drawdown, which are NaN before the first full window."""
+    calendar = Calendar(datetime.date(2020, 1, 1), datetime.date(2020, 1, 6))
+    invested = np.full(shape=5, fill_value=100.0)
+    rolling = rolling_series(calendar, invested, {"account": np.array([100.0, 110, 99, 99, 108.9])}, 2)
+
+    np.testing.assert_allclose(rolling["account: 2-day return"], [np.nan, np.nan, -0.01, -0.1, 0.1])
+    np.testing.assert_allclose(rolling["account: drawdown"], [0, 0, 0.1, 0.1, 0.01])
+    volatility = rolling["account: 2-day volatility"]
+    assert np.all(np.isnan(volatility[:2]))
+    np.testing.assert_allclose(volatility[4], np.std([0, 0.1], ddof=1) * np.sqrt(365.25))
+
+
+def test_store_metrics(tmp_path: Path) -> None:
+    """Tests that unavailable metrics are stored as null in the JSON file."""
+    output_file = tmp_path / "metrics.json"
+    store_metrics({"account": {"max_drawdown": 0.5, "money_weighted_return_annualized": float("nan")}}, output_file)
+    assert json.loads(output_file.read_text()) == {"account": {"max_drawdown": 0.5,
+                                                               "money_weighted_return_annualized": None}}
@@ -0,0 +1,86 @@
+"""
+Tests for storing the resulting series in the different output formats.
+"""
+import datetime
+import gzip
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import src.output as output
+from src.calendar import Calendar
+
+
+CALENDAR = Calendar(datetime.date(2020, 1, 1), datetime.date(2020, 1, 6))
+ABSOLUTE_DATA = {"total account value": np.array([100.0, 101.234, 99.5, -0.001, 120.0])}
+RELATIVE_DATA = {"account performance": np.array([1.0, 1.01234, 0.995, 0.99, 1.2])}
+
+
+def test_store_csv(tmp_path: Path) -> None:
+    """Tests the CSV output, written in multiple chunks, with the relative data in the relative columns."""
+    output_file = tmp_path / "dgpc.csv"
+    output.store(CALENDAR, ABSOLUTE_DATA, RELATIVE_DATA, output_file, chunk_size=2)
+    assert output_file.read_text().splitlines() == [
+        "date,total_account_value,account_performance",
+        "2020-01-01,100.00,1.0000",
+        "2020-01-02,101.23,1.0123",
+        "2020-01-03,99.50,0.9950",
+        "2020-01-04,0.00,0.9900",
+        "2020-01-05,120.00,1.2000",
+    ]
+
+
+def test_store_csv_gz(tmp_path: Path) -> None:
+    """Tests the gzipped CSV output, also with an upper-case extension."""
+    output_file = tmp_path / "DGPC.CSV.GZ"
+    output.store(CALENDAR, ABSOLUTE_DATA, RELATIVE_DATA, output_file)
+    with gzip.open(output_file, "rt") as file:
+        assert file.readline() == "date,total_account_value,account_performance\n"
+
+
+def test_store_npz(tmp_path: Path) -> None:
+    """Tests the NPZ output, which keeps the full precision."""
+    output_file = tmp_path / "dgpc.npz"
+    output.store(CALENDAR, ABSOLUTE_DATA, RELATIVE_DATA, output_file)
+    with np.load(output_file) as data:
+        assert list(data["names"]) == ["total_account_value", "account_performance"]
+        assert list(data["dates"]) == list(CALENDAR.days)
+        values = np.asarray(data["values"])
+    np.testing.assert_array_equal(values[:, 0], ABSOLUTE_DATA["total account value"])
+    np.testing.assert_array_equal(values[:, 1], RELATIVE_DATA["account performance"])
+
+
+@pytest.mark.parametrize("extension", [".parquet", ".arrow"])
+def test_store_arrow_formats(tmp_path: Path, extension: str) -> None:
+    """Tests the Parquet and Arrow outputs, if the optional 'pyarrow' package is available."""
+    parquet = pytest.importorskip("pyarrow.parquet")
+    ipc = pytest.importorskip("pyarrow.ipc")
+    output_file = tmp_path / f"dgpc{extension}"
+    output.store(CALENDAR, ABSOLUTE_DATA, RELATIVE_DATA, output_file, chunk_size=2)
+    if extension == ".parquet":
+        table = parquet.read_table(output_file)
+    else:
+        table = ipc.open_file(str(output_file)).read_all()
+    assert table.column_names == ["date", "total_account_value", "account_performance"]
+    assert table.column("date").to_pylist() == list(CALENDAR)
+    np.testing.assert_array_equal(table.column("account_performance").to_numpy(), RELATIVE_DATA["account performance"])
+
+
+def test_unsupported_extension() -> None:
+    """Tests selecting the output format by file extension."""
+    assert output.get_writer(Path("dgpc.CSV")) is output.store_csv
+    assert output.get_writer(Path("dgpc.csv.gz")) is output.store_csv
+    assert output.get_writer(Path("my.results.npz")) is output.store_npz
+    with pytest.raises(RuntimeError):
+        output.get_writer(Path("dgpc.xlsx"))
+
+
+def test_missing_pyarrow(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that the Parquet and Arrow formats are rejected up-front if 'pyarrow' is not installed."""
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name: None)
+    for extension in (".parquet", ".arrow", ".feather"):
+        with pytest.raises(RuntimeError, match="pyarrow"):
+            output.get_writer(Path(f"dgpc{extension}"))
+    assert output.get_writer(Path("dgpc.csv")) is output.store_csv
@@ -0,0 +1,92 @@
+"""
+Tests for reusing the parsed results of the same account file.
+"""
+import datetime
+import os
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pytest
+
+import src.degiro as degiro
+import src.instrumentation as instrumentation
+import src.main as main
+import src.market as market
+import src.parse_cache as parse_cache
+from src.providers import LocalProvider
+from tests.fake_investpy import FakeInvestpy
+
+
+def test_parse_cache(tmp_path: Path, fake_investpy: FakeInvestpy,  # pylint: disable=unused-argument
+                     account_lines: List[str], monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that a second run on the same file loads the parsed results, also for another start date, and that a
+    changed file or parser version is parsed again."""
+    # pylint: disable=too-many-locals
+    input_file = tmp_path / "Account.csv"
+    input_file.write_text("\n".join(account_lines))
+    parse_cache_dir = tmp_path / "parsed"
+    end_date = datetime.date(2017, 7, 15)
+    start_date = datetime.date(2017, 7, 12)
+
+    instrumentation.reset()
+    main.compute_account(input_file, end_date, datetime.date(2000, 1, 1), parse_cache_dir=parse_cache_dir)
+    assert len(list(parse_cache_dir.glob("*.npz"))) == 1
+    calendar, absolute_data, relative_data, positions = main.compute_account(input_file, end_date, start_date,
+                                                                             parse_cache_dir=parse_cache_dir)
+    assert instrumentation.trace()["counters"]["parse cache hits"] == 1
+    assert instrumentation.trace()["counters"]["parse cache misses"] == 1
+
+    # The loaded results equal parsing from the start date without the cache
+    expected_calendar, expected_absolute, expected_relative, expected_positions = main.compute_account(
+        input_file, end_date, start_date)
+    assert calendar == expected_calendar
+    for data, expected_data in ((absolute_data, expected_absolute), (relative_data, expected_relative)):
+        assert list(data) == list(expected_data)
+        for name, values in expected_data.items():
+            np.testing.assert_allclose(data[name], values)
+    assert positions.isins == expected_positions.isins and positions.symbols == expected_positions.symbols
+    np.testing.assert_allclose(positions.profit, expected_positions.profit)
+    np.testing.assert_allclose(positions.weight, expected_positions.weight)
+
+    # Another end date, kind of days or parser version, or changed contents, have another key
+    key = parse_cache.cache_key(input_file, end_date, business_days=False)
+    assert parse_cache.cache_key(input_file, end_date, business_days=True) != key
+    assert parse_cache.cache_key(input_file, end_date + datetime.timedelta(days=1), business_days=False) != key
+    monkeypatch.setattr(degiro, "PARSER_VERSION", degiro.PARSER_VERSION + 1)
+    assert parse_cache.cache_key(input_file, end_date, business_days=False) != key
+    changed_file = tmp_path / "Changed.csv"
+    changed_file.write_text("\n".join(account_lines[:-1]))
+    assert parse_cache.cache_key(changed_file, end_date, business_days=False) != \
+        parse_cache.cache_key(input_file, end_date, business_days=False)
+    assert parse_cache.cache_key(input_file, end_date, False, market.identity()) != \
+        parse_cache.cache_key(input_file, end_date, False, LocalProvider(tmp_path).identity())
+
+
+def test_parse_cache_skips_incomplete(tmp_path: Path, fake_investpy: FakeInvestpy,  # pylint: disable=unused-argument
+                                      account_lines: List[str]) -> None:
+    """Tests that results with missing market data or with the not yet final prices of today are not stored."""
+    parse_cache_dir = tmp_path / "parsed"
+    unknown_file = tmp_path / "Unknown.csv"
+    unknown_file.write_text("\n".join(account_lines).replace("US0079031078", "US0000000000"))
+    main.compute_account(unknown_file, datetime.date(2017, 7, 15), datetime.date(2000, 1, 1),
+                         parse_cache_dir=parse_cache_dir)
+    assert not list(parse_cache_dir.glob("*.npz"))
+
+    input_file = tmp_path / "Account.csv"
+    input_file.write_text("\n".join(account_lines))
+    main.compute_account(input_file, datetime.date.today(), datetime.date(2000, 1, 1), parse_cache_dir=parse_cache_dir)
+    assert not list(parse_cache_dir.glob("*.npz"))
+
+
+def test_prune(tmp_path: Path) -> None:
+    """Tests removing the least recently used entries, and ignoring unreadable entries."""
+    for index, name in enumerate(["a", "b", "c"]):
+        cache_file = tmp_path / f"{name}.npz"
+        cache_file.write_bytes(b"not an NPZ file")
+        os.utime(cache_file, (index, index))
+    parse_cache.prune(tmp_path, max_files=2)
+    assert sorted(path.stem for path in tmp_path.glob("*.npz")) == ["b", "c"]
+    assert parse_cache.load(tmp_path, "c") is None
+    parse_cache.purge(tmp_path)
+    assert not list(tmp_path.glob("*.npz"))
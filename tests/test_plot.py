@@ -0,0 +1,58 @@
+"""
+Tests for the plotting functionality.
+"""
+import datetime
+import gc
+import weakref
+from pathlib import Path
+
+import numpy as np
+import pytest
+from matplotlib.figure import Figure
+
+import src.plot as plot
+from src.positions import compute_positions
+from src.calendar import Calendar
+
+
+def test_downsample() -> None:
+    """Tests that downsampling keeps the minimum and maximum per bucket, including a single-day drawdown."""
+    values = np.linspace(100.0, 200.0, 1000)
+    values[333] = 10.0
+    values[777] = np.nan
+    indices = plot.downsample(values, num_buckets=50)
+    assert len(indices) <= 2 * 50
+    assert np.all(np.diff(indices) > 0)
+    assert 333 in indices and 0 in indices and 999 in indices
+    assert 777 not in indices
+
+    # Short series are not downsampled
+    np.testing.assert_array_equal(plot.downsample(values[:100], num_buckets=50), np.arange(100))
+
+
+def test_plot_repeatedly(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that plotting several charts in one process doesn't keep any of the figures alive."""
+    calendar = Calendar(datetime.date(2010, 1, 1), datetime.date(2020, 12, 14))
+    absolute_data = {"total account value": np.linspace(0, 1000, len(calendar))}
+    relative_data = {"account performance": np.linspace(1, 2, len(calendar))}
+
+    figures = []
+    original_init = Figure.__init__
+
+    def tracking_init(self, *args, **kwargs) -> None:  # type: ignore
+        original_init(self, *args, **kwargs)
+        figures.append(weakref.ref(self))
+    monkeypatch.setattr(Figure, "__init__", tracking_init)
+
+    value = np.linspace(0, 100, len(calendar))
+    positions = compute_positions([f"NL{index:010d}" for index in range(12)], [""] * 12,
+                                  np.eye(1, len(calendar)).repeat(12, axis=0), np.zeros(shape=(12, len(calendar))),
+                                  np.array([value * (index + 1) for index in range(12)]))
+
+    for index in range(3):
+        plot.plot(calendar, absolute_data, relative_data, tmp_path / f"dgpc_{index}.png", plot_size_y=360,
+                  positions=positions if index == 2 else None)
+        assert (tmp_path / f"dgpc_{index}.png").stat().st_size > 0
+    gc.collect()
+    assert len(figures) == 3
+    assert all(figure() is None for figure in figures)
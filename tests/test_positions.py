@@ -0,0 +1,27 @@
+"""
+Tests for the per-position breakdown of an account.
+"""
+import numpy as np
+
+from src.positions import compute_positions
+
+
+def test_compute_positions() -> None:
+    """Tests computing the value, profit/loss and weight of two positions, also from a later day onwards."""
+    share_deltas = np.array([[10.0, 0, 0, -5], [0, 2, 0, 0]])
+    cash_flows = np.array([[-100.0, 0, 0, 75], [0, -40, 1, 0]])  # buying, selling, and a dividend
+    prices = np.array([[10.0, 12, 14, 15], [20, 20, 25, 30]])
+    positions = compute_positions(["NL0000000001", "US0000000002"], ["AAA", ""], share_deltas, cash_flows, prices)
+
+    assert positions.labels() == ["AAA", "US0000000002"]
+    np.testing.assert_allclose(positions.shares, [[10, 10, 10, 5], [0, 2, 2, 2]])
+    np.testing.assert_allclose(positions.value, [[100, 120, 140, 75], [0, 40, 50, 60]])
+    np.testing.assert_allclose(positions.profit, [[0, 20, 40, 50], [0, 0, 11, 21]])
+    np.testing.assert_allclose(positions.weight, [[1, 0.75, 140 / 190, 75 / 135], [0, 0.25, 50 / 190, 60 / 135]])
+
+    later = positions.sliced(2)
+    np.testing.assert_allclose(later.profit, [[0, 10], [0, 10]])
+    np.testing.assert_allclose(later.value, [[140, 75], [50, 60]])
+    assert list(later.absolute_series()) == ["position AAA: value", "position AAA: profit/loss",
+                                             "position US0000000002: value", "position US0000000002: profit/loss"]
+    assert list(later.relative_series()) == ["position AAA: weight", "position US0000000002: weight"]
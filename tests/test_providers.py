@@ -0,0 +1,102 @@
+"""
+Tests for the providers of market data.
+"""
+import datetime
+from pathlib import Path
+
+import numpy as np
+import pytest
+from pandas import DataFrame
+
+import src.cache as cache
+import src.market as market
+from src.calendar import Calendar
+from src.providers import HistoryQuery, InvestpyProvider, LocalProvider
+from tests.fake_investpy import FakeInvestpy
+
+
+def write_market_data(directory: Path) -> None:
+    """Writes a small local market data directory with one ETF, one stock in USD, and the EUR/USD exchange rate."""
+    (directory / "isins.csv").write_text("isin,symbol,name,country,currency\n"
+                                         "IE00B4L5Y983,IWDA,iShares Core MSCI World UCITS,netherlands,EUR\n"
+                                         "US0079031078,AMD,Advanced Micro Devices,united states,USD\n")
+    (directory / "IWDA.csv").write_text("Date,Close\n2020-04-29,51.0\n2020-04-28,50.0\n2020-04-30,52.0\n")
+    (directory / "AMD.csv").write_text("Date,Open,Close\n2020-04-28,1.0,10.0\n2020-04-29,1.0,12.0\n")
+    (directory / "EUR_USD.csv").write_text("Date,Close\n2020-04-27,2.0\n")
+
+
+def test_local_provider(tmp_path: Path) -> None:
+    """Tests resolving ISINs and fetching histories in batches from local files, each file read only once."""
+    write_market_data(tmp_path)
+    provider = LocalProvider(tmp_path)
+    infos = provider.resolve([("IE00B4L5Y983", True), ("US5949181045", False)])
+    assert infos == [("IWDA", "iShares Core MSCI World UCITS", "netherlands", "EUR"), None]
+
+    query = HistoryQuery("etf", "IWDA", "iShares Core MSCI World UCITS", "netherlands", datetime.date(2020, 4, 29),
+                         datetime.date(2020, 5, 6))
+    unknown = HistoryQuery("stock", "MSFT", "Microsoft", "united states", query.first_date, query.last_date)
+    histories = provider.fetch([query, query.with_range(datetime.date(2020, 5, 1), datetime.date(2020, 5, 6)), unknown])
+    assert histories[0] is not None
+    assert list(histories[0]["Close"]) == [51.0, 52.0]
+    assert histories[1] is None and histories[2] is None
+
+
+def test_local_provider_in_market(tmp_path: Path) -> None:
+    """Tests the market data in EUR based on the local provider, without any queries to Investing.com."""
+    write_market_data(tmp_path)
+    calendar = Calendar(datetime.date(2020, 4, 27), datetime.date(2020, 5, 1))
+    market.set_provider(LocalProvider(tmp_path))
+    try:
+        market.prefetch([("IE00B4L5Y983", True), ("US0079031078", False)], [], calendar)
+        values, symbol = market.get_data_by_isin("US0079031078", calendar, is_etf=False)
+    finally:
+        market.set_provider(InvestpyProvider())
+    assert symbol == "AMD" and values is not None
+    np.testing.assert_allclose(values, [5.0, 5.0, 6.0, 6.0])
+
+
+def test_local_provider_after_investpy(tmp_path: Path) -> None:
+    """Tests that the local provider does not use the stored data of another provider, e.g. Investing.com before."""
+    (tmp_path / "isins.csv").write_text("isin,symbol,name,country,currency\n"
+                                        "IE00B4L5Y983,IWDA.AS,iShares Core MSCI World UCITS,netherlands,EUR\n")
+    (tmp_path / "IWDA.AS.csv").write_text("Date,Close\n2020-04-27,50.0\n2020-04-28,51.0\n")
+    calendar = Calendar(datetime.date(2020, 4, 27), datetime.date(2020, 4, 29))
+    market.set_provider(InvestpyProvider(FakeInvestpy()))
+    market.set_store(cache.MarketStore(tmp_path / "cache"))
+    try:
+        _, symbol = market.get_data_by_isin("IE00B4L5Y983", calendar, is_etf=True)
+        assert symbol == "IWDA"
+        market.set_provider(LocalProvider(tmp_path))
+        values, symbol = market.get_data_by_isin("IE00B4L5Y983", calendar, is_etf=True)
+    finally:
+        market.set_store(None)
+        market.set_provider(InvestpyProvider())
+    assert symbol == "IWDA.AS" and values is not None
+    np.testing.assert_allclose(values, [50.0, 51.0])
+
+
+def test_local_provider_missing_isins(tmp_path: Path) -> None:
+    """Tests that a local market data directory needs an ISIN information file."""
+    with pytest.raises(RuntimeError):
+        LocalProvider(tmp_path).resolve([("IE00B4L5Y983", True)])
+
+
+def test_investpy_provider_retries() -> None:
+    """Tests retrying a query after a connection error, and failing once all retries are used."""
+    class FlakyInvestpy:  # pylint: disable=too-few-public-methods
+        """Fails the given number of queries with a connection error before answering."""
+        def __init__(self, num_failures: int) -> None:
+            self.num_failures = num_failures
+
+        def search_etfs(self, by: str, value: str) -> DataFrame:  # pylint: disable=unused-argument
+            """Returns a single ETF, unless still failing."""
+            if self.num_failures > 0:
+                self.num_failures -= 1
+                raise ConnectionError("connection reset")
+            return DataFrame({"country": ["netherlands"], "symbol": ["IWDA"], "name": ["iShares"],
+                              "currency": ["EUR"]})
+
+    provider = InvestpyProvider(FlakyInvestpy(2), num_retries=2, retry_delay_seconds=0)
+    assert provider.resolve([("IE00B4L5Y983", True)]) == [("IWDA", "iShares", "netherlands", "EUR")]
+    with pytest.raises(ConnectionError):
+        InvestpyProvider(FlakyInvestpy(1), num_retries=0).resolve([("IE00B4L5Y983", True)])
@@ -0,0 +1,136 @@
+"""
+Tests for the service mode, serving charts and data of parsed accounts over HTTP.
+"""
+import asyncio
+import datetime
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+import src.main as main
+import src.serve as serve
+from src.calendar import Calendar
+from src.positions import Positions
+from tests.fake_investpy import FakeInvestpy
+
+
+def parsed_account(num_days: int) -> serve.ParsedAccount:
+    """Returns a parsed account with a single series and no positions."""
+    calendar = Calendar(datetime.date(2020, 1, 1), datetime.date(2020, 1, 1) + datetime.timedelta(days=num_days))
+    positions = Positions([], [], *[np.zeros(shape=(0, num_days))] * 5)
+    return serve.ParsedAccount(calendar, {"total account value": np.zeros(num_days)}, {}, positions, 0.0)
+
+
+def test_account_cache() -> None:
+    """Tests evicting the least recently used accounts when exceeding the number of accounts or the memory size."""
+    cache = serve.AccountCache(max_accounts=2, max_bytes=800)
+    cache.put("a", parsed_account(10))
+    cache.put("b", parsed_account(10))
+    assert cache.get("a") is not None  # 'b' is now the least recently used
+    cache.put("c", parsed_account(10))
+    assert cache.get("b") is None and cache.get("a") is not None and cache.get("c") is not None
+    assert cache.num_bytes == 160
+
+    # A large account evicts all others, but is kept itself
+    cache.put("d", parsed_account(200))
+    assert len(cache) == 1 and cache.get("d") is not None
+    assert cache.num_bytes == 1600
+
+
+def test_window_indices() -> None:
+    """Tests finding the days from a start date up to an end date, also for dates outside the calendar."""
+    calendar = Calendar(datetime.date(2020, 1, 1), datetime.date(2020, 1, 11))
+    assert serve.window_indices(calendar, datetime.date(2020, 1, 3), datetime.date(2020, 1, 6)) == (2, 5)
+    assert serve.window_indices(calendar, datetime.date(2019, 1, 1), datetime.date(2021, 1, 1)) == (0, 10)
+
+
+async def request(port: int, method: str, target: str, body: bytes = b"") -> Tuple[int, bytes]:
+    """Sends a single HTTP request to the local server, returning the status and the content of the response."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"{method} {target} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode() +
+                 body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    header, _, content = response.partition(b"\r\n\r\n")
+    return int(header.split()[1]), content
+
+
+def test_serve(tmp_path: Path, fake_investpy: FakeInvestpy, account_lines: List[str]) -> None:
+    """Tests uploading an account and serving data windows of it, parsing the account only once."""
+    defaults = {"start_date": datetime.date(2000, 1, 1), "end_date": datetime.date(2017, 7, 15),
+                "reference_isins": ["IE00B4L5Y983"], "rolling_window": 0, "png_height_pixels": 200,
+                "plot_hide_eur_values": False, "plot_positions": False}
+    service = serve.AccountService(tmp_path, serve.AccountCache(4, 2 ** 20), datetime.date(2017, 7, 15),
+                                   defaults=defaults)
+
+    async def run() -> None:
+        server = await asyncio.start_server(service.handle_connection, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            assert await request(port, "PUT", "/accounts/alice", "\n".join(account_lines).encode()) == \
+                (202, b'{"account": "alice"}')
+            assert await request(port, "GET", "/accounts") == (200, b'["alice"]')
+
+            status, content = await request(port, "GET", "/accounts/alice/data.json?start_date=12-07-2017")
+            assert status == 200
+            data = json.loads(content)
+            assert data["dates"] == ["2017-07-12", "2017-07-13", "2017-07-14"]
+            assert "IWDA:_given_investment" in data["series"]
+            assert set(data["metrics"]) == {"account", "IWDA"}
+
+            status, content = await request(port, "GET", "/accounts/alice/data.csv?end_date=13-07-2017&"
+                                                          "reference_isin=")
+            assert status == 200
+            lines = content.decode().splitlines()
+            assert lines[0].startswith("date,nominal_account_(without_profit/loss)")
+            assert [line.split(",")[0] for line in lines[1:]] == ["2017-07-11", "2017-07-12"]
+
+            status, content = await request(port, "GET", "/accounts/alice/chart.png?plot_positions=1")
+            assert status == 200 and content.startswith(b"\x89PNG")
+
+            assert (await request(port, "GET", "/accounts/bob/data.csv"))[0] == 404
+            assert (await request(port, "GET", "/accounts/alice/data.csv?start_date=2017"))[0] == 400
+            assert (await request(port, "GET", "/accounts/alice/data.csv?end_date=16-07-2017"))[0] == 400
+            assert (await request(port, "PUT", "/accounts/alice.csv", b"x"))[0] == 400
+    asyncio.run(run())
+    assert fake_investpy.queries["get_stock_historical_data"] == 1
+
+    # The windows equal the account data computed from the start date by the command-line tool
+    account = service.cache.get("alice")
+    assert account is not None
+    first_index, end_index = serve.window_indices(account.calendar, datetime.date(2017, 7, 12),
+                                                  datetime.date(2017, 7, 15))
+    _, absolute_data, relative_data, _ = main.compute_account(tmp_path / "alice.csv", datetime.date(2017, 7, 15),
+                                                              datetime.date(2017, 7, 12))
+    _, sliced_absolute, sliced_relative, _ = main.slice_account(account.calendar, account.absolute_data,
+                                                                account.relative_data, account.positions,
+                                                                first_index, end_index)
+    for name, values in absolute_data.items():
+        np.testing.assert_allclose(sliced_absolute[name], values)
+    for name, values in relative_data.items():
+        np.testing.assert_allclose(sliced_relative[name], values)
+
+
+def test_serve_later_end_date(tmp_path: Path, fake_investpy: FakeInvestpy,  # pylint: disable=unused-argument
+                              account_lines: List[str]) -> None:
+    """Tests that an account is parsed again once the end date of the service has moved on, e.g. a day later."""
+    defaults: Dict[str, Any] = {"start_date": datetime.date(2000, 1, 1), "end_date": None, "reference_isins": [],
+                                "rolling_window": 0, "png_height_pixels": 200, "plot_hide_eur_values": False,
+                                "plot_positions": False}
+    (tmp_path / "alice.csv").write_text("\n".join(account_lines))
+    service = serve.AccountService(tmp_path, serve.AccountCache(4, 2 ** 20), datetime.date(2017, 7, 14),
+                                   defaults=defaults)
+    parameters = serve.parse_query({}, defaults)
+
+    async def run() -> None:
+        data = json.loads(await service.data_json("alice", parameters))
+        assert data["dates"][-1] == "2017-07-13"
+        service.end_date = datetime.date(2017, 7, 16)
+        data = json.loads(await service.data_json("alice", parameters))
+        assert data["dates"][-1] == "2017-07-15"
+    asyncio.run(run())
+    account = service.cache.get("alice")
+    assert account is not None and account.calendar.end_date == datetime.date(2017, 7, 16)
@@ -0,0 +1,79 @@
+"""
+Tests for the what-if simulations of other references and strategies.
+"""
+import datetime
+
+import numpy as np
+
+import src.whatif as whatif
+from src.calendar import Calendar
+
+
+def test_compute_reference_invested() -> None:
+    """Tests investing cash over time in a reference, for a single and for multiple references at once."""
+    invested = np.array([100.0, 100.0, 300.0, 300.0, 200.0])
+    reference_a = np.array([10.0, 20.0, 20.0, 40.0, 50.0])
+    reference_b = np.array([10.0, 10.0, 5.0, 5.0, 10.0])
+
+    # Buys 10 shares on day 0, 10 more on day 2, and sells 2 on day 4
+    result_a = whatif.compute_reference_invested(reference_a, invested)
+    np.testing.assert_allclose(result_a, [100, 200, 400, 800, 900])
+
+    # Buys 10 shares on day 0, 40 more on day 2, and sells 10 on day 4
+    results = whatif.compute_reference_invested(np.array([reference_a, reference_b]), invested)
+    np.testing.assert_allclose(results, np.array([result_a, [100, 100, 250, 250, 400]]))
+
+
+def test_deposit_schedules() -> None:
+    """Tests investing the final invested amount at once and in monthly parts, from the first deposit onwards."""
+    calendar = Calendar(datetime.date(2020, 1, 30), datetime.date(2020, 3, 3))
+    np.testing.assert_array_equal(whatif.month_starts(calendar), [0, 2, 31])
+    invested = np.full(len(calendar), 300.0)
+    invested[0] = 0
+    invested[1:10] = 100
+
+    account, lump_sum, dca = whatif.deposit_schedules(calendar, invested)
+    np.testing.assert_allclose(account, invested)
+    np.testing.assert_allclose(lump_sum, [0] + [300] * (len(calendar) - 1))
+    np.testing.assert_allclose(dca, [0, 100] + [200] * 29 + [300] * 2)
+
+
+def test_rebalanced_values() -> None:
+    """Tests splitting a deposit 60/40 over a reference and a bond, rebalancing on day 2, for two references at once."""
+    prices = np.array([[1.0, 2.0, 2.0, 1.0], [1.0, 1.0, 1.0, 1.0]])
+    bond = np.ones(4)
+    invested = np.array([100.0, 100.0, 100.0, 100.0])
+
+    # Rebalancing into 48 shares of the reference and 64 of the bond, instead of the initial 60 and 40
+    values = whatif.rebalanced_values(prices, bond, invested, np.array([0, 2]))
+    np.testing.assert_allclose(values, [[100, 160, 160, 112], [100, 100, 100, 100]])
+
+
+def test_simulate_and_rank() -> None:
+    """Tests simulating all strategies for two references at once, and ranking them together with the account."""
+    calendar = Calendar(datetime.date(2020, 1, 1), datetime.date(2021, 1, 1))
+    num_days = len(calendar)
+    invested = np.where(np.arange(num_days) < 100, 1000.0, 2000.0)
+    references = {"GROW": np.linspace(10, 20, num_days), "FLAT": np.full(num_days, 10.0)}
+    simulation = whatif.simulate(calendar, invested, references, bond=np.full(num_days, 5.0))
+    assert simulation.values.shape == simulation.invested.shape == (8, num_days)
+    assert simulation.names()[:4] == ["GROW: given investment", "GROW: lump sum", "GROW: monthly DCA",
+                                      "FLAT: given investment"]
+    assert simulation.names()[-2:] == ["GROW: 60/40 rebalanced", "FLAT: 60/40 rebalanced"]
+
+    # The flat reference keeps the invested amount
+    np.testing.assert_allclose(simulation.values[3:6, -1], [2000, 2000, 2000])
+    np.testing.assert_allclose(simulation.invested[4], 2000)
+
+    # An account that earns 5% over the year ranks below all growing benchmarks, but above the flat ones
+    account_value = invested * np.linspace(1, 1.05, num_days)
+    ranking = whatif.rank(calendar, account_value, invested, simulation)
+    assert [row["rank"] for row in ranking] == list(range(1, 10))
+    assert ranking[0]["name"] == "GROW" and ranking[0]["strategy"] == "lump sum"
+    assert ranking[4]["strategy"] == "account"
+    assert all(row["name"] == "FLAT" for row in ranking[5:])
+    np.testing.assert_allclose(ranking[0]["money_weighted_return_annualized"], 1.0, rtol=0.01)
+    np.testing.assert_allclose(ranking[-1]["money_weighted_return_annualized"], 0.0, atol=1e-6)
+
+    series = whatif.top_series(ranking, simulation, account_value, invested, top_k=2)
+    assert list(series["absolute"]) == ["account", "GROW: lump sum", ranking[1]["name"] + ": " + ranking[1]["strategy"]]